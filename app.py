@@ -1,6 +1,41 @@
 import streamlit as st
 import pandas as pd
-import altair as alt
+
+from dataset import AREA_COL, INDUSTRY_LEVEL_DIVISION, INDUSTRY_LEVEL_SECTOR, TOTAL_CODE
+from engine import (
+    DATASET_LABELS,
+    DEFAULT_POPULATION_MIN,
+    LQ_BASIS_NATIONAL,
+    LQ_BASIS_PREF,
+    LQ_DATASETS,
+    NATIONAL_PREF,
+    PANEL_LABELS,
+    QUERY_CACHE_TTL,
+    DensityEngine,
+    Query,
+)
+from perf import NO_TIMINGS, StageTimings, log_timings, perf_logger
+from query_cache import CacheWarmer
+from views import (
+    GROWTH_KIND_LABELS,
+    LQ_MEASURE_LABELS,
+    SCATTER_BIN_THRESHOLD,
+    SCATTER_MODE_AUTO,
+    SCATTER_MODE_BINNED,
+    TABLE_RENDER_COLUMN_CONFIG,
+    TABLE_RENDER_STYLER,
+    growth_column,
+    growth_ranking,
+    make_growth_bars,
+    make_lq_bars,
+    make_pref_chart,
+    make_scatter,
+    render_lq_matrix,
+    render_growth_table,
+    render_pref_table,
+    render_table,
+    scatter_mode,
+)
 
 
 # ======================
@@ -117,270 +152,62 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-DATA_PATH = "data/base_2014_ec_2020_pop_level2.parquet"
-
-AREA_COL = "area"
-SIC_COL = "sicCode"
-TOTAL_CODE = "__TOTAL__"
-TOTAL_NAME = "総計（全産業）"
+# データセットのパス・メモリ上限・キャッシュの大きさなどは engine.py の設定を使う
+# 起動時に（都道府県, 産業）の組み合わせをバックグラウンドで先に集計しておく（初回クリックの待ちを減らす）
+WARMUP_ENABLED = True
+WARMUP_WORKERS = 2
+# None なら全国＋全都道府県 × 総計＋全産業（3部門・大分類）
+WARMUP_PREFS: list[str] | None = None
+WARMUP_SIC_CODES: list[str] | None = None
+
+# 産業の選択欄の見出し（総計から階層をたどって選ぶ。level2 は 総計 → 3部門 → 大分類）
+INDUSTRY_LEVEL_LABELS = {
+    INDUSTRY_LEVEL_SECTOR: "産業（部門）",
+    INDUSTRY_LEVEL_DIVISION: "産業（大分類）",
+}
 
 METRIC_OPTIONS = {
     "事業所密度": "est_density",
     "雇用密度": "emp_density",
 }
-
-DISPLAY_COLS = [
-    "areaName",
-    "establishments",
-    "employees",
-    "population",
-    "est_density",
-    "emp_density",
-]
-
-JP_RENAME = {
-    "areaName": "地域名",
-    "establishments": "事業所数",
-    "employees": "従業者数",
-    "population": "人口",
-    "est_density": "事業所密度（人口1万人あたり）",
-    "emp_density": "雇用密度（人口1万人あたり）",
-}
+# ランキング表の描画方法（TABLE_RENDER_STYLER で従来の pandas Styler）と1ページの行数
+TABLE_RENDER_MODE = TABLE_RENDER_COLUMN_CONFIG
+TABLE_PAGE_SIZE = 100
+# 表示件数の選択肢（TOPN_ALL は全件）。Styler のときは従来どおり 10〜200
+TOPN_ALL = 0
+TOPN_OPTIONS = [10, 20, 50, 100, 200, 500, 1000, 2000, TOPN_ALL]
+# 散布図：SCATTER_MODE_AUTO は点数が閾値を超えたらビン集計（SCATTER_MODE_POINTS で常に全点）
+SCATTER_MODE = SCATTER_MODE_AUTO
+# 段ごとの所要時間：サイドバーの「パフォーマンス」欄（URL に ?perf=1 を付けても表示）と、
+# 再実行ごとに JSON 1行を追記するログ（None なら書かない。python perf.py logs/perf.jsonl で集計）
+PERF_PANEL = False
+PERF_LOG_PATH: str | None = None
 
 
 # ======================
-# データ読み込み
+# 集計エンジン
 # ======================
-@st.cache_data(show_spinner=False)
-def load_base(path: str) -> pd.DataFrame:
-    df = pd.read_parquet(path).copy()
-    df[AREA_COL] = df[AREA_COL].astype(str).str.zfill(5)
-    # level=2: 030/2700/7330 など桁が混在するため zfill しない
-    df[SIC_COL] = df[SIC_COL].astype(str).str.strip()
-    df["pref"] = df[AREA_COL].str[:2]
-    return df
-
-
-def build_pref_maps(df: pd.DataFrame):
-    pref_name_map = (
-        df[df[AREA_COL].str.endswith("000") & (df[AREA_COL] != "00000")]
-        .drop_duplicates("pref")
-        .set_index("pref")["areaName"]
-        .to_dict()
-    )
-    pref_list = sorted(p for p in df["pref"].unique() if p != "00")
-    return pref_list, pref_name_map
-
-
-def build_sic_lists(df: pd.DataFrame):
-    sic_df = (
-        df[[SIC_COL, "sicName"]]
-        .dropna(subset=[SIC_COL, "sicName"])
-        .drop_duplicates()
-        .copy()
-    )
-    sic_df[SIC_COL] = sic_df[SIC_COL].astype(str).str.strip()
-    sic_df["sicName"] = sic_df["sicName"].astype(str).str.strip()
-
-    sic_df["__num"] = pd.to_numeric(sic_df[SIC_COL], errors="coerce")
-    sic_df = sic_df.sort_values(["__num", SIC_COL]).drop(columns="__num").reset_index(drop=True)
-
-    total_row = pd.DataFrame([{SIC_COL: TOTAL_CODE, "sicName": TOTAL_NAME}])
-    use = pd.concat([total_row, sic_df], ignore_index=True)
-
-    sic_codes = use[SIC_COL].tolist()
-    sic_map = use.set_index(SIC_COL)["sicName"].to_dict()
-    return sic_codes, sic_map, 0  # 総計をデフォルト
+# cache_data は呼び出しごとに pickle を復元した別コピーを返すため、セッション数 × 再実行ごとに
+# フレームの複製と復元コストがかかる。cache_resource でプロセス内の全セッションが同じエンジン
+# （＝同じレジストリ・集計キャッシュ）を共有し、結果は読み取り専用として扱う。
+@st.cache_resource(show_spinner=False)
+def get_engine() -> DensityEngine:
+    return DensityEngine()
 
 
-def filter_scope_base(df: pd.DataFrame, pref_code: str) -> pd.DataFrame:
+@st.cache_resource(show_spinner=False, ttl=QUERY_CACHE_TTL)
+def start_warmup(dataset_key: str) -> CacheWarmer:
     """
-    データフィルタリング：
-    1. 全国(00000)除外
-    2. 人口ゼロ除外
-    3. 県全体の集計行(XX000)を除外
-    4. 政令指定都市の重複除外（「市全体」と「区」が両方ある場合、「市全体」を除外）
+    データセットごとに1回（キャッシュの有効期限が切れたら再度）ウォームアップを開始する。
     """
-    d = df.copy()
-
-    # 全国(00000)除外
-    d = d[d[AREA_COL] != "00000"]
-    # 人口ゼロ除外
-    d = d[d["population"] > 0]
-    # 県集計(XX000)を除外
-    d = d[~d[AREA_COL].str.endswith("000")]
-
-    if pref_code != "00":
-        d = d[d[AREA_COL].str.startswith(pref_code)].copy()
-
-    # ---------------------------
-    # 重複除外ロジック (Double Counting Fix - Strict)
-    # ---------------------------
-    # 政令指定都市などは「市全体(XXXX0)」と「区(XXXX1~)」の両方が入っている場合がある。
-    # 区が存在するなら市全体は除外する。
-    # XXXX0 というコードだけでなく、XXXX0 のような「親」コード全般をチェック。
-    # ロジック：「末尾が0」かつ「政令指定都市のパターン（3桁目が1）」かつ「自分を除いた前方一致（4桁）するコードが存在する」なら除外。
-    # 市部（Mobara 12210 等）は3桁目が2なので除外されないようにする。
-    
-    all_codes = set(d[AREA_COL].unique())
-    remove_codes = set()
-    
-    for code in all_codes:
-        # 末尾が0で、かつ県全体(000)ではない
-        # かつ、政令指定都市（xx1xxのパターン、例14100）であること。
-        # 通常の市（xx2xx、例12210）は除外しない。
-        if code.endswith("0") and not code.endswith("000"):
-            # 3桁目が '1' かどうかチェック (index 2)
-            # コードは string, 5桁保証 (zfill済み)
-            is_designated = (len(code) == 5 and code[2] == '1')
-            
-            if is_designated:
-                # プレフィックス (先頭4桁)
-                prefix = code[:-1] 
-                
-                # 同じプレフィックスを持つ他のコードが存在するか？
-                has_children = d[
-                    (d[AREA_COL].str.startswith(prefix)) & 
-                    (d[AREA_COL] != code)
-                ].shape[0] > 0
-                
-                if has_children:
-                    remove_codes.add(code)
-    
-    if remove_codes:
-        d = d[~d[AREA_COL].isin(remove_codes)]
-
-    return d
-
-
-def apply_industry(d: pd.DataFrame, sic_code: str) -> pd.DataFrame:
-    """
-    産業を適用。総計なら市区町村×年次で合算。
-    """
-    if sic_code == TOTAL_CODE:
-        # 人口は合算せず、代表値（max/first）をとる
-        # 従業者・事業所は合算
-        out = (
-            d.groupby([AREA_COL, "areaName", "@time"], as_index=False)
-            .agg({
-                "establishments": "sum",
-                "employees": "sum",
-                "population": "max" # 同じ地域なら人口は同じはずなのでmaxでよい
-            })
-        )
-        out["sicName"] = TOTAL_NAME
-        out[SIC_COL] = TOTAL_CODE
-        out["est_density"] = out["establishments"] / out["population"] * 10000
-        out["emp_density"] = out["employees"] / out["population"] * 10000
-        return out
-
-    return d[d[SIC_COL] == str(sic_code)].copy()
-
-
-def compute_weighted_avg(d: pd.DataFrame) -> dict:
-    """
-    人口加重平均（=県全体を1つの自治体としてみなした密度）
-    """
-    pop_sum = float(pd.to_numeric(d["population"], errors="coerce").sum())
-    est_sum = float(pd.to_numeric(d["establishments"], errors="coerce").sum())
-    emp_sum = float(pd.to_numeric(d["employees"], errors="coerce").sum())
-
-    if pop_sum <= 0:
-        return {"pop_sum": 0.0, "est_avg": None, "emp_avg": None}
-
-    est_avg = est_sum / pop_sum * 10000
-    emp_avg = emp_sum / pop_sum * 10000
-    return {"pop_sum": pop_sum, "est_avg": est_avg, "emp_avg": emp_avg}
-
-
-def add_deviation_cols(d: pd.DataFrame, est_avg: float | None, emp_avg: float | None) -> pd.DataFrame:
-    out = d.copy()
-    out["est_dev"] = out["est_density"] - est_avg if est_avg is not None else None
-    out["emp_dev"] = out["emp_density"] - emp_avg if emp_avg is not None else None
-    return out
-
-
-def format_table(df: pd.DataFrame):
-    view = df.loc[:, DISPLAY_COLS + ["est_dev", "emp_dev"]].rename(columns=JP_RENAME).copy()
-
-    # 見出しを短縮（2行で収まりよく）
-    view = view.rename(
-        columns={
-            "事業所数": "事業所",
-            "従業者数": "従業者",
-            "事業所密度（人口1万人あたり）": "事業所\n密度",
-            "雇用密度（人口1万人あたり）": "雇用\n密度",
-            "est_dev": "事業所\n(県差)",
-            "emp_dev": "雇用\n(県差)",
-        }
-    )
-
-    # 念のため数値化
-    for c in ["事業所", "従業者", "人口"]:
-        if c in view.columns:
-            view[c] = pd.to_numeric(view[c], errors="coerce")
-
-    return view.style.format(
-        {
-            "事業所": "{:,.0f}",
-            "従業者": "{:,.0f}",
-            "人口": "{:,.0f}",
-            "事業所\n密度": "{:,.0f}",
-            "雇用\n密度": "{:,.0f}",
-            "事業所\n(県差)": "{:+,.0f}",
-            "雇用\n(県差)": "{:+,.0f}",
-        },
-        na_rep="—",
-    )
-
-
-def make_scatter(d: pd.DataFrame, est_avg: float | None, emp_avg: float | None):
-    base = alt.Chart(d).encode(
-        x=alt.X("est_density:Q", title="事業所密度（人口1万人あたり）"),
-        y=alt.Y("emp_density:Q", title="雇用密度（人口1万人あたり）"),
-        size=alt.Size("population:Q", title="人口"),
-        tooltip=[
-            alt.Tooltip("areaName:N", title="地域名"),
-            alt.Tooltip("population:Q", title="人口", format=",.0f"),
-            alt.Tooltip("est_density:Q", title="事業所密度", format=",.0f"),
-            alt.Tooltip("emp_density:Q", title="雇用密度", format=",.0f"),
-            alt.Tooltip("est_dev:Q", title="事業所密度(県差)", format="+,.0f"),
-            alt.Tooltip("emp_dev:Q", title="雇用密度(県差)", format="+,.0f"),
-        ],
-    )
-
-    points = base.mark_circle(size=80, opacity=0.7).encode(
-        color=alt.value("#3182ce"),  # Modern Blue
-        stroke=alt.value("white"),
-        strokeWidth=alt.value(1)
+    return get_engine().warmup(
+        dataset_key,
+        pref_codes=WARMUP_PREFS,
+        sic_codes=WARMUP_SIC_CODES,
+        population_min=DEFAULT_POPULATION_MIN,
+        max_workers=WARMUP_WORKERS,
     )
 
-    layers = [points]
-
-    # 県平均ライン（ある場合のみ）
-    if est_avg is not None:
-        vline = alt.Chart(pd.DataFrame({"x": [est_avg]})).mark_rule(
-            strokeDash=[4, 4], 
-            color="#e53e3e",  # Red for average
-            strokeWidth=2
-        ).encode(x="x:Q")
-        layers.append(vline)
-
-    if emp_avg is not None:
-        hline = alt.Chart(pd.DataFrame({"y": [emp_avg]})).mark_rule(
-            strokeDash=[4, 4], 
-            color="#e53e3e",
-            strokeWidth=2
-        ).encode(y="y:Q")
-        layers.append(hline)
-
-    chart = alt.layer(*layers).properties(height=550).configure_view(
-        strokeWidth=0
-    ).configure_axis(
-        titleFontWeight="bold"
-    ).interactive()
-    return chart
-
 
 # ======================
 # UI
@@ -393,26 +220,47 @@ st.markdown(f"""
 <p style='color: #718096; margin-top: 0;'>{CAPTION}</p>
 """, unsafe_allow_html=True)
 
-base = load_base(DATA_PATH)
+st.sidebar.header("表示条件")
 
-pref_list, pref_name_map = build_pref_maps(base)
-sic_codes, sic_map, default_sic_index = build_sic_lists(base)
+engine = get_engine()
 
-st.sidebar.header("表示条件")
+perf_panel = PERF_PANEL or st.query_params.get("perf") == "1"
+# どちらも使わないときは計測しない（stage() は何もしない共有のコンテキストを返す）
+timings = StageTimings() if perf_panel or PERF_LOG_PATH else NO_TIMINGS
+
+dataset_key = st.sidebar.selectbox(
+    "データセット",
+    options=engine.datasets,
+    format_func=lambda k: DATASET_LABELS.get(k, k),
+)
+
+engine.dataset(dataset_key, timings)
+options = engine.options(dataset_key, timings)
 
 pref_code = st.sidebar.selectbox(
     "都道府県",
-    options=["00"] + pref_list,
-    format_func=lambda p: "全国" if p == "00" else f"{p}：{pref_name_map.get(p, '')}",
+    options=options.pref_codes,
+    format_func=lambda p: "全国" if p == NATIONAL_PREF else f"{p}：{options.pref_names.get(p, '')}",
 )
 
-sic_code = st.sidebar.selectbox(
-    "産業（大分類）",
-    options=sic_codes,
-    index=default_sic_index,
-    # 番号は表示しない（名称だけ）
-    format_func=lambda c: sic_map.get(c, ""),
-)
+# 産業：子を持つ産業を選ぶたびに、その内訳の選択欄を1つ下に出す（先頭は「総計」／「（すべて）」）
+industries = options.industries
+sic_code = TOTAL_CODE
+depth = 0
+while industries.children.get(sic_code):
+    children = industries.children[sic_code]
+    parent = sic_code
+    choice = st.sidebar.selectbox(
+        INDUSTRY_LEVEL_LABELS[industries.level[children[0]]] if depth == 0 else f"{industries.names[parent]} の内訳",
+        options=[parent, *children],
+        # 番号は表示しない（名称だけ）
+        format_func=lambda c, parent=parent: "（すべて）" if c == parent != TOTAL_CODE else industries.names.get(c, ""),
+        key=f"sic_{dataset_key}_{depth}",
+    )
+    if choice == parent:
+        break
+    sic_code = choice
+    depth += 1
 
 metric_label = st.sidebar.radio("指標", list(METRIC_OPTIONS.keys()))
 metric_col = METRIC_OPTIONS[metric_label]
@@ -420,89 +268,259 @@ metric_col = METRIC_OPTIONS[metric_label]
 # use_dev_sort = st.sidebar.checkbox("ランキングを『県平均との差』で並べ替える", value=True)
 # ↑ 削除し、デフォルトの指標順（降順）にする
 
-population_min = st.sidebar.slider("人口下限（ノイズ抑制）", 0, 20000, 5000, step=500)
-topn = st.sidebar.slider("表示件数（ランキング）", 10, 200, 50)
-
-# 1) スコープ（全国/県）→ 市区町村
-scope_df = filter_scope_base(base, pref_code=pref_code)
-
-# 2) 産業適用（総計なら合算）
-d_all = apply_industry(scope_df, sic_code=sic_code)
-
-# 3) ノイズ抑制（人口下限）
-d = d_all[d_all["population"] >= population_min].copy()
+population_min = st.sidebar.slider("人口下限（ノイズ抑制）", 0, 20000, DEFAULT_POPULATION_MIN, step=500)
+if TABLE_RENDER_MODE == TABLE_RENDER_STYLER:
+    topn = st.sidebar.slider("表示件数（ランキング）", 10, 200, 50)
+else:
+    topn = st.sidebar.select_slider(
+        "表示件数（ランキング）",
+        options=TOPN_OPTIONS,
+        value=50,
+        format_func=lambda n: "全件" if n == TOPN_ALL else f"{n:,}",
+    )
 
-# 4) 県平均（人口加重）→ 県平均との差
-# Calculate averages on the full dataset (d_all) for accurate Reference metrics, 
-# OR keep it based on filtered 'd'?
-# Usually, reference average should include everything (so d_all), 
-# but the current logic was using `d`.
-# BUT user wants "Total Population" to be Japan Total (126M).
-# That sum comes from `avg['pop_sum']`. 
-# So we need to calculate `avg` from `d_all` OR verify where `avg` comes from.
-# Currently: `avg = compute_weighted_avg(d)` -> d is filtered.
-# FIX: Use `d_all` for calculating the Total Population metric and averages.
-avg = compute_weighted_avg(d_all) 
-est_avg = avg["est_avg"]
-emp_avg = avg["emp_avg"]
+if WARMUP_ENABLED:
+    # バックグラウンドで集計を進める（この画面の描画は待たない）。進捗は再実行のたびに更新される
+    warmer = start_warmup(dataset_key)
+    if warmer.running:
+        st.sidebar.progress(
+            warmer.done / warmer.total,
+            text=f"集計を準備中 {warmer.done:,}/{warmer.total:,}（{warmer.elapsed:.1f} 秒）",
+        )
+    else:
+        st.sidebar.caption(f"集計準備済み {warmer.total:,} 件（{warmer.elapsed:.1f} 秒）")
 
-d = add_deviation_cols(d, est_avg=est_avg, emp_avg=emp_avg)
+# 指標（ラジオ）や表示件数を変えただけなら、集計はキャッシュから返る
+query = Query(dataset_key, pref_code, sic_code, population_min)
+result = engine.run(query, timings)
+d = result.d
+avg = result.avg
+est_avg = avg.est_avg
+emp_avg = avg.emp_avg
 
 # ヘッダ：いま見ているスコープ
-scope_name = "全国" if pref_code == "00" else pref_name_map.get(pref_code, pref_code)
-sic_name = sic_map.get(sic_code, "")
+scope_name = options.pref_label(pref_code)
+sic_name = " › ".join(industries.names[c] for c in industries.path(sic_code)) or industries.names[TOTAL_CODE]
 
 st.markdown(f"#### スコープ：**{scope_name}**　｜　産業：**{sic_name}**　｜　人口下限：**{population_min:,} 人**")
 
 # 県平均の表示（カード）
 c1, c2, c3 = st.columns(3)
 with c1:
-    st.metric("対象人口（合計）", f"{avg['pop_sum']:,.0f}")
+    st.metric("対象人口（合計）", f"{avg.pop_sum:,.0f}")
 with c2:
     st.metric("県平均 事業所密度", "—" if est_avg is None else f"{est_avg:,.0f}")
 with c3:
     st.metric("県平均 雇用密度", "—" if emp_avg is None else f"{emp_avg:,.0f}")
 
 
-tab1, tab2 = st.tabs(["ランキング", "散布図（県平均ライン）"])
+# on_change="rerun" で選択中のタブだけを実行する（表・グラフは開いているタブの分だけ作る）
+tab1, tab2, tab3, tab4, tab5 = st.tabs(
+    ["ランキング", "散布図（県平均ライン）", "産業特化（特化係数）", "都道府県比較", "時系列（増減）"],
+    key="view_tab",
+    on_change="rerun",
+)
 
 # ======================
 # ① ランキング
 # ======================
-with tab1:
-    st.subheader(f"ランキング（{scope_name}）")
-
-    # デフォルトソート: 指標（密度）の降順のみ
-    sort_col = metric_col
-    
-    rank = (
-        d.sort_values(sort_col, ascending=False)
-        .head(topn)
-        .reset_index(drop=True)
-    )
-    rank.insert(0, "順位", rank.index + 1)
-
-    st.dataframe(
-        format_table(rank),
-        use_container_width=True,
-        hide_index=True,
-        height=600,  # Fixed height for single page view
-        column_config={
-            "地域名": st.column_config.TextColumn(width="medium"),
-            "事業所": st.column_config.NumberColumn(width="small"),
-            "従業者": st.column_config.NumberColumn(width="small"),
-            "人口": st.column_config.NumberColumn(width="small"),
-            # 密度の列も一応small指定でコンパクトに
-        }
-    )
+if tab1.open:
+    with tab1:
+        st.subheader(f"ランキング（{scope_name}）")
+
+        # デフォルトソート: 指標（密度）の降順のみ（並びは集計時に計算済み）
+        n_rows = len(result.order[metric_col])
+        if topn != TOPN_ALL:
+            n_rows = min(n_rows, topn)
+
+        # 1ページ分の行だけを送る
+        start, stop = 0, n_rows
+        if TABLE_RENDER_MODE != TABLE_RENDER_STYLER and n_rows > TABLE_PAGE_SIZE:
+            n_pages = -(-n_rows // TABLE_PAGE_SIZE)
+            page = st.number_input(
+                f"ページ（全 {n_pages} ページ・{n_rows:,} 件）",
+                min_value=1,
+                max_value=n_pages,
+                value=1,
+            )
+            start = (page - 1) * TABLE_PAGE_SIZE
+            stop = min(start + TABLE_PAGE_SIZE, n_rows)
+
+        with timings.stage("table"):
+            render_table(result.table(metric_col, start, stop), mode=TABLE_RENDER_MODE)
 
 # ======================
 # ② 散布図（県平均ライン）
 # ======================
-with tab2:
-    st.subheader("事業所密度 × 雇用密度（県平均ライン付き）")
-    st.caption("破線：県平均（人口加重平均）｜ 点サイズ：人口（人口下限後）")
+if tab2.open:
+    with tab2:
+        st.subheader("事業所密度 × 雇用密度（県平均ライン付き）")
+        scatter_df = d.dropna(subset=["est_density", "emp_density", "population"])
+        if scatter_mode(len(scatter_df), SCATTER_MODE) == SCATTER_MODE_BINNED:
+            st.caption(
+                f"破線：県平均（人口加重平均）｜ {len(scatter_df):,} 地域（{SCATTER_BIN_THRESHOLD:,} 超）のため"
+                "密度帯ごとに集計 ｜ 色：地域数 ｜ 点：集計範囲外の地域（点サイズ：人口）"
+            )
+        else:
+            st.caption("破線：県平均（人口加重平均）｜ 点サイズ：人口（人口下限後）")
+
+        with timings.stage("chart"):
+            chart = make_scatter(scatter_df, est_avg=est_avg, emp_avg=emp_avg, mode=SCATTER_MODE)
+            st.altair_chart(chart, width="stretch")
 
-    scatter_df = d.dropna(subset=["est_density", "emp_density", "population"])
-    chart = make_scatter(scatter_df, est_avg=est_avg, emp_avg=emp_avg)
-    st.altair_chart(chart, use_container_width=True)
+# ======================
+# ③ 産業特化（特化係数）
+# ======================
+if tab3.open:
+    with tab3:
+        st.subheader(f"産業特化（{scope_name}）")
+        if dataset_key not in LQ_DATASETS:
+            st.info("特化係数は産業大分類のデータセット（2014年 経済センサス・産業大分類）でのみ表示できます。")
+        else:
+            matrix = engine.industry_matrix(dataset_key, timings)
+            c1, c2 = st.columns(2)
+            with c1:
+                lq_measure = st.radio(
+                    "対象", list(LQ_MEASURE_LABELS), format_func=LQ_MEASURE_LABELS.get, horizontal=True
+                )
+            with c2:
+                lq_basis = st.radio(
+                    "比較の基準",
+                    [LQ_BASIS_NATIONAL, LQ_BASIS_PREF],
+                    format_func=lambda b: "全国の産業構成" if b == LQ_BASIS_NATIONAL else "所属する都道府県の産業構成",
+                    horizontal=True,
+                )
+            st.caption("特化係数 = 地域の産業構成比 ÷ 基準の産業構成比（1 超でその産業に特化）｜ 特化度 = 構成比の差の絶対値の合計 ÷ 2")
+
+            with timings.stage("lq"):
+                # 地域はランキング（いまの指標の降順）の順に並べる
+                areas = d[AREA_COL].astype(str).to_numpy()[result.order[metric_col]]
+                areas = [a for a in areas if a in matrix.row_of]
+                if areas:
+                    area_code = st.selectbox(
+                        "地域",
+                        options=areas,
+                        format_func=lambda a: matrix.area_names[matrix.row_of[a]],
+                    )
+                    profile = matrix.profile(area_code, lq_measure, lq_basis)
+                    st.altair_chart(make_lq_bars(profile, lq_measure), width="stretch")
+
+                st.markdown("##### 地域 × 産業の特化係数（人口下限後）")
+                rows = matrix.rows_in(pref_code, population_min)
+                render_lq_matrix(matrix.lq_frame(rows, lq_measure, lq_basis), matrix.sic_names)
+
+# ======================
+# ④ 都道府県比較
+# ======================
+if tab4.open:
+    with tab4:
+        st.subheader(f"都道府県比較（{sic_name}）")
+        comparison = engine.pref_comparison(query, timings)
+        st.caption(
+            "棒：都道府県の加重平均（人口下限前）｜ 線・点：市区町村の密度の25%点〜75%点・中央値（人口下限後）"
+            " ｜ 破線：全国の加重平均"
+        )
+        national = comparison.national
+        with timings.stage("compare_view"):
+            st.altair_chart(
+                make_pref_chart(
+                    comparison.table,
+                    metric_col,
+                    metric_label,
+                    national.est_avg if metric_col == "est_density" else national.emp_avg,
+                    selected=pref_code,
+                ),
+                width="stretch",
+            )
+            render_pref_table(comparison.table, metric_col, metric_label)
+
+# ======================
+# ⑤ 時系列（増減）
+# ======================
+if tab5.open:
+    with tab5:
+        st.subheader(f"時系列の増減（{scope_name}）")
+        panel_keys = engine.panels_for(dataset_key)
+        if not panel_keys:
+            st.info("年次をまたいだ比較は " + "、".join(PANEL_LABELS.values()) + " のデータセットでのみ表示できます。")
+        else:
+            panel = engine.panel(panel_keys[0], timings)
+            panel_sic = panel.code_of.get((dataset_key, sic_code))
+            if panel_sic is None:
+                st.info(f"{sic_name} は年次をまたいで対応する産業がありません。")
+            else:
+                c1, c2, c3 = st.columns(3)
+                with c1:
+                    start, end = st.select_slider(
+                        "期間",
+                        options=list(panel.periods),
+                        value=(panel.periods[0], panel.periods[-1]),
+                        format_func=lambda p: f"{p}年",
+                    )
+                with c2:
+                    growth_measure = st.radio(
+                        "対象", list(LQ_MEASURE_LABELS), format_func=LQ_MEASURE_LABELS.get, horizontal=True,
+                        key="growth_measure",
+                    )
+                with c3:
+                    growth_kind = st.selectbox("並べ替え", list(GROWTH_KIND_LABELS), format_func=GROWTH_KIND_LABELS.get)
+                st.caption(
+                    f"{PANEL_LABELS[panel_keys[0]]} ｜ 対全国比 = 地域の増減率を全国の増減率で割り引いたもの"
+                    "（年次で集計の基準が違っても比べられる）｜ 人口下限は終点の人口 ｜ "
+                    "市区町村コードの変わった（合併した）地域は一方の年次にしかないため末尾"
+                )
+
+                if start == end:
+                    st.info("期間の起点と終点に別の年次を選んでください。")
+                else:
+                    with timings.stage("panel_view"):
+                        sort_col = growth_column(growth_measure, growth_kind)
+                        ranking = growth_ranking(
+                            panel.changes(panel_sic, start, end, pref_code, population_min), sort_col
+                        )
+                        measure_label = LQ_MEASURE_LABELS[growth_measure]
+                        title = f"{measure_label}の{GROWTH_KIND_LABELS[growth_kind]}（{start}→{end}年）"
+                        if ranking[sort_col].notna().any():
+                            st.altair_chart(make_growth_bars(ranking, sort_col, title), width="stretch")
+                        else:
+                            st.info(f"{measure_label}は {start}年 のデータがないため増減を計算できません。")
+                        render_growth_table(ranking, growth_measure, measure_label, start, end)
+
+# ======================
+# パフォーマンス（段ごとの所要時間）
+# ======================
+if timings.enabled:
+    timings.context.update(
+        dataset=dataset_key,
+        pref=pref_code,
+        sic=sic_code,
+        population_min=population_min,
+        metric=metric_col,
+    )
+    if PERF_LOG_PATH:
+        log_timings(timings, perf_logger(PERF_LOG_PATH))
+
+if perf_panel:
+    with st.sidebar.expander("パフォーマンス", expanded=True):
+        st.caption(f"この再実行：{timings.total_ms:,.1f} ms")
+        st.dataframe(
+            pd.DataFrame({
+                "段": list(timings.stages),
+                "ms": [round(v, 2) for v in timings.stages.values()],
+                "キャッシュ": [
+                    {True: "ヒット", False: "ミス"}.get(timings.cache_hits.get(k), "")
+                    for k in timings.stages
+                ],
+            }),
+            hide_index=True,
+            width="stretch",
+        )
+        stats = engine.cache_stats()
+        st.caption(
+            "ヒット率 "
+            + " ｜ ".join(f"{k} {s['hit_rate']:.0%}（{s['size']:,}件）" for k, s in stats.items())
+        )
+        st.caption(
+            f"読み込み済みデータ＋集計キャッシュ {engine.memory_usage / 1e6:,.1f} MB"
+            f"（{', '.join(engine.registry.resident())}）"
+        )
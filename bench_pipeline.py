@@ -0,0 +1,278 @@
+"""
+集計パイプラインの段ごとのベンチマーク。結果を JSON に書き出し、コミット間で比べられるようにする。
+
+    python bench_pipeline.py                       # 全データセット × 48 スコープ × 全産業
+    python bench_pipeline.py --datasets 2014_level2 --prefs 00 13 --sics 3
+    python bench_pipeline.py --compare benchmarks/pipeline-<old>.json
+
+段ごとに p50 / p95 / max（ms）と、tracemalloc で測ったピークメモリ（MB）を記録する。
+engine_load / engine_ranking はアプリと同じ DensityEngine の経路（分割データがあればそのカタログと
+産業ごとのファイル）を、キャッシュが空の状態から測る。
+時間の計測とメモリの計測は別々に呼ぶ（tracemalloc の負荷を時間に含めない）。
+全件（3 データセット・約 2,300 組み合わせ）は30分ほどかかる。大半は散布図の spec 生成。
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import resource
+import subprocess
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from bench_render import chart_bytes
+from dataset import build_area_hierarchy, load_dataset, read_base
+from engine import (
+    COMPACT_DTYPES,
+    DATASET_PATHS,
+    DEFAULT_POPULATION_MIN,
+    NATIONAL_PREF,
+    DensityEngine,
+    Query,
+    add_deviation_cols,
+    apply_industry,
+    build_industry_ranking,
+    build_pref_maps,
+    build_sic_lists,
+    compute_weighted_avg,
+    filter_scope_base,
+    query_result,
+    query_scope,
+)
+from views import TABLE_RENDER_COLUMN_CONFIG, make_scatter, table_payload
+
+STAGES = [
+    "load",  # parquet 全件の読み込み・正規化・AreaHierarchy（データセットごと）
+    "engine_load",  # 空の DensityEngine でのデータセットの読み込み（load_dataset）＋選択肢（データセットごと）
+    "engine_ranking",  # キャッシュを空にした DensityEngine.run（全国）：build_industry_ranking ＋ 表の準備（産業ごと）
+    "scope_filter",  # filter_scope_base
+    "industry_apply",  # apply_industry
+    "weighted_avg",  # compute_weighted_avg
+    "deviation",  # 人口下限 ＋ add_deviation_cols
+    "ranking",  # 産業ごとの並び（キャッシュ済み）からの query_scope ＋ query_result ＋ 上位 N 件
+    "table_format",  # st.dataframe に渡す表（column_config モード）
+    "chart_spec",  # 散布図の Altair → Vega-Lite spec（Streamlit と同じ変換）
+]
+LOAD_REPEAT = 3
+TOPN = 50
+METRIC = "est_density"
+OUTPUT_DIR = "benchmarks"
+
+
+class StageTimer:
+    """
+    段ごとの所要時間（秒）とピークメモリ（バイト）を貯める。
+    """
+
+    def __init__(self, trace_memory: bool = True):
+        self.trace_memory = trace_memory
+        self.seconds: dict[str, list[float]] = {s: [] for s in STAGES}
+        self.peak: dict[str, int] = {s: 0 for s in STAGES}
+
+    def run(self, stage: str, fn):
+        t0 = time.perf_counter()
+        out = fn()
+        self.seconds[stage].append(time.perf_counter() - t0)
+
+        if self.trace_memory:
+            tracemalloc.start()
+            fn()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            self.peak[stage] = max(self.peak[stage], peak)
+        return out
+
+    def summary(self) -> dict[str, dict]:
+        out = {}
+        for stage in STAGES:
+            ms = np.asarray(self.seconds[stage]) * 1000
+            if len(ms) == 0:
+                continue
+            out[stage] = {
+                "n": int(len(ms)),
+                "p50_ms": round(float(np.percentile(ms, 50)), 3),
+                "p95_ms": round(float(np.percentile(ms, 95)), 3),
+                "max_ms": round(float(ms.max()), 3),
+                "total_ms": round(float(ms.sum()), 1),
+                "peak_mb": round(self.peak[stage] / 1e6, 3) if self.trace_memory else None,
+            }
+        return out
+
+
+def _load(path: str):
+    base = read_base(path, compact=COMPACT_DTYPES)
+    return base, build_area_hierarchy(base)
+
+
+def _engine_load(key: str, path: str):
+    # アプリの最初の表示と同じく、空のレジストリから読んで選択肢を作る
+    engine = DensityEngine(paths={key: path}, compact=COMPACT_DTYPES)
+    engine.options(key)
+    return engine
+
+
+def _engine_ranking(engine: DensityEngine, query: Query):
+    # 産業ごとの並びから作り直す（tracemalloc の2回目の呼び出しもキャッシュに当たらないよう、毎回空にする）
+    caches = engine.caches(query.dataset)
+    for cache in (caches.ranking, caches.scope, caches.result):
+        cache.clear()
+    return engine.run(query)
+
+
+def bench_dataset(
+    key: str,
+    timer: StageTimer,
+    prefs: list[str] | None = None,
+    n_sics: int | None = None,
+    population_min: int = DEFAULT_POPULATION_MIN,
+) -> dict:
+    path = DATASET_PATHS[key]
+    for _ in range(LOAD_REPEAT):
+        # 分割データの有無にかかわらず、全件を読む経路を測る
+        base, hierarchy = timer.run("load", lambda: _load(path))
+        engine = timer.run("engine_load", lambda: _engine_load(key, path))
+    data = load_dataset(path, compact=COMPACT_DTYPES)
+
+    pref_list, _ = build_pref_maps(hierarchy)
+    sic_codes, _, _ = build_sic_lists(base)
+    prefs = prefs or [NATIONAL_PREF] + pref_list
+    sic_codes = sic_codes[:n_sics] if n_sics else sic_codes
+
+    for sic in sic_codes:
+        timer.run("engine_ranking", lambda: _engine_ranking(engine, Query(key, NATIONAL_PREF, sic, population_min)))
+        # 以下の段では、産業ごとの並びはアプリと同じく1回だけ作ったものを使う
+        ranking = build_industry_ranking(data, sic)
+        for pref in prefs:
+            scope_df = timer.run("scope_filter", lambda: filter_scope_base(base, pref, hierarchy))
+            d_all = timer.run("industry_apply", lambda: apply_industry(scope_df, sic))
+            avg = timer.run("weighted_avg", lambda: compute_weighted_avg(d_all))
+            d = timer.run(
+                "deviation",
+                lambda: add_deviation_cols(
+                    d_all[d_all["population"] >= population_min], avg.est_avg, avg.emp_avg
+                ),
+            )
+
+            query = Query(key, pref, sic, population_min)
+            rank = timer.run(
+                "ranking",
+                lambda: query_result(query, query_scope(ranking, pref)).table(METRIC, 0, TOPN),
+            )
+            timer.run("table_format", lambda: table_payload(rank, TABLE_RENDER_COLUMN_CONFIG))
+            timer.run(
+                "chart_spec",
+                lambda: chart_bytes(make_scatter(d, avg.est_avg, avg.emp_avg)),
+            )
+
+    return {
+        "path": path,
+        "rows": int(len(base)),
+        "prefs": len(prefs),
+        "sic_codes": len(sic_codes),
+        "combinations": len(prefs) * len(sic_codes),
+    }
+
+
+def git_commit() -> str | None:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        )
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_summary(summary: dict[str, dict], title: str):
+    print(f"\n{title}")
+    print(f"  {'stage':<16} {'n':>6} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9} {'peak MB':>9}")
+    for stage, s in summary.items():
+        peak = "-" if s["peak_mb"] is None else f"{s['peak_mb']:.2f}"
+        print(
+            f"  {stage:<16} {s['n']:>6,} {s['p50_ms']:>9.2f} {s['p95_ms']:>9.2f}"
+            f" {s['max_ms']:>9.2f} {peak:>9}"
+        )
+
+
+def compare(old_path: str, new: dict):
+    """
+    2つの結果の p50 / p95 を段ごとに比べる（new / old）。
+    """
+    with open(old_path, encoding="utf-8") as f:
+        old = json.load(f)
+    print(f"\ncompare: {old['meta'].get('commit')} -> {new['meta'].get('commit')}")
+    for key, result in new["datasets"].items():
+        if key not in old["datasets"]:
+            continue
+        print(f"  {key}")
+        for stage, s in result["stages"].items():
+            o = old["datasets"][key]["stages"].get(stage)
+            if not o:
+                continue
+            r50 = s["p50_ms"] / o["p50_ms"] if o["p50_ms"] else float("nan")
+            r95 = s["p95_ms"] / o["p95_ms"] if o["p95_ms"] else float("nan")
+            print(f"    {stage:<16} p50 x{r50:5.2f}  p95 x{r95:5.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="集計パイプラインの段ごとのベンチマーク")
+    parser.add_argument("--datasets", nargs="+", choices=list(DATASET_PATHS), help="既定は全データセット")
+    parser.add_argument("--prefs", nargs="+", help="都道府県コード（00 は全国）。既定は全国＋全都道府県")
+    parser.add_argument("--sics", type=int, help="先頭から何産業を測るか（既定は全産業）")
+    parser.add_argument("--population-min", type=int, default=DEFAULT_POPULATION_MIN)
+    parser.add_argument("--no-memory", action="store_true", help="ピークメモリを測らない（半分の時間で済む）")
+    parser.add_argument("--output", help=f"既定は {OUTPUT_DIR}/pipeline-<commit>.json")
+    parser.add_argument("--compare", help="比較する過去の結果 JSON")
+    args = parser.parse_args()
+
+    commit = git_commit()
+    result = {
+        "meta": {
+            "commit": commit,
+            "created_at": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "compact_dtypes": COMPACT_DTYPES,
+            "population_min": args.population_min,
+            "metric": METRIC,
+            "topn": TOPN,
+            "trace_memory": not args.no_memory,
+        },
+        "datasets": {},
+    }
+
+    t0 = time.perf_counter()
+    for key in args.datasets or list(DATASET_PATHS):
+        timer = StageTimer(trace_memory=not args.no_memory)
+        info = bench_dataset(
+            key,
+            timer,
+            prefs=args.prefs,
+            n_sics=args.sics,
+            population_min=args.population_min,
+        )
+        info["stages"] = timer.summary()
+        result["datasets"][key] = info
+        print_summary(info["stages"], f"{key}: {info['combinations']:,} combinations ({info['rows']:,} rows)")
+
+    result["meta"]["elapsed_s"] = round(time.perf_counter() - t0, 1)
+    # ru_maxrss は Linux では KB
+    result["meta"]["max_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+    output = args.output or os.path.join(OUTPUT_DIR, f"pipeline-{commit or 'local'}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"\n-> {output} ({result['meta']['elapsed_s']} s, max RSS {result['meta']['max_rss_mb']} MB)")
+
+    if args.compare:
+        compare(args.compare, result)
+
+
+if __name__ == "__main__":
+    main()
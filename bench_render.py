@@ -0,0 +1,124 @@
+"""
+ランキング表と散布図の描画コスト（サーバー側の変換時間と送信バイト数）を比べる。
+
+    python bench_render.py
+
+st.dataframe / st.altair_chart が内部で行う変換（Styler なら全セルの文字列化、Altair なら
+spec の生成と Arrow 化）を直接呼んで計測する。ブラウザ側の描画時間は含まない
+（散布図はマーク数を目安として表示する）。
+"""
+import json
+import timeit
+
+import numpy as np
+import pandas as pd
+from streamlit.elements.arrow import marshall
+from streamlit.elements.vega_charts import _convert_altair_to_vega_lite_spec
+from streamlit.proto.ArrowData_pb2 import ArrowData
+
+from dataset import SIC_COL, TOTAL_CODE, build_area_hierarchy, read_base
+from views import (
+    SCATTER_MODE_BINNED,
+    SCATTER_MODE_POINTS,
+    TABLE_RENDER_COLUMN_CONFIG,
+    TABLE_RENDER_STYLER,
+    bin_scatter,
+    make_scatter,
+    scatter_frame,
+    table_payload,
+)
+
+DATA_PATH = "data/base_2014_ec_2020_pop_level2.parquet"
+SIZES = [50, 200, 2000]
+PAGE_SIZE = 100
+
+
+def ranking_rows(path: str = DATA_PATH, metric: str = "est_density") -> pd.DataFrame:
+    """
+    全国 × 総計のランキング（県差列つき）を指標の降順で返す。
+    """
+    base = read_base(path)
+    d = base.iloc[build_area_hierarchy(base).leaf_rows]
+    d = d[d[SIC_COL] == TOTAL_CODE]
+    pop = d["population"].sum()
+    d = d.assign(
+        est_dev=d["est_density"] - d["establishments"].sum() / pop * 10000,
+        emp_dev=d["emp_density"] - d["employees"].sum() / pop * 10000,
+    )
+    return d.sort_values(metric, ascending=False).reset_index(drop=True)
+
+
+def take(rows: pd.DataFrame, n: int) -> pd.DataFrame:
+    # 行が足りないときは繰り返して n 行にする
+    rank = rows.iloc[np.resize(np.arange(len(rows)), n)].reset_index(drop=True)
+    rank.insert(0, "順位", rank.index + 1)
+    return rank
+
+
+def payload_bytes(rank: pd.DataFrame, mode: str) -> int:
+    data, column_config = table_payload(rank, mode)
+    proto = ArrowData()
+    marshall(proto, data, "bench")
+    return proto.ByteSize() + len(json.dumps(column_config, ensure_ascii=False).encode())
+
+
+def measure(rank: pd.DataFrame, mode: str, repeat: int = 5) -> tuple[float, int]:
+    seconds = min(timeit.repeat(lambda: payload_bytes(rank, mode), number=1, repeat=repeat))
+    return seconds, payload_bytes(rank, mode)
+
+
+def chart_bytes(chart) -> tuple[int, int]:
+    """
+    (spec JSON のバイト数, Arrow で送るデータのバイト数)
+    """
+    spec = _convert_altair_to_vega_lite_spec(chart)
+    datasets = spec.pop("datasets", {})
+    data = sum(
+        len(v) if isinstance(v, bytes) else len(json.dumps(v, ensure_ascii=False).encode())
+        for v in datasets.values()
+    )
+    return len(json.dumps(spec, ensure_ascii=False).encode()), data
+
+
+def scatter_marks(d: pd.DataFrame, mode: str) -> int:
+    if mode == SCATTER_MODE_BINNED:
+        binned, outliers = bin_scatter(scatter_frame(d))
+        return len(binned) + len(outliers)
+    return len(d)
+
+
+def bench_scatter(rows: pd.DataFrame, repeat: int = 5):
+    est_avg = float(rows["est_density"].mean())
+    emp_avg = float(rows["emp_density"].mean())
+    print(f"\n{'N':>6}  {'scatter':<22} {'time ms':>9} {'spec B':>10} {'data B':>10} {'marks':>7}")
+    for n in [50, 200, len(rows)]:
+        d = rows.head(n)
+        for mode in [SCATTER_MODE_POINTS, SCATTER_MODE_BINNED]:
+            build = lambda: chart_bytes(make_scatter(d, est_avg, emp_avg, mode=mode))
+            spec, data = build()  # 1回目は Altair のスキーマ読み込みなどを含むので計測しない
+            seconds = min(timeit.repeat(build, number=1, repeat=repeat))
+            print(
+                f"{n:>6,}  {mode:<22} {seconds * 1000:>9.1f} {spec:>10,} {data:>10,}"
+                f" {scatter_marks(d, mode):>7,}"
+            )
+
+
+def main():
+    rows = ranking_rows()
+    print(f"{'N':>6}  {'mode':<22} {'time ms':>9} {'bytes':>10}")
+    for n in SIZES:
+        rank = take(rows, n)
+        cases = [
+            ("styler", rank, TABLE_RENDER_STYLER),
+            ("column_config", rank, TABLE_RENDER_COLUMN_CONFIG),
+            (f"column_config/page{PAGE_SIZE}", rank.head(PAGE_SIZE), TABLE_RENDER_COLUMN_CONFIG),
+        ]
+        for label, data, mode in cases:
+            seconds, size = measure(data, mode)
+            print(f"{n:>6,}  {label:<22} {seconds * 1000:>9.1f} {size:>10,}")
+
+    bench_scatter(rows)
+
+
+if __name__ == "__main__":
+    main()
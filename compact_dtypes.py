@@ -0,0 +1,80 @@
+import glob
+
+import numpy as np
+import pandas as pd
+
+# 文字列キー → category（行ごとの文字列オブジェクトを持たず、copy も整数コードだけで済む）
+KEY_COLS = ["area", "pref", "sicCode", "sicName", "areaName", "@time"]
+# 件数 → 欠損がなければ安全な最小幅の整数
+COUNT_COLS = ["establishments", "employees", "population"]
+# 密度 → float32（表示は整数丸めなので精度は十分）
+DENSITY_COLS = ["est_density", "emp_density"]
+
+# float32 で整数を誤差なく表せる上限
+_FLOAT32_EXACT_INT = 2**24
+
+
+def count_dtype(lo: float, hi: float, has_nan: bool, integral: bool) -> np.dtype | None:
+    """
+    件数列の省メモリ dtype（None なら変えない）。
+    最小値・最大値・欠損の有無だけで決まるので、全件を持たずに読みながらでも決められる（ingest.py）。
+    """
+    if not integral:
+        return None
+    if has_nan:
+        # 欠損がある列は整数にできない。float32 で正確に表せる範囲なら float32
+        if max(abs(lo), abs(hi)) < _FLOAT32_EXACT_INT:
+            return np.dtype(np.float32)
+        return np.dtype(np.float64)
+    for t in (np.int8, np.int16, np.int32):
+        info = np.iinfo(t)
+        if info.min <= lo and hi <= info.max:
+            return np.dtype(t)
+    return np.dtype(np.int64)
+
+
+def _compact_count(s: pd.Series) -> pd.Series:
+    values = s.dropna()
+    dtype = count_dtype(values.min(), values.max(), len(values) < len(s), bool((values % 1 == 0).all()))
+    return s if dtype is None else s.astype(dtype)
+
+
+def compact_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    load_base の出力を省メモリ dtype に変換する（行・列・値は変えない）。
+    """
+    out = df.copy()
+    for c in KEY_COLS:
+        if c in out.columns:
+            out[c] = out[c].astype("category")
+    for c in COUNT_COLS:
+        if c in out.columns:
+            out[c] = _compact_count(out[c])
+    for c in DENSITY_COLS:
+        if c in out.columns:
+            out[c] = out[c].astype(np.float32)
+    return out
+
+
+def frame_memory(df: pd.DataFrame) -> int:
+    return int(df.memory_usage(deep=True).sum())
+
+
+def report(pattern: str = "data/*.parquet"):
+    """
+    data/ の各 parquet について、compact 前後のメモリ使用量を表示する。
+    """
+    for path in sorted(glob.glob(pattern)):
+        df = pd.read_parquet(path)
+        df["pref"] = df["area"].astype(str).str.zfill(5).str[:2]
+        before = frame_memory(df)
+        after = frame_memory(compact_frame(df))
+        print(
+            f"{path}: {len(df):,} rows  "
+            f"{before / 1e6:,.2f} MB -> {after / 1e6:,.2f} MB  "
+            f"({after / before:.0%})"
+        )
+
+
+if __name__ == "__main__":
+    report()
@@ -0,0 +1,732 @@
+import argparse
+import functools
+import json
+import operator
+import os
+import re
+import shutil
+import threading
+import time
+import warnings
+from collections import OrderedDict
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from compact_dtypes import compact_frame, frame_memory
+
+AREA_COL = "area"
+SIC_COL = "sicCode"
+TOTAL_CODE = "__TOTAL__"
+TOTAL_NAME = "総計（全産業）"
+
+
+# ======================
+# データ読み込み
+# ======================
+# ingest.py で取り込んだファイルの目印（parquet のスキーマメタデータのキー）。値は取り込み条件の JSON
+INGESTED_KEY = b"industrial_density.ingest"
+# 取り込み形式の版（ingest.py の出力の列・並び・leaf 列や上位の産業の行の意味を変えたら上げる）
+INGEST_FORMAT = 2
+
+
+def ingest_metadata(path: str) -> dict | None:
+    """
+    ingest.py で書いたファイルなら取り込み条件を返す（フッターのスキーマだけを読む）。
+
+    版が INGEST_FORMAT と違うファイルは、焼き込まれた leaf 列・上位の産業の行を信用できないので ValueError にする。
+    """
+    metadata = pq.read_schema(path).metadata or {}
+    if INGESTED_KEY not in metadata:
+        return None
+    meta = json.loads(metadata[INGESTED_KEY])
+    if meta.get("format") != INGEST_FORMAT:
+        raise ValueError(
+            f"{path} は取り込み形式 {meta.get('format')} で書かれている（現在は {INGEST_FORMAT}）。"
+            "ingest.py で取り込み直す"
+        )
+    return meta
+
+
+def read_raw(path: str) -> pd.DataFrame:
+    """
+    ベースデータをキーの正規化だけして読む（上位の産業の合算はしない。validate.py もこれを使う）。
+    """
+    if ingest_metadata(path) is not None:
+        # 正規化済み。合算済みの行と leaf 列だけ落とす
+        df = pd.read_parquet(path)
+        return df[~df[SIC_COL].astype(str).str.startswith("__")].drop(columns=LEAF_COL).reset_index(drop=True)
+    df = pd.read_parquet(path).copy()
+    df[AREA_COL] = df[AREA_COL].astype(str).str.zfill(5)
+    # level=2: 030/2700/7330 など桁が混在するため zfill しない
+    df[SIC_COL] = df[SIC_COL].astype(str).str.strip()
+    df["pref"] = df[AREA_COL].str[:2]
+    return df
+
+
+def read_base(path: str, compact: bool = False) -> pd.DataFrame:
+    if ingest_metadata(path) is not None:
+        # ingest.py の出力はキーの正規化・上位の産業の行・leaf 列・省メモリ dtype まで済んでいるので、そのまま返す
+        return pd.read_parquet(path)
+    df = read_raw(path)
+    # 総計・3部門などの上位の産業はデータセットごとに1回だけ集計し、他の sicCode と同じく行として持つ
+    rollups = rollup_industries(df, build_industry_tree(df))
+    rollups["pref"] = rollups[AREA_COL].str[:2]
+    df = pd.concat([df, rollups], ignore_index=True)
+    if compact:
+        df = compact_frame(df)
+    return df
+
+
+def _sum_by_area(d: pd.DataFrame, keys: list[str]) -> pd.DataFrame:
+    """
+    市区町村×年次（×keys の残り）で事業所・従業者を合算し、密度も計算済みの表を返す。
+    """
+    # 人口は合算せず、代表値（max/first）をとる
+    # 従業者・事業所は合算
+    out = (
+        d.groupby(keys, as_index=False, sort=False)
+        .agg({
+            "establishments": "sum",
+            "employees": "sum",
+            "population": "max" # 同じ地域なら人口は同じはずなのでmaxでよい
+        })
+    )
+    out["est_density"] = out["establishments"] / out["population"] * 10000
+    out["emp_density"] = out["employees"] / out["population"] * 10000
+    return out
+
+
+def rollup_industries(d: pd.DataFrame, tree: "IndustryTree") -> pd.DataFrame:
+    """
+    データに無い上位の産業（総計・3部門）の行を、葉の産業を合算して作る。
+
+    総計は「全産業」を表すコード（2009 の 000 総数、2014 の 000 A～S）があればその値をそのまま使い、
+    なければ重なりのない葉だけを合算する（集計済みのコードまで足すと二重に数える）。
+    """
+    keys = [c for c in (AREA_COL, "areaName", "@time") if c in d.columns]
+    if tree.total_alias is not None:
+        total = d.loc[d[SIC_COL] == tree.total_alias, keys + ["establishments", "employees", "population"]]
+        total = _sum_by_area(total, keys)
+    else:
+        total = _sum_by_area(d[d[SIC_COL].isin(tree.leaves)], keys)
+    total[SIC_COL] = TOTAL_CODE
+    total["sicName"] = TOTAL_NAME
+    parts = [total]
+
+    # 葉 → 3部門 の対応で1回だけ groupby する
+    sector_of = {
+        code: tree.parent[code]
+        for code in tree.leaves
+        if tree.level[tree.parent[code]] == INDUSTRY_LEVEL_SECTOR
+    }
+    if sector_of:
+        leaves = d[d[SIC_COL].isin(sector_of)]
+        leaves = leaves.assign(**{SIC_COL: leaves[SIC_COL].map(sector_of)})
+        sectors = _sum_by_area(leaves, keys + [SIC_COL])
+        sectors["sicName"] = sectors[SIC_COL].map(tree.names)
+        parts.append(sectors)
+    return pd.concat(parts, ignore_index=True)
+
+
+# ======================
+# 産業階層インデックス
+# ======================
+INDUSTRY_LEVEL_TOTAL = "total"
+INDUSTRY_LEVEL_SECTOR = "sector"
+INDUSTRY_LEVEL_DIVISION = "division"
+
+# 大分類（A～S）を3部門にまとめる。データに無い上位の産業なので TOTAL_CODE と同じく "__" で始まるコードにする
+SECTORS = {
+    "__SECTOR1__": ("第1次産業", "AB"),
+    "__SECTOR2__": ("第2次産業", "CDE"),
+    "__SECTOR3__": ("第3次産業", "FGHIJKLMNOPQRST"),
+}
+# 大分類の文字を持たないデータセット（2009）で、全産業を表す産業名
+TOTAL_SIC_NAMES = {"総数"}
+
+# "A 農業，林業" / "A～S 全産業" の先頭の大分類の文字（範囲）
+_SIC_LETTERS = re.compile(r"^([A-Z])(?:～([A-Z]))?\s")
+
+
+def is_rollup_code(code: str) -> bool:
+    return code.startswith("__")
+
+
+def _sic_letters(name: str) -> frozenset[str]:
+    m = _SIC_LETTERS.match(name)
+    if m is None:
+        return frozenset()
+    first, last = m.group(1), m.group(2) or m.group(1)
+    return frozenset(chr(c) for c in range(ord(first), ord(last) + 1))
+
+
+@dataclass(frozen=True)
+class IndustryTree:
+    """
+    総計 → （3部門）→ 産業 の階層。sicCode / sicName からデータセットごとに1回だけ構築する。
+
+    level2 の sicCode は 030 / 2700 / 7330 と桁が混在していて桁数からは階層がわからないため、
+    産業名の先頭の大分類の文字（"A 農業，林業"、"A～S 全産業"）で親子を決める。
+    範囲を持つコード（2014 の A～R など）は、それを含む最小の範囲のコードの子になる。
+
+    leaves は互いに重ならない最下層の産業で、合算（総計・3部門）と特化係数に使う。
+    total_alias は全産業を表すデータ上のコードで、あれば総計はその値を使い、選択肢からは外す。
+    """
+
+    names: dict[str, str]
+    level: dict[str, str]
+    parent: dict[str, str | None]
+    children: dict[str, tuple[str, ...]]
+    leaves: tuple[str, ...]
+    total_alias: str | None = None
+
+    def codes(self) -> list[str]:
+        """
+        総計から深さ優先でたどった順（選択肢の並び）。
+        """
+        out: list[str] = []
+        stack = [TOTAL_CODE]
+        while stack:
+            code = stack.pop()
+            out.append(code)
+            stack.extend(reversed(self.children.get(code, ())))
+        return out
+
+    def path(self, code: str) -> list[str]:
+        """
+        総計を除いた、上位から code までのコード。
+        """
+        out = []
+        while code is not None and code != TOTAL_CODE:
+            out.append(code)
+            code = self.parent.get(code)
+        return out[::-1]
+
+    def codes_at(self, level: str) -> list[str]:
+        return [c for c in self.codes() if self.level[c] == level]
+
+
+def build_industry_tree(df: pd.DataFrame) -> IndustryTree:
+    first = df.drop_duplicates(SIC_COL)
+    pairs = [
+        (code, name)
+        for code, name in zip(first[SIC_COL].astype(str), first["sicName"].astype(str))
+        if not is_rollup_code(code)
+    ]
+    letters = {code: _sic_letters(name) for code, name in pairs}
+    all_letters = frozenset().union(*letters.values())
+
+    total_alias = next(
+        (
+            code
+            for code, name in pairs
+            if name in TOTAL_SIC_NAMES or (len(all_letters) > 1 and letters[code] == all_letters)
+        ),
+        None,
+    )
+    # 大分類の文字順、同じならコードの数値順（桁が混在していても 030 < 170 < 2700）
+    pairs.sort(key=lambda p: (min(letters[p[0]], default=""), len(p[0]), p[0]))
+    names = {TOTAL_CODE: TOTAL_NAME, **dict(pairs)}
+    codes = [code for code, _ in pairs if code != total_alias]
+
+    level = {TOTAL_CODE: INDUSTRY_LEVEL_TOTAL}
+    parent: dict[str, str | None] = {TOTAL_CODE: None}
+    if codes and all(len(letters[c]) == 1 for c in codes):
+        # 全部が大分類（level2）：総計 → 3部門 → 大分類
+        for sector, (name, sector_letters) in SECTORS.items():
+            members = [c for c in codes if letters[c] <= frozenset(sector_letters)]
+            if not members:
+                continue
+            names[sector] = name
+            level[sector] = INDUSTRY_LEVEL_SECTOR
+            parent[sector] = TOTAL_CODE
+            for c in members:
+                parent[c] = sector
+    else:
+        for c in codes:
+            wider = [o for o in codes if letters[c] and letters[c] < letters[o]]
+            parent[c] = min(wider, key=lambda o: len(letters[o])) if wider else TOTAL_CODE
+    for c in codes:
+        level[c] = INDUSTRY_LEVEL_DIVISION
+        parent.setdefault(c, TOTAL_CODE)
+
+    children_lists: dict[str, list[str]] = {}
+    for code in names:  # names は表示順
+        p = parent.get(code)
+        if p is not None:
+            children_lists.setdefault(p, []).append(code)
+    children = {p: tuple(c) for p, c in children_lists.items()}
+    leaves = tuple(c for c in codes if c not in children)
+
+    return IndustryTree(
+        names=names,
+        level=level,
+        parent=parent,
+        children=children,
+        leaves=leaves,
+        total_alias=total_alias,
+    )
+
+
+# ======================
+# 地域階層インデックス
+# ======================
+NATIONAL_CODE = "00000"
+
+AREA_LEVEL_NATIONAL = "national"
+AREA_LEVEL_PREF = "pref"
+AREA_LEVEL_CITY = "city"  # 区を持つ政令指定都市・特別区部（XX1X0）
+AREA_LEVEL_WARD = "ward"
+AREA_LEVEL_MUNICIPALITY = "municipality"
+
+_EMPTY_ROWS = np.empty(0, dtype=np.intp)
+
+
+@dataclass(frozen=True)
+class AreaHierarchy:
+    """
+    全国 → 都道府県 → 市区町村（政令市 → 区）の階層。データセットごとに1回だけ構築する。
+
+    leaf_rows / pref_leaf_rows は「集計の重複がない市区町村行」の行位置（iloc 用）で、
+    filter_scope_base の結果はこの位置で df を切り出すだけで得られる。
+    """
+
+    level: dict[str, str]
+    parent: dict[str, str | None]
+    children: dict[str, tuple[str, ...]]
+    names: dict[str, str]
+    prefs: tuple[str, ...]
+    leaf_rows: np.ndarray
+    pref_leaf_rows: dict[str, np.ndarray] = field(default_factory=dict)
+
+    def leaf_positions(self, pref_code: str) -> np.ndarray:
+        if pref_code == "00":
+            return self.leaf_rows
+        return self.pref_leaf_rows.get(pref_code, _EMPTY_ROWS)
+
+
+def _designated_parents(codes: pd.Series, names: dict[str, str]) -> pd.Series:
+    """
+    政令指定都市などは「市全体(XXXX0)」と「区(XXXX1~)」の両方が入っている場合がある。
+    「末尾が0」かつ「政令指定都市のパターン（3桁目が1）」かつ「自分を除いた前方一致（4桁）するコードが存在する」
+    ものを「親」とみなす。市部（Mobara 12210 等）は3桁目が2なので対象外。
+    区が10以上ある市では 13110 目黒区・14110 横浜市戸塚区 のように区のコードも末尾が0になり、
+    後ろの区（13111~）と前方一致するため、名前が「区」で終わるものは親にしない（市全体は「市」「特別区部」）。
+
+    codes はユニークであること（県・全国コードは除外済み）。
+    """
+    # 行単位の startswith をコードごとに回すと O(コード数 × 行数) になるため、
+    # ユニークなコード集合に対して1回だけベクトル化して判定する。
+    prefix = codes.str[:4]
+    is_designated = (
+        codes.str.endswith("0")
+        & (codes.str.len() == 5)
+        & (codes.str[2] == "1")
+    )
+    # codes はユニークなので、プレフィックスの出現数が2以上なら子（区）がある。
+    has_children = prefix.map(prefix.value_counts()) > 1
+    is_ward = codes.map(names).fillna("").str.endswith("区")
+    return is_designated & has_children & ~is_ward
+
+
+def build_area_hierarchy(df: pd.DataFrame) -> AreaHierarchy:
+    area = df[AREA_COL]
+    first = df.drop_duplicates(AREA_COL)
+    names = dict(zip(first[AREA_COL].tolist(), first["areaName"].tolist()))
+
+    codes = pd.Series(first[AREA_COL].to_numpy(), dtype=object)
+    is_national = codes == NATIONAL_CODE
+    is_pref = codes.str.endswith("000") & ~is_national
+    local = codes[~is_national & ~is_pref].reset_index(drop=True)
+    is_city = _designated_parents(local, names)
+    city_codes = set(local[is_city])
+
+    level: dict[str, str] = {}
+    parent: dict[str, str | None] = {}
+    for code in codes[is_national]:
+        level[code] = AREA_LEVEL_NATIONAL
+        parent[code] = None
+    for code in codes[is_pref]:
+        level[code] = AREA_LEVEL_PREF
+        parent[code] = NATIONAL_CODE
+    for code, city in zip(local, is_city):
+        # 区の親は XXXX0、なければ（区が10以上ある市の 13111 など）XXX00
+        city_code = next((c for c in (code[:4] + "0", code[:3] + "00") if c != code and c in city_codes), None)
+        if city:
+            level[code] = AREA_LEVEL_CITY
+            parent[code] = f"{code[:2]}000"
+        elif city_code is not None:
+            level[code] = AREA_LEVEL_WARD
+            parent[code] = city_code
+        else:
+            level[code] = AREA_LEVEL_MUNICIPALITY
+            parent[code] = f"{code[:2]}000"
+
+    children_lists: dict[str, list[str]] = {}
+    for code, p in parent.items():
+        if p is not None:
+            children_lists.setdefault(p, []).append(code)
+    children = {p: tuple(sorted(c)) for p, c in children_lists.items()}
+
+    # 行ごとの文字列比較を避け、ユニークな地域コードで判定してから行に展開する
+    area_idx, area_codes = pd.factorize(area)
+    area_codes = area_codes.tolist()
+    if LEAF_COL in df.columns:
+        # 変換・取り込み時に下と同じ判定で計算済み
+        leaf_rows = np.flatnonzero(df[LEAF_COL].to_numpy())
+    else:
+        # 集計対象の市区町村行：全国・県集計を除き、人口ゼロを除き、区を持つ市全体を除く。
+        # 親判定は人口>0 のコードだけで行う（区がすべて人口ゼロなら市全体を残す）。
+        populated = pd.Series(
+            area[(df["population"] > 0).to_numpy()].unique(), dtype=object
+        )
+        populated = populated[
+            (populated != NATIONAL_CODE) & ~populated.str.endswith("000")
+        ].reset_index(drop=True)
+        leaf_set = set(populated[~_designated_parents(populated, names)])
+        is_leaf = np.fromiter((c in leaf_set for c in area_codes), dtype=bool, count=len(area_codes))
+        leaf_rows = np.flatnonzero(is_leaf[area_idx] & (df["population"] > 0).to_numpy())
+    # 都道府県ごとの行位置：都道府県で安定ソートして切り分ける（行位置の昇順は保つ）
+    pref_idx, pref_codes = pd.factorize(np.asarray([c[:2] for c in area_codes])[area_idx[leaf_rows]])
+    order = np.argsort(pref_idx, kind="stable")
+    bounds = np.cumsum(np.bincount(pref_idx, minlength=len(pref_codes)))[:-1]
+    pref_leaf_rows = dict(zip(pref_codes, np.split(leaf_rows[order], bounds)))
+    prefs = tuple(sorted(p for p in df["pref"].unique() if p != "00"))
+
+    return AreaHierarchy(
+        level=level,
+        parent=parent,
+        children=children,
+        names=names,
+        prefs=prefs,
+        leaf_rows=leaf_rows,
+        pref_leaf_rows=pref_leaf_rows,
+    )
+
+
+# ======================
+# パーティション分割データ（sicCode=XXX/part-0.parquet）
+# ======================
+PARTITION_COL = SIC_COL
+PREF_COL = "pref"
+LEAF_COL = "leaf"  # filter_scope_base で残る市区町村行なら True（変換時に計算済み）
+# 分割データの目印（各ファイルのスキーマメタデータのキー）。値は形式の版と産業の一覧の JSON
+PARTITION_KEY = b"industrial_density.partitioned"
+# 分割データの形式の版（leaf 列や上位の産業の行の意味、列・dtype を変えたら上げる）
+PARTITION_FORMAT = 2
+
+_PARTITIONING = ds.partitioning(pa.schema([(PARTITION_COL, pa.string())]), flavor="hive")
+
+
+def partition_root(path: str) -> str:
+    """
+    data/xxx.parquet → data/partitioned/xxx
+    """
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(os.path.dirname(path), "partitioned", stem)
+
+
+def _run_bounds(values: np.ndarray) -> list[tuple[int, int]]:
+    # ソート済み配列の「同じ値が続く区間」を (start, stop) で返す
+    if len(values) == 0:
+        return []
+    starts = np.flatnonzero(np.r_[True, values[1:] != values[:-1]])
+    stops = np.r_[starts[1:], len(values)]
+    return list(zip(starts.tolist(), stops.tolist()))
+
+
+def source_stamp(path: str) -> dict:
+    """
+    分割データの元の parquet の大きさと更新時刻（差し替えられたかの判定用。中身は読まない）。
+    """
+    st = os.stat(path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def write_partitioned(df: pd.DataFrame, root: str, source: str) -> int:
+    """
+    read_base(compact=True) の出力を sicCode ごとのファイルに分けて書き出す。戻り値は書いたファイル数。
+    source は df の元の parquet で、その大きさと更新時刻をメタデータに入れる。
+
+    画面の1回の表示は必ず1つの sicCode なので、全国表示でも読むファイルは1つで済む。
+    各ファイルは pref → area 順の1つの row group で、leaf 列で市区町村行だけを読める
+    （1ファイルは数千行なので、pref ごとに row group を分けると読み飛ばしより row group ごとの手間が大きい）。
+    件数・密度の列は df の dtype（最小幅の整数・float32）のまま書く。category の列は文字列に戻して書き
+    （category のままだと全カテゴリの辞書がファイルごとに入る）、read_partitioned が category にして返す。
+    スキーマメタデータには形式の版・元のファイルの大きさと更新時刻・産業の一覧（sicCode と sicName）を入れ、
+    load_dataset は総計の1ファイルとこの一覧だけでカタログを作る。
+    """
+    hierarchy = build_area_hierarchy(df)
+    first = df.drop_duplicates(SIC_COL)
+    sic_names = list(zip(first[SIC_COL].astype(str), first["sicName"].astype(str)))
+    out = df.copy()
+    leaf = np.zeros(len(out), dtype=bool)
+    leaf[hierarchy.leaf_rows] = True
+    out[LEAF_COL] = leaf
+    # category のカテゴリの並びは元データによるので、文字列の順で並べる
+    out = out.sort_values(
+        [PARTITION_COL, PREF_COL, AREA_COL], kind="stable", ignore_index=True, key=lambda s: s.astype(str)
+    )
+    out = out.astype({c: object for c in out.columns if isinstance(out[c].dtype, pd.CategoricalDtype)})
+
+    table = pa.Table.from_pandas(out.drop(columns=PARTITION_COL), preserve_index=False)
+    metadata = {"format": PARTITION_FORMAT, "source": source_stamp(source), "sics": sic_names}
+    table = table.replace_schema_metadata({
+        **(table.schema.metadata or {}),
+        PARTITION_KEY: json.dumps(metadata, ensure_ascii=False).encode(),
+    })
+    if os.path.isdir(root):
+        shutil.rmtree(root)
+
+    sics = out[PARTITION_COL].astype(str).to_numpy()
+    n_files = 0
+    for start, stop in _run_bounds(sics):
+        part_dir = os.path.join(root, f"{PARTITION_COL}={sics[start]}")
+        os.makedirs(part_dir)
+        pq.write_table(
+            table.slice(start, stop - start),
+            os.path.join(part_dir, "part-0.parquet"),
+            row_group_size=stop - start,
+        )
+        n_files += 1
+    return n_files
+
+
+def open_partitioned(root: str) -> ds.Dataset:
+    return ds.dataset(root, format="parquet", partitioning=_PARTITIONING)
+
+
+def partition_metadata(root: str) -> dict | None:
+    """
+    分割データの形式の版と産業の一覧（総計のファイルのフッターのスキーマだけを読む）。
+    総計のファイルや目印が無いとき（古い変換の出力）は None。
+    """
+    path = os.path.join(root, f"{PARTITION_COL}={TOTAL_CODE}", "part-0.parquet")
+    if not os.path.isfile(path):
+        return None
+    metadata = pq.read_schema(path).metadata or {}
+    if PARTITION_KEY not in metadata:
+        return None
+    return json.loads(metadata[PARTITION_KEY])
+
+
+def read_partitioned(
+    dataset: ds.Dataset | str,
+    pref_code: str = "00",
+    sic_code: str | None = None,
+    columns: list[str] | None = None,
+    leaf_only: bool = False,
+) -> pd.DataFrame:
+    """
+    sicCode（ディレクトリ）・pref・leaf の条件を pyarrow に渡し、
+    必要な行と列だけを読む。pref_code="00" は全国（pref の条件なし）。
+    文字列の列は read_base(compact=True) と同じく category で返す。
+    """
+    if isinstance(dataset, str):
+        dataset = open_partitioned(dataset)
+
+    conds = []
+    if pref_code != "00":
+        conds.append(ds.field(PREF_COL) == pref_code)
+    if sic_code is not None:
+        conds.append(ds.field(PARTITION_COL) == str(sic_code))
+    if leaf_only:
+        conds.append(ds.field(LEAF_COL))
+    expr = functools.reduce(operator.and_, conds) if conds else None
+
+    df = dataset.to_table(columns=columns, filter=expr).to_pandas(strings_to_categorical=True)
+    # 複数の sicCode を読んだときも、元データと同じ area 順に揃える
+    if AREA_COL in df.columns:
+        df = df.sort_values(AREA_COL, kind="stable", ignore_index=True)
+    return df
+
+
+# ======================
+# データセットレジストリ
+# ======================
+# 分割データのときにカタログとして読む総計の列（地域ごとに1行。都道府県の選択肢と AreaHierarchy の構築に使う）。
+# 総計の行が無い地域（地域名も人口も無い 13199）はカタログに入らないが、集計の対象にもならない
+CATALOG_COLUMNS = [AREA_COL, PREF_COL, "areaName", "population", LEAF_COL]
+
+
+@dataclass(frozen=True)
+class LoadedDataset:
+    """
+    レジストリが保持する1データセット分の読み込み結果（全セッションで共有、読み取り専用）。
+
+    partitioned が None なら base は read_base の全件。
+    分割データがあるときは base は総計の行（地域ごとに1行）だけのカタログで、数値列は read_partitioned で読む。
+    industries は産業の階層（分割データではスキーマメタデータの産業の一覧から作る）。
+    """
+
+    path: str
+    base: pd.DataFrame
+    hierarchy: AreaHierarchy
+    industries: IndustryTree
+    partitioned: ds.Dataset | None
+    nbytes: int
+
+
+def load_dataset(path: str, compact: bool = False) -> LoadedDataset:
+    root = partition_root(path)
+    meta = partition_metadata(root) if os.path.isdir(root) else None
+    stale = None
+    if os.path.isdir(root):
+        # leaf 列・上位の産業の行は変換時の判定・データのまま焼き込まれているので、
+        # 版が違う（無い）とき・元のファイルが差し替えられたときは使わない
+        if (meta or {}).get("format") != PARTITION_FORMAT:
+            stale = f"分割データの形式 {(meta or {}).get('format')} で書かれている（現在は {PARTITION_FORMAT}）"
+        elif meta.get("source") != source_stamp(path):
+            stale = f"変換したあとに {path} が変わっている"
+    if stale is not None:
+        warnings.warn(f"{root}：{stale}。python dataset.py {path} で作り直すまで {path} を全件読む")
+        meta = None
+    if meta is not None:
+        partitioned = open_partitioned(root)
+        base = read_partitioned(partitioned, sic_code=TOTAL_CODE, columns=CATALOG_COLUMNS)
+        industries = build_industry_tree(pd.DataFrame(meta["sics"], columns=[SIC_COL, "sicName"]))
+    else:
+        partitioned = None
+        base = read_base(path, compact=compact)
+        industries = build_industry_tree(base)
+    return LoadedDataset(
+        path=path,
+        base=base,
+        hierarchy=build_area_hierarchy(base),
+        industries=industries,
+        partitioned=partitioned,
+        nbytes=frame_memory(base),
+    )
+
+
+class DatasetRegistry:
+    """
+    複数のベースデータを初回アクセス時に読み込み、メモリ上限を超えたら
+    最も長く使われていないものから手放す（LRU）。
+
+    手放したデータセットも、それを参照中のセッションが処理を終えるまでは残る。
+    次にアクセスされたときに読み直す。
+
+    読み込みはロックの外で行う（ロックは辞書と LRU の更新だけ）。読み込み中の他のデータセットには待たされず、
+    同じデータセットを同時に求めたセッションは、最初の1つの読み込み（Future）の結果を待って受け取る。
+
+    cache_usage（データセット → バイト数）を渡すと、そのデータセットから作った集計結果のキャッシュも
+    上限に数える（分割データでは base はカタログだけで、メモリの大半はキャッシュになる）。
+    キャッシュは読み込み後にも増えるので、使う側が集計のたびに trim を呼ぶ。
+    手放したデータセットは on_evict に渡す（そのデータセットのキャッシュを捨てる）。
+    """
+
+    def __init__(
+        self,
+        paths: dict[str, str],
+        memory_budget: int,
+        compact: bool = False,
+        cache_usage: Callable[[str], int] | None = None,
+        on_evict: Callable[[str], None] | None = None,
+    ):
+        self.paths = dict(paths)
+        self.memory_budget = memory_budget
+        self.compact = compact
+        self.cache_usage = cache_usage
+        self.on_evict = on_evict
+        self._loaded: OrderedDict[str, LoadedDataset] = OrderedDict()
+        self._loading: dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> LoadedDataset:
+        with self._lock:
+            if key in self._loaded:
+                self._loaded.move_to_end(key)
+                return self._loaded[key]
+            future = self._loading.get(key)
+            if future is None:
+                future = self._loading[key] = Future()
+                owner = True
+            else:
+                owner = False
+        if not owner:
+            return future.result()
+
+        try:
+            loaded = load_dataset(self.paths[key], compact=self.compact)
+        except BaseException as e:
+            # 待っているセッションにも同じ例外を渡す。次のアクセスで読み直す
+            with self._lock:
+                del self._loading[key]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            del self._loading[key]
+            self.loads += 1
+            self._loaded[key] = loaded
+            evicted = self._evict_over_budget()
+        self._notify_evicted(evicted)
+        future.set_result(loaded)
+        return loaded
+
+    def trim(self) -> list[str]:
+        """
+        上限を超えていれば、最も長く使われていないものから手放す（手放したキーを返す）。
+        """
+        with self._lock:
+            evicted = self._evict_over_budget()
+        self._notify_evicted(evicted)
+        return evicted
+
+    def _evict_over_budget(self) -> list[str]:
+        # ロックを持って呼ぶ。最も新しく使ったものは上限を超えていても残す（1件だけで上限を超える設定でも表示はできる）
+        evicted = []
+        while self.memory_usage > self.memory_budget and len(self._loaded) > 1:
+            key, _ = self._loaded.popitem(last=False)
+            evicted.append(key)
+            self.evictions += 1
+        return evicted
+
+    def _notify_evicted(self, keys: list[str]) -> None:
+        if self.on_evict is not None:
+            for key in keys:
+                self.on_evict(key)
+
+    def usage(self, key: str) -> int:
+        """
+        読み込み済みの key のバイト数（cache_usage があればキャッシュ込み）。
+        """
+        data = self._loaded.get(key)
+        if data is None:
+            return 0
+        return data.nbytes + (self.cache_usage(key) if self.cache_usage is not None else 0)
+
+    @property
+    def memory_usage(self) -> int:
+        return sum(self.usage(key) for key in list(self._loaded))
+
+    def resident(self) -> list[str]:
+        # 古い（次に手放す）順
+        return list(self._loaded)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="data/*.parquet を sicCode 分割データ（data/partitioned/<name>/sicCode=XXX/）に変換する"
+    )
+    parser.add_argument("paths", nargs="+", help="変換する parquet ファイル")
+    args = parser.parse_args()
+
+    for path in args.paths:
+        t0 = time.perf_counter()
+        root = partition_root(path)
+        n_files = write_partitioned(read_base(path, compact=True), root, path)
+        print(f"{path} -> {root}: {n_files} files ({time.perf_counter() - t0:.2f}s)")
+
+
+if __name__ == "__main__":
+    main()
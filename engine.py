@@ -0,0 +1,1107 @@
+"""
+密度集計エンジン（Streamlit に依存しない）。
+
+    from engine import DensityEngine, Query
+
+    engine = DensityEngine()
+    result = engine.run(Query("2014_level2", pref_code="13", sic_code="E"))
+    result.table("est_density", stop=20)
+
+app.py はこのエンジンの上に画面を載せるだけ。import しても streamlit / altair は読み込まない。
+"""
+import re
+import threading
+from dataclasses import dataclass, fields
+
+import numpy as np
+import pandas as pd
+
+from compact_dtypes import frame_memory
+from dataset import (
+    AREA_COL,
+    SIC_COL,
+    TOTAL_CODE,
+    AreaHierarchy,
+    DatasetRegistry,
+    INDUSTRY_LEVEL_SECTOR,
+    IndustryTree,
+    LoadedDataset,
+    build_area_hierarchy,
+    build_industry_tree,
+    read_partitioned,
+)
+from perf import NO_TIMINGS, StageTimings
+from query_cache import CacheWarmer, QueryCache
+
+# ======================
+# 設定
+# ======================
+# 切り替えられるベースデータ（先頭がデフォルト）
+DATASET_PATHS = {
+    "2014_level2": "data/base_2014_ec_2020_pop_level2.parquet",
+    "2014": "data/base_2014_ec_2020_pop.parquet",
+    "2009": "data/base_2009_ec_2020_pop.parquet",
+}
+DATASET_LABELS = {
+    "2014_level2": "2014年 経済センサス（産業大分類）× 2020年 国勢調査",
+    "2014": "2014年 経済センサス（農林漁業／非農林漁業）× 2020年 国勢調査",
+    "2009": "2009年 経済センサス（産業大分類）× 2020年 国勢調査",
+}
+# 読み込み済みデータセット（そこから作った集計結果のキャッシュ込み）のメモリ上限。
+# 超えたら最も長く使われていないものから、キャッシュごと手放す
+MEMORY_BUDGET_MB = 256
+# 文字列キーを category、件数を最小幅の整数、密度を float32 にして読み込む（python compact_dtypes.py で効果を確認）
+COMPACT_DTYPES = True
+# 集計結果キャッシュ：（都道府県, 産業[, 人口下限]）ごとの件数上限（データセットごと）と有効期限（秒）
+# （件数上限はウォームアップ分の 48 スコープ × 産業数より小さければそちらに広げる。DensityEngine.caches）
+QUERY_CACHE_SIZE = 2048
+QUERY_CACHE_TTL = 3600
+# 人口下限の初期値（ウォームアップでもこの値の段を埋める）
+DEFAULT_POPULATION_MIN = 5000
+# python dataset.py data/xxx.parquet で作成した sicCode 分割データがあれば、
+# 全件を読まずに産業ごとのファイルだけを読む。分割データから読む列：
+PARTITION_COLUMNS = [AREA_COL, SIC_COL, "sicName", "areaName", "establishments", "employees", "population", "est_density", "emp_density"]
+
+NATIONAL_PREF = "00"  # 都道府県の選択肢で「全国」を表すコード
+METRIC_COLS = ["est_density", "emp_density"]
+
+# 指標ごとの全国順位（人口下限後）の列
+NATIONAL_RANK_COLS = {
+    "est_density": "est_national_rank",
+    "emp_density": "emp_national_rank",
+}
+# QueryResult.table が付ける順位の列
+RANK_COL = "順位"
+NATIONAL_RANK_COL = "全国順位"
+
+
+# ======================
+# 選択肢
+# ======================
+def build_pref_maps(hierarchy: AreaHierarchy):
+    pref_name_map = {
+        p: hierarchy.names[f"{p}000"]
+        for p in hierarchy.prefs
+        if f"{p}000" in hierarchy.names
+    }
+    pref_list = list(hierarchy.prefs)
+    return pref_list, pref_name_map
+
+
+def build_sic_lists(df: pd.DataFrame):
+    """
+    産業の選択肢：総計から IndustryTree を深さ優先でたどった順（総計 → 3部門 → 大分類）。
+    """
+    tree = build_industry_tree(df)
+    sic_codes = tree.codes()
+    sic_map = {c: tree.names[c] for c in sic_codes}
+    return sic_codes, sic_map, 0  # 総計をデフォルト
+
+
+@dataclass(frozen=True)
+class DatasetOptions:
+    """
+    データセットごとの都道府県・産業の選択肢（先頭がデフォルト）。
+    """
+
+    pref_codes: list[str]  # NATIONAL_PREF ＋ 都道府県コード
+    pref_names: dict[str, str]
+    sic_codes: list[str]  # TOTAL_CODE ＋ 3部門 ＋ 産業コード（IndustryTree.codes() の順）
+    sic_names: dict[str, str]
+    industries: IndustryTree
+
+    def pref_label(self, pref_code: str) -> str:
+        return "全国" if pref_code == NATIONAL_PREF else self.pref_names.get(pref_code, pref_code)
+
+
+# ======================
+# 集計の各段
+# ======================
+def filter_scope_base(
+    df: pd.DataFrame, pref_code: str, hierarchy: AreaHierarchy | None = None
+) -> pd.DataFrame:
+    """
+    データフィルタリング：
+    1. 全国(00000)除外
+    2. 人口ゼロ除外
+    3. 県全体の集計行(XX000)を除外
+    4. 政令指定都市の重複除外（「市全体」と「区」が両方ある場合、「市全体」を除外）
+
+    判定は AreaHierarchy 構築時に済ませてあるので、ここでは行位置で切り出すだけ。
+    """
+    if hierarchy is None:
+        hierarchy = build_area_hierarchy(df)
+    return df.iloc[hierarchy.leaf_positions(pref_code)]
+
+
+def read_leaf_rows(data: LoadedDataset, columns: list[str]) -> pd.DataFrame:
+    """
+    全国の市区町村行（全産業ぶん）。分割データがあれば leaf 列で絞って必要な列だけを読む。
+    """
+    if data.partitioned is not None:
+        return read_partitioned(data.partitioned, columns=columns, leaf_only=True)
+    return filter_scope_base(data.base, pref_code=NATIONAL_PREF, hierarchy=data.hierarchy)
+
+
+def apply_industry(d: pd.DataFrame, sic_code: str) -> pd.DataFrame:
+    """
+    産業を適用。総計（TOTAL_CODE）・3部門も read_base で集計済みの行を切り出すだけ。
+    """
+    return d[d[SIC_COL] == str(sic_code)].copy()
+
+
+@dataclass(frozen=True)
+class WeightedAverage:
+    """
+    人口加重平均（=県全体を1つの自治体としてみなした密度）。人口がなければ平均は None。
+    """
+
+    pop_sum: float
+    est_avg: float | None
+    emp_avg: float | None
+
+
+def compute_weighted_avg(d: pd.DataFrame) -> WeightedAverage:
+    """
+    人口加重平均（=県全体を1つの自治体としてみなした密度）
+    """
+    pop_sum = float(pd.to_numeric(d["population"], errors="coerce").sum())
+    est_sum = float(pd.to_numeric(d["establishments"], errors="coerce").sum())
+    emp_sum = float(pd.to_numeric(d["employees"], errors="coerce").sum())
+
+    if pop_sum <= 0:
+        return WeightedAverage(pop_sum=0.0, est_avg=None, emp_avg=None)
+
+    est_avg = est_sum / pop_sum * 10000
+    emp_avg = emp_sum / pop_sum * 10000
+    return WeightedAverage(pop_sum=pop_sum, est_avg=est_avg, emp_avg=emp_avg)
+
+
+def add_deviation_cols(d: pd.DataFrame, est_avg: float | None, emp_avg: float | None) -> pd.DataFrame:
+    out = d.copy()
+    out["est_dev"] = out["est_density"] - est_avg if est_avg is not None else None
+    out["emp_dev"] = out["emp_density"] - emp_avg if emp_avg is not None else None
+    return out
+
+
+# ======================
+# 集計クエリ
+# ======================
+@dataclass(frozen=True)
+class Query:
+    """
+    集計の条件。キャッシュのキーにもそのまま使う。
+    """
+
+    dataset: str
+    pref_code: str = NATIONAL_PREF
+    sic_code: str = TOTAL_CODE
+    population_min: int = DEFAULT_POPULATION_MIN
+
+
+@dataclass(frozen=True)
+class IndustryRanking:
+    """
+    （データセット, 産業）の全国の市区町村行と、指標ごとの降順の並び（行位置）。
+
+    データセット×産業ごとに1回だけ作り、都道府県の切り出し・人口下限・順位はこの並びを
+    絞り込むだけで得る（再実行ごとの sort_values をしない）。
+    """
+
+    rows: pd.DataFrame
+    pref: np.ndarray
+    population: np.ndarray
+    order: dict[str, np.ndarray]
+
+
+@dataclass(frozen=True)
+class ScopeResult:
+    """
+    （データセット, 都道府県, 産業）だけで決まる部分：人口下限前の市区町村行と県平均。
+    """
+
+    ranking: IndustryRanking
+    pref_code: str
+    d_all: pd.DataFrame
+    avg: WeightedAverage
+
+
+@dataclass(frozen=True)
+class QueryResult:
+    query: Query
+    scope: ScopeResult
+    d: pd.DataFrame  # 人口下限後、県平均との差・全国順位の列つき
+    order: dict[str, np.ndarray]  # 指標ごとに d の行位置を降順に並べたもの（先頭 N 件がランキング）
+
+    @property
+    def avg(self) -> WeightedAverage:
+        return self.scope.avg
+
+    def table(self, metric_col: str, start: int = 0, stop: int | None = None) -> pd.DataFrame:
+        """
+        metric_col の降順で start〜stop 位の行（順位の列つき）。都道府県のときは全国順位も付ける。
+        """
+        positions = self.order[metric_col][start:stop]
+        rank = self.d.iloc[positions].reset_index(drop=True)
+        rank.insert(0, RANK_COL, start + rank.index + 1)
+        if self.query.pref_code != NATIONAL_PREF:
+            rank.insert(1, NATIONAL_RANK_COL, rank[NATIONAL_RANK_COLS[metric_col]])
+        return rank
+
+
+def build_industry_ranking(data: LoadedDataset, sic_code: str) -> IndustryRanking:
+    if data.partitioned is not None:
+        # 1-2) sicCode・leaf（市区町村行）の条件で必要なファイルの必要な行だけを読む
+        rows = read_partitioned(
+            data.partitioned,
+            sic_code=sic_code,
+            columns=PARTITION_COLUMNS,
+            leaf_only=True,
+        )
+    else:
+        # 1) スコープ（全国）→ 市区町村
+        scope_df = filter_scope_base(data.base, pref_code=NATIONAL_PREF, hierarchy=data.hierarchy)
+
+        # 2) 産業適用（総計なら合算）
+        rows = apply_industry(scope_df, sic_code=sic_code)
+
+    # NaN は末尾、同値は元の（area）順
+    order = {
+        col: np.argsort(-rows[col].to_numpy(dtype=np.float64), kind="stable")
+        for col in METRIC_COLS
+    }
+    return IndustryRanking(
+        rows=rows,
+        pref=rows[AREA_COL].astype(str).str[:2].to_numpy(),
+        population=rows["population"].to_numpy(dtype=np.float64),
+        order=order,
+    )
+
+
+def query_scope(ranking: IndustryRanking, pref_code: str) -> ScopeResult:
+    if pref_code == NATIONAL_PREF:
+        d_all = ranking.rows
+    else:
+        d_all = ranking.rows[ranking.pref == pref_code]
+
+    # 4) 県平均（人口加重）：人口下限で絞る前の行（d_all）で計算する
+    return ScopeResult(ranking=ranking, pref_code=pref_code, d_all=d_all, avg=compute_weighted_avg(d_all))
+
+
+def query_result(query: Query, scope: ScopeResult) -> QueryResult:
+    ranking = scope.ranking
+
+    # 3) ノイズ抑制（人口下限）：全国の行位置で選び、県の行はその部分集合
+    keep = ranking.population >= query.population_min
+    selected = keep if scope.pref_code == NATIONAL_PREF else keep & (ranking.pref == scope.pref_code)
+    d = ranking.rows[selected]
+    # 全国の行位置 → d の行位置
+    to_local = np.cumsum(selected) - 1
+
+    # 4) 県平均との差
+    d = add_deviation_cols(d, est_avg=scope.avg.est_avg, emp_avg=scope.avg.emp_avg)
+
+    # 5) 順位：全国の降順の並びを人口下限・都道府県で絞り込むだけ
+    order = {}
+    for col, sorted_pos in ranking.order.items():
+        national = sorted_pos[keep[sorted_pos]]
+        national_rank = np.empty(len(ranking.rows), dtype=np.int64)
+        national_rank[national] = np.arange(1, len(national) + 1)
+        d[NATIONAL_RANK_COLS[col]] = national_rank[selected]
+        order[col] = to_local[national[selected[national]]]
+    return QueryResult(query=query, scope=scope, d=d, order=order)
+
+
+# ======================
+# 一括集計（全スコープ × 全産業）
+# ======================
+SCOPE_COL = "scope"  # NATIONAL_PREF（全国）または都道府県コード
+# スコープ内の順位（人口下限後）の列
+SCOPE_RANK_COLS = {
+    "est_density": "est_rank",
+    "emp_density": "emp_rank",
+}
+BULK_COLUMNS = [AREA_COL, "pref", "areaName", SIC_COL, "sicName", "establishments", "employees", "population", "est_density", "emp_density"]
+
+
+@dataclass(frozen=True)
+class BulkTables:
+    """
+    全スコープ（全国＋都道府県）× 全産業の集計結果。
+    rows は (scope, sicCode) ごとに Query の結果 d と同じ行（人口下限後、県差・順位つき）を縦に積んだもの。
+    """
+
+    rows: pd.DataFrame
+    averages: pd.DataFrame  # scope × sicCode ごとの pop_sum / est_avg / emp_avg（人口下限前）
+    population_min: int
+
+
+def _group_averages(d: pd.DataFrame, keys: list[str]) -> pd.DataFrame:
+    """
+    compute_weighted_avg をグループごとに一度に計算する（人口がないグループの平均は NaN）。
+    """
+    sums = d.groupby(keys, observed=True, sort=True)[["population", "establishments", "employees"]].sum()
+    pop = sums["population"].astype(np.float64)
+    has_pop = pop > 0
+    return pd.DataFrame({
+        "pop_sum": pop.where(has_pop, 0.0),
+        "est_avg": (sums["establishments"] / pop * 10000).where(has_pop),
+        "emp_avg": (sums["employees"] / pop * 10000).where(has_pop),
+    }).reset_index()
+
+
+def _group_ranks(d: pd.DataFrame, keys: list[str], rank_cols: dict[str, str]) -> pd.DataFrame:
+    """
+    keys ごとに指標の降順の順位（1始まり）を付ける。NaN は末尾、同値は d の行順（area 順）。
+    """
+    out = d.copy()
+    for col, rank_col in rank_cols.items():
+        ordered = d.sort_values(
+            keys + [col], ascending=[True] * len(keys) + [False], kind="stable", na_position="last"
+        )
+        out[rank_col] = (ordered.groupby(keys, observed=True, sort=False).cumcount() + 1).reindex(d.index)
+    return out
+
+
+def compute_all_tables(
+    base: pd.DataFrame,
+    hierarchy: AreaHierarchy,
+    population_min: int = DEFAULT_POPULATION_MIN,
+) -> BulkTables:
+    """
+    全（スコープ, 産業）の市区町村表・加重平均・県差・順位を、クエリごとの絞り込みを繰り返さずに
+    groupby で一度に計算する。個々の値は DensityEngine.run と同じ。
+    """
+    # 1-2) 全国の市区町村行（全産業ぶん）を一度だけ切り出す
+    rows = base.iloc[hierarchy.leaf_rows][BULK_COLUMNS].copy()
+    for c in (AREA_COL, "pref", SIC_COL, "areaName", "sicName"):
+        rows[c] = rows[c].astype(str)
+    rows = rows.sort_values([SIC_COL, AREA_COL], kind="stable", ignore_index=True)
+
+    # 4) 加重平均（人口下限前）：全国は産業ごと、都道府県は（都道府県, 産業）ごと
+    national_avg = _group_averages(rows, [SIC_COL])
+    pref_avg = _group_averages(rows, ["pref", SIC_COL])
+
+    # 3) 人口下限。全国順位はここで産業ごとに1回だけ付け、都道府県スコープの行にもそのまま使う
+    kept = rows[rows["population"] >= population_min]
+    kept = _group_ranks(kept, [SIC_COL], NATIONAL_RANK_COLS)
+
+    national = kept.merge(national_avg[[SIC_COL, "est_avg", "emp_avg"]], on=SIC_COL, how="left")
+    national = _group_ranks(national, [SIC_COL], SCOPE_RANK_COLS)
+    national.insert(0, SCOPE_COL, NATIONAL_PREF)
+
+    by_pref = kept.merge(pref_avg[["pref", SIC_COL, "est_avg", "emp_avg"]], on=["pref", SIC_COL], how="left")
+    by_pref = _group_ranks(by_pref, ["pref", SIC_COL], SCOPE_RANK_COLS)
+    by_pref.insert(0, SCOPE_COL, by_pref["pref"])
+
+    out = pd.concat([national, by_pref], ignore_index=True)
+    # 4) 県平均との差
+    out["est_dev"] = out["est_density"] - out["est_avg"]
+    out["emp_dev"] = out["emp_density"] - out["emp_avg"]
+    out = out[[SCOPE_COL, SIC_COL, "sicName", AREA_COL, "areaName"] + BULK_COLUMNS[5:] + [
+        "est_dev", "emp_dev", *SCOPE_RANK_COLS.values(), *NATIONAL_RANK_COLS.values()
+    ]]
+    out = out.sort_values([SCOPE_COL, SIC_COL, SCOPE_RANK_COLS["est_density"]], kind="stable", ignore_index=True)
+
+    averages = pd.concat(
+        [national_avg.assign(**{SCOPE_COL: NATIONAL_PREF}), pref_avg.rename(columns={"pref": SCOPE_COL})],
+        ignore_index=True,
+    )[[SCOPE_COL, SIC_COL, "pop_sum", "est_avg", "emp_avg"]]
+    return BulkTables(rows=out, averages=averages, population_min=population_min)
+
+
+# ======================
+# 産業特化（特化係数）
+# ======================
+# 特化係数を計算できるデータセット（産業が互いに重ならない大分類だけのもの）。
+# 2014 は農林漁業／非農林漁業などの集計区分が重なり、2009 は「総数」を含み産業別の従業者もないため対象外
+LQ_DATASETS = ["2014_level2"]
+LQ_MEASURES = ["establishments", "employees"]
+LQ_BASIS_NATIONAL = "national"  # 全国の産業構成と比べる
+LQ_BASIS_PREF = "pref"  # 所属する都道府県の産業構成と比べる
+
+
+@dataclass(frozen=True)
+class IndustryMatrix:
+    """
+    市区町村（行）× 産業（列）の事業所数・従業者数と、そこから計算した特化係数。データセットごとに1回だけ作る。
+
+    特化係数（LQ）= 地域の産業構成比 ÷ 基準（全国・都道府県）の産業構成比。1 より大きければその産業に特化している。
+    特化度（specialization）= 1/2 × Σ|地域の構成比 − 基準の構成比|（0 なら基準と同じ構成、1 に近いほど偏っている）。
+    欠損・該当行なしは 0 件として扱う。
+    """
+
+    areas: np.ndarray  # 市区町村コード（行の順）
+    area_names: np.ndarray
+    prefs: np.ndarray
+    population: np.ndarray
+    sic_codes: list[str]  # 列の順（総計を除く）
+    sic_names: list[str]
+    counts: dict[str, np.ndarray]  # measure → (地域 × 産業)
+    lq: dict[tuple[str, str], np.ndarray]  # (measure, basis) → (地域 × 産業)
+    specialization: dict[tuple[str, str], np.ndarray]  # (measure, basis) → 地域ごと
+    row_of: dict[str, int]  # 市区町村コード → 行
+
+    def rows_in(self, pref_code: str, population_min: int = 0) -> np.ndarray:
+        selected = self.population >= population_min
+        if pref_code != NATIONAL_PREF:
+            selected &= self.prefs == pref_code
+        return np.flatnonzero(selected)
+
+    def profile(
+        self, area_code: str, measure: str = "employees", basis: str = LQ_BASIS_NATIONAL
+    ) -> pd.DataFrame:
+        """
+        1市区町村の産業別の件数・構成比・特化係数（特化係数の降順）。
+        """
+        i = self.row_of[area_code]
+        counts = self.counts[measure][i]
+        total = counts.sum()
+        share = counts / total if total > 0 else np.full(len(counts), np.nan)
+        out = pd.DataFrame({
+            SIC_COL: self.sic_codes,
+            "sicName": self.sic_names,
+            measure: counts,
+            "share": share,
+            "lq": self.lq[(measure, basis)][i],
+        })
+        return out.sort_values("lq", ascending=False, kind="stable", na_position="last", ignore_index=True)
+
+    def lq_frame(
+        self, rows: np.ndarray, measure: str = "employees", basis: str = LQ_BASIS_NATIONAL
+    ) -> pd.DataFrame:
+        """
+        行（rows_in の結果）× 産業の特化係数の表。列名は産業名、先頭に地域名と特化度。
+        """
+        out = pd.DataFrame(self.lq[(measure, basis)][rows], columns=self.sic_names)
+        out.insert(0, "specialization", self.specialization[(measure, basis)][rows])
+        out.insert(0, "areaName", self.area_names[rows])
+        out.insert(0, AREA_COL, self.areas[rows])
+        return out
+
+
+def _shares(counts: np.ndarray) -> np.ndarray:
+    totals = counts.sum(axis=1, keepdims=True)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(totals > 0, counts / totals, np.nan)
+
+
+def build_industry_matrix(data: LoadedDataset, sic_codes: list[str], sic_names: dict[str, str]) -> IndustryMatrix:
+    """
+    市区町村行（全産業）を1回読み、地域 × 産業の行列に並べて特化係数をまとめて計算する。
+    sic_codes は重なりのない産業（IndustryTree.leaves）を渡す。
+    """
+    rows = read_leaf_rows(data, [AREA_COL, SIC_COL, "areaName", "population", *LQ_MEASURES])
+    sic_codes = list(sic_codes)
+    rows = rows[rows[SIC_COL].isin(sic_codes)]
+    area = rows[AREA_COL].astype(str).to_numpy()
+    area_idx, areas = pd.factorize(area, sort=True)
+    sic_idx = pd.Index(sic_codes).get_indexer(rows[SIC_COL].astype(str))
+
+    first = pd.Series(np.arange(len(area))).groupby(area_idx).first().to_numpy()
+    prefs = np.asarray([a[:2] for a in areas])
+
+    counts, lq, specialization = {}, {}, {}
+    pref_idx, pref_codes = pd.factorize(prefs, sort=True)
+    for measure in LQ_MEASURES:
+        m = np.zeros((len(areas), len(sic_codes)))
+        values = pd.to_numeric(rows[measure], errors="coerce").to_numpy(dtype=np.float64)
+        np.add.at(m, (area_idx, sic_idx), np.nan_to_num(values))
+        counts[measure] = m
+
+        share = _shares(m)
+        national = m.sum(axis=0)
+        national_share = national / national.sum()
+        by_pref = np.zeros((len(pref_codes), len(sic_codes)))
+        np.add.at(by_pref, pref_idx, m)
+        pref_share = _shares(by_pref)[pref_idx]
+
+        for basis, base_share in ((LQ_BASIS_NATIONAL, national_share[None, :]), (LQ_BASIS_PREF, pref_share)):
+            with np.errstate(invalid="ignore", divide="ignore"):
+                lq[(measure, basis)] = np.where(base_share > 0, share / base_share, np.nan)
+            specialization[(measure, basis)] = 0.5 * np.abs(share - base_share).sum(axis=1)
+
+    return IndustryMatrix(
+        areas=np.asarray(areas),
+        area_names=rows["areaName"].astype(str).to_numpy()[first],
+        prefs=prefs,
+        population=rows["population"].to_numpy(dtype=np.float64)[first],
+        sic_codes=sic_codes,
+        sic_names=[sic_names.get(c, c) for c in sic_codes],
+        counts=counts,
+        lq=lq,
+        specialization=specialization,
+        row_of={a: i for i, a in enumerate(areas)},
+    )
+
+
+# ======================
+# 都道府県比較
+# ======================
+# 指標の列 → 比較表の列名の接頭辞
+COMPARE_PREFIX = {"est_density": "est", "emp_density": "emp"}
+# 市区町村の密度のばらつきとして出す分位点
+COMPARE_QUANTILES = {"p25": 0.25, "median": 0.5, "p75": 0.75}
+
+
+@dataclass(frozen=True)
+class PrefComparison:
+    """
+    （データセット, 産業, 人口下限）ごとの全都道府県の比較表。
+
+    table は都道府県ごとに1行で、加重平均（人口下限前。県平均カードと同じ値）と、
+    人口下限後の市区町村の密度のばらつき（地域数・標準偏差・変動係数・分位点）を持つ。
+    """
+
+    table: pd.DataFrame
+    national: WeightedAverage
+    population_min: int
+
+
+def compare_prefs(
+    ranking: IndustryRanking,
+    pref_names: dict[str, str],
+    population_min: int = DEFAULT_POPULATION_MIN,
+) -> PrefComparison:
+    """
+    産業ごとの全国の市区町村行（IndustryRanking）を都道府県で1回 groupby して、
+    47 都道府県ぶんの compute_weighted_avg とばらつきをまとめて計算する。
+    """
+    rows = ranking.rows
+    kept = ranking.population >= population_min
+    frame = pd.DataFrame({
+        "pref": ranking.pref,
+        "population": ranking.population,
+        "establishments": pd.to_numeric(rows["establishments"], errors="coerce").to_numpy(dtype=np.float64),
+        "employees": pd.to_numeric(rows["employees"], errors="coerce").to_numpy(dtype=np.float64),
+        "n_areas": kept.astype(np.int64),
+        # 人口下限で落ちる地域は NaN にして、ばらつきの集計から外す
+        **{
+            COMPARE_PREFIX[col]: np.where(kept, rows[col].to_numpy(dtype=np.float64), np.nan)
+            for col in METRIC_COLS
+        },
+    })
+    metrics = list(COMPARE_PREFIX.values())
+
+    g = frame.groupby("pref", sort=True)
+    sums = g[["population", "establishments", "employees", "n_areas"]].sum()
+    moments = g[metrics].agg(["mean", "std"])
+    quantiles = g[metrics].quantile(list(COMPARE_QUANTILES.values())).unstack()
+
+    pop = sums["population"]
+    has_pop = pop > 0
+    table = pd.DataFrame({
+        "prefName": [pref_names.get(p, p) for p in sums.index],
+        "pop_sum": pop,
+        "est_avg": (sums["establishments"] / pop * 10000).where(has_pop),
+        "emp_avg": (sums["employees"] / pop * 10000).where(has_pop),
+        "n_areas": sums["n_areas"],
+    }, index=sums.index)
+    for m in metrics:
+        table[f"{m}_std"] = moments[(m, "std")]
+        table[f"{m}_cv"] = moments[(m, "std")] / moments[(m, "mean")]
+        for name, q in COMPARE_QUANTILES.items():
+            table[f"{m}_{name}"] = quantiles[(m, q)]
+    table = table.rename_axis("pref").reset_index()
+
+    # 全国：全市区町村はいずれかの都道府県に入るので、都道府県の合計がそのまま全国
+    national = sums[["population", "establishments", "employees"]].sum()
+    if national["population"] > 0:
+        national_avg = WeightedAverage(
+            pop_sum=float(national["population"]),
+            est_avg=float(national["establishments"] / national["population"] * 10000),
+            emp_avg=float(national["employees"] / national["population"] * 10000),
+        )
+    else:
+        national_avg = WeightedAverage(pop_sum=0.0, est_avg=None, emp_avg=None)
+    return PrefComparison(table=table, national=national_avg, population_min=population_min)
+
+
+# ======================
+# 時系列パネル
+# ======================
+TIME_COL = "@time"
+# @time 列を持たないデータセットの調査年
+DATASET_PERIODS = {"2009": "2009"}
+# 同じ地域・産業を年次でつなぐデータセットの組（古い順）。
+# 地域は市区町村コード、産業は産業名（大分類の文字と末尾の括弧書きを除く）で対応づけ、
+# すべての年次にそろう産業だけを残す。コードと産業名は最新のデータセットのものを使う
+PANELS = {
+    "census_divisions": ["2009", "2014_level2"],
+}
+PANEL_LABELS = {
+    "census_divisions": "経済センサス 2009 → 2014（産業大分類）",
+}
+PANEL_MEASURES = ["establishments", "employees"]
+
+_PANEL_NAME_NOISE = re.compile(r"^[A-Z](?:～[A-Z])?\s+|（[^（）]*）$")
+
+
+def _panel_industry_key(name: str) -> str:
+    # "S 公務（他に分類されるものを除く）" と "公務" を同じ産業として扱う
+    return _PANEL_NAME_NOISE.sub("", name).strip()
+
+
+@dataclass(frozen=True)
+class IndustryPanel:
+    """
+    地域 × 産業 × 年次の事業所数・従業者数（PANELS の1組ごとに1回だけ作る）。
+
+    どの年次にもない（合併などでコードが変わった）地域・産業の値は NaN。
+    人口は各データセットのもの（現状はどちらも 2020 年国勢調査）。
+    """
+
+    periods: tuple[str, ...]
+    areas: np.ndarray
+    area_names: np.ndarray
+    prefs: np.ndarray
+    sic_codes: list[str]  # TOTAL_CODE、対応づいた産業、すべての大分類が対応づいた3部門の順
+    sic_names: list[str]
+    code_of: dict[tuple[str, str], str]  # (データセット, sicCode) → パネルの sicCode
+    values: dict[str, np.ndarray]  # measure → (地域 × 産業 × 年次)
+    population: np.ndarray  # (地域 × 年次)
+
+    def changes(
+        self,
+        sic_code: str,
+        start: str,
+        end: str,
+        pref_code: str = NATIONAL_PREF,
+        population_min: int = 0,
+    ) -> pd.DataFrame:
+        """
+        start → end の増減。measure ごとに start / end / diff（増減数）/ pct（増減率）/
+        rel（全国の増減率に対する相対値。データセット間の集計基準の差を打ち消す）と、
+        密度（人口1万人あたり）の start / end / diff。人口下限は end の人口で判定する。
+        """
+        j = self.sic_codes.index(sic_code)
+        i0, i1 = self.periods.index(start), self.periods.index(end)
+        pop0, pop1 = self.population[:, i0], self.population[:, i1]
+
+        out = pd.DataFrame({
+            AREA_COL: self.areas,
+            "areaName": self.area_names,
+            "pref": self.prefs,
+            "population": pop1,
+        })
+        with np.errstate(invalid="ignore", divide="ignore"):
+            for measure in PANEL_MEASURES:
+                v0, v1 = self.values[measure][:, j, i0], self.values[measure][:, j, i1]
+                both = ~np.isnan(v0) & ~np.isnan(v1)
+                national = v1[both].sum() / v0[both].sum() if v0[both].sum() > 0 else np.nan
+                ratio = np.where(v0 > 0, v1 / v0, np.nan)
+                out[f"{measure}_start"] = v0
+                out[f"{measure}_end"] = v1
+                out[f"{measure}_diff"] = v1 - v0
+                out[f"{measure}_pct"] = ratio - 1
+                out[f"{measure}_rel"] = ratio / national - 1
+                density = PANEL_DENSITY[measure]
+                out[f"{density}_start"] = v0 / pop0 * 10000
+                out[f"{density}_end"] = v1 / pop1 * 10000
+                out[f"{density}_diff"] = out[f"{density}_end"] - out[f"{density}_start"]
+
+        keep = pop1 >= population_min
+        if pref_code != NATIONAL_PREF:
+            keep &= self.prefs == pref_code
+        return out[keep].reset_index(drop=True)
+
+
+# 件数の列 → 密度の列
+PANEL_DENSITY = {"establishments": "est_density", "employees": "emp_density"}
+
+
+def build_industry_panel(members: list[tuple[str, LoadedDataset, DatasetOptions]]) -> IndustryPanel:
+    """
+    データセットごとの市区町村行を1つの表に積み、factorize した位置で (地域 × 産業 × 年次) の配列に並べる。
+    """
+    # 産業名 → 最新のデータセットのコード（すべてのデータセットにある産業だけ）
+    keyed = [
+        {_panel_industry_key(options.sic_names[c]): c for c in options.industries.leaves}
+        for _, _, options in members
+    ]
+    latest = keyed[-1]
+    common = [k for k in latest if all(k in m for m in keyed)]
+    sic_codes = [TOTAL_CODE] + [latest[k] for k in common]
+    sic_names = [members[-1][2].sic_names[c] for c in sic_codes]
+    code_of = {}
+    for (key, _, _), m in zip(members, keyed):
+        code_of[(key, TOTAL_CODE)] = TOTAL_CODE
+        code_of.update({(key, m[k]): latest[k] for k in common})
+
+    frames = []
+    for key, data, _ in members:
+        available = data.partitioned.schema.names if data.partitioned is not None else data.base.columns
+        columns = [AREA_COL, SIC_COL, "areaName", "population", *PANEL_MEASURES]
+        rows = read_leaf_rows(data, columns + ([TIME_COL] if TIME_COL in available else []))
+        sic = rows[SIC_COL].astype(str).map(lambda c, key=key: code_of.get((key, c)))
+        frame = pd.DataFrame({
+            AREA_COL: rows[AREA_COL].astype(str).to_numpy(),
+            "areaName": rows["areaName"].astype(str).to_numpy(),
+            SIC_COL: sic.to_numpy(),
+            "period": rows[TIME_COL].astype(str).str[:4].to_numpy() if TIME_COL in rows.columns else DATASET_PERIODS[key],
+            "population": rows["population"].to_numpy(dtype=np.float64),
+            **{m: pd.to_numeric(rows[m], errors="coerce").to_numpy(dtype=np.float64) for m in PANEL_MEASURES},
+        })
+        frames.append(frame[frame[SIC_COL].notna()])
+    panel = pd.concat(frames, ignore_index=True)
+
+    area_idx, areas = pd.factorize(panel[AREA_COL], sort=True)
+    period_idx, periods = pd.factorize(panel["period"], sort=True)
+    sic_idx = pd.Index(sic_codes).get_indexer(panel[SIC_COL])
+    shape = (len(areas), len(sic_codes), len(periods))
+
+    values = {}
+    for measure in PANEL_MEASURES:
+        cube = np.full(shape, np.nan)
+        cube[area_idx, sic_idx, period_idx] = panel[measure].to_numpy()
+        values[measure] = cube
+
+    # 3部門：最新のデータセットの IndustryTree で、大分類がすべて対応づいた部門だけ産業の軸で合算する
+    latest_key, _, latest_options = members[-1]
+    tree = latest_options.industries
+    for sector in tree.codes_at(INDUSTRY_LEVEL_SECTOR):
+        children = tree.children[sector]
+        if not all(c in sic_codes for c in children):
+            continue
+        positions = [sic_codes.index(c) for c in children]
+        for measure in PANEL_MEASURES:
+            # 行のない産業は 0 件（read_base の合算と同じ）。すべてない地域・年次だけ NaN
+            part = values[measure][:, positions, :]
+            rollup = np.where(np.isnan(part).all(axis=1), np.nan, np.nansum(part, axis=1))[:, None, :]
+            values[measure] = np.concatenate([values[measure], rollup], axis=1)
+        sic_codes.append(sector)
+        sic_names.append(tree.names[sector])
+        code_of[(latest_key, sector)] = sector
+    population = np.full((len(areas), len(periods)), np.nan)
+    population[area_idx, period_idx] = panel["population"].to_numpy()
+    # 地域名は新しい年次のもの（行は年次の古い順に積んである）
+    area_names = panel["areaName"].groupby(area_idx).last().to_numpy()
+
+    return IndustryPanel(
+        periods=tuple(periods),
+        areas=np.asarray(areas),
+        area_names=area_names,
+        prefs=np.asarray([a[:2] for a in areas]),
+        sic_codes=sic_codes,
+        sic_names=sic_names,
+        code_of=code_of,
+        values=values,
+        population=population,
+    )
+
+
+# ======================
+# エンジン
+# ======================
+def _cached(cache: QueryCache, key, compute, stage: str, timings: StageTimings):
+    if not timings.enabled:
+        return cache.get_or_compute(key, compute)
+
+    computed = False
+
+    def compute_once():
+        nonlocal computed
+        computed = True
+        return compute()
+
+    with timings.stage(stage):
+        value = cache.get_or_compute(key, compute_once)
+    timings.cache(stage, hit=not computed)
+    return value
+
+
+def _sliced_frame_nbytes(df: pd.DataFrame) -> int:
+    # 行を切り出した DataFrame の category 列は、元（IndustryRanking.rows）と辞書（categories）を共有するので符号だけ数える
+    total = int(df.index.memory_usage(deep=True))
+    for col in df.columns:
+        s = df[col]
+        if isinstance(s.dtype, pd.CategoricalDtype):
+            total += s.cat.codes.nbytes
+        else:
+            total += int(s.memory_usage(index=False, deep=True))
+    return total
+
+
+def result_nbytes(value) -> int:
+    """
+    キャッシュする集計結果が自分で持つ DataFrame・配列のバイト数。
+    他の段の結果（ScopeResult.ranking・QueryResult.scope）は、その段のキャッシュで数えるのでここでは数えない。
+    """
+    frame_nbytes = frame_memory if isinstance(value, (IndustryRanking, IndustryMatrix)) else _sliced_frame_nbytes
+    total = 0
+    for f in fields(value):
+        v = getattr(value, f.name)
+        if isinstance(v, pd.DataFrame):
+            total += frame_nbytes(v)
+        elif isinstance(v, np.ndarray):
+            total += v.nbytes
+        elif isinstance(v, dict):
+            total += sum(a.nbytes for a in v.values() if isinstance(a, np.ndarray))
+    return total
+
+
+@dataclass(frozen=True)
+class DatasetCaches:
+    """
+    1つのデータセットの集計キャッシュ（産業の段・スコープ×産業の段・人口下限の段・都道府県比較・特化係数）。
+
+    データセットごとに分けておくと、別のデータセットのウォームアップや問い合わせに追い出されず、
+    レジストリがデータセットを手放すときにまとめて捨てられる。nbytes はメモリ上限に数える。
+    """
+
+    ranking: QueryCache  # 産業 → IndustryRanking
+    scope: QueryCache  # （都道府県, 産業） → ScopeResult
+    result: QueryCache  # Query → QueryResult
+    compare: QueryCache  # （産業, 人口下限） → PrefComparison
+    matrix: QueryCache  # None → IndustryMatrix
+
+    def all(self) -> dict[str, QueryCache]:
+        return {
+            "ranking": self.ranking,
+            "scope": self.scope,
+            "result": self.result,
+            "compare": self.compare,
+            "matrix": self.matrix,
+        }
+
+    @property
+    def nbytes(self) -> int:
+        return sum(cache.nbytes for cache in self.all().values())
+
+
+def merge_cache_stats(stats: list[dict]) -> dict:
+    """
+    QueryCache.stats を足し合わせる（ヒット率は合計から計算し直す）。
+    """
+    out = {k: sum(s[k] for s in stats) for k in ("size", "maxsize", "hits", "misses", "evictions", "nbytes")}
+    total = out["hits"] + out["misses"]
+    out["hit_rate"] = out["hits"] / total if total else 0.0
+    return out
+
+
+class DensityEngine:
+    """
+    データセットのレジストリと集計キャッシュを持ち、Query → QueryResult を返す。
+
+    1プロセスに1つ作って全セッション（全スレッド）で共有する。結果は読み取り専用として扱うこと。
+    キャッシュは産業の段・スコープ×産業の段・人口下限の段を別々に（データセットごとに）持ち、
+    都道府県やスライダーを動かしても産業ごとの並びは再利用する。
+    """
+
+    def __init__(
+        self,
+        paths: dict[str, str] | None = None,
+        memory_budget_mb: int = MEMORY_BUDGET_MB,
+        compact: bool = COMPACT_DTYPES,
+        cache_size: int = QUERY_CACHE_SIZE,
+        cache_ttl: float | None = QUERY_CACHE_TTL,
+    ):
+        self.registry = DatasetRegistry(
+            paths if paths is not None else DATASET_PATHS,
+            memory_budget=memory_budget_mb * 1024 * 1024,
+            compact=compact,
+            cache_usage=self._cache_usage,
+            on_evict=self._drop_caches,
+        )
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self._dataset_caches: dict[str, DatasetCaches] = {}
+        self._caches_lock = threading.Lock()
+        self.options_cache = QueryCache(maxsize=len(self.registry.paths), ttl=cache_ttl)
+        self.panel_cache = QueryCache(maxsize=len(PANELS), ttl=cache_ttl)
+
+    @property
+    def datasets(self) -> list[str]:
+        return list(self.registry.paths)
+
+    def dataset(self, dataset: str, timings: StageTimings = NO_TIMINGS) -> LoadedDataset:
+        with timings.stage("load"):
+            return self.registry.get(dataset)
+
+    def load_base(self, dataset: str) -> pd.DataFrame:
+        """
+        ベースデータ（分割データがあるときは総計の行だけのカタログ。LoadedDataset を参照）。
+        """
+        return self.dataset(dataset).base
+
+    def caches(self, dataset: str) -> DatasetCaches:
+        """
+        dataset の集計キャッシュ（初回に作る）。件数上限は cache_size と、
+        ウォームアップの全組み合わせ（全国＋都道府県 × 総計＋産業）の大きいほう。
+        """
+        caches = self._dataset_caches.get(dataset)
+        if caches is not None:
+            return caches
+        options = self.options(dataset)
+        n_sics = len(options.sic_codes)
+        n_scopes = len(options.pref_codes) * n_sics
+        with self._caches_lock:
+            if dataset not in self._dataset_caches:
+                self._dataset_caches[dataset] = DatasetCaches(
+                    ranking=QueryCache(maxsize=max(self.cache_size, n_sics), ttl=self.cache_ttl, sizeof=result_nbytes),
+                    scope=QueryCache(maxsize=max(self.cache_size, n_scopes), ttl=self.cache_ttl, sizeof=result_nbytes),
+                    result=QueryCache(maxsize=max(self.cache_size, n_scopes), ttl=self.cache_ttl, sizeof=result_nbytes),
+                    compare=QueryCache(maxsize=self.cache_size, ttl=self.cache_ttl, sizeof=result_nbytes),
+                    matrix=QueryCache(maxsize=1, ttl=self.cache_ttl, sizeof=result_nbytes),
+                )
+            return self._dataset_caches[dataset]
+
+    def _cache_usage(self, dataset: str) -> int:
+        caches = self._dataset_caches.get(dataset)
+        return caches.nbytes if caches is not None else 0
+
+    def _drop_caches(self, dataset: str) -> None:
+        # レジストリが dataset を手放したとき：そのデータセットから作ったキャッシュをすべて捨てる
+        # （集計中のセッションが持っている結果はそのセッションが終わるまで残る）
+        with self._caches_lock:
+            self._dataset_caches.pop(dataset, None)
+        self.options_cache.discard(dataset)
+        for key in self.panel_cache.keys():
+            if dataset in PANELS[key]:
+                self.panel_cache.discard(key)
+
+    @property
+    def memory_usage(self) -> int:
+        """
+        読み込み済みデータセットと集計キャッシュのバイト数（MEMORY_BUDGET_MB と比べる値。パネルは含まない）。
+        """
+        return self.registry.memory_usage
+
+    def options(self, dataset: str, timings: StageTimings = NO_TIMINGS) -> DatasetOptions:
+        """
+        都道府県・産業の選択肢と産業の階層（データセットごとにキャッシュ）。
+        """
+
+        def compute():
+            data = self.dataset(dataset)
+            pref_list, pref_name_map = build_pref_maps(data.hierarchy)
+            tree = data.industries
+            sic_codes = tree.codes()
+            return DatasetOptions(
+                pref_codes=[NATIONAL_PREF] + pref_list,
+                pref_names=pref_name_map,
+                sic_codes=sic_codes,
+                sic_names={c: tree.names[c] for c in sic_codes},
+                industries=tree,
+            )
+
+        return _cached(self.options_cache, dataset, compute, "options", timings)
+
+    def run(self, query: Query, timings: StageTimings = NO_TIMINGS) -> QueryResult:
+        """
+        Query → 集計結果。結果は全セッションで共有する読み取り専用。
+        timings を渡すと段ごとの所要時間とキャッシュのヒット・ミスを記録する。
+        """
+        caches = self.caches(query.dataset)
+        ranking = self._ranking(query, timings)
+        scope = _cached(
+            caches.scope,
+            (query.pref_code, query.sic_code),
+            lambda: query_scope(ranking, query.pref_code),
+            "scope", timings,
+        )
+        result = _cached(
+            caches.result,
+            query,
+            lambda: query_result(query, scope),
+            "result", timings,
+        )
+        self.registry.trim()
+        return result
+
+    def _ranking(self, query: Query, timings: StageTimings) -> IndustryRanking:
+        data = self.dataset(query.dataset, timings)
+        return _cached(
+            self.caches(query.dataset).ranking,
+            query.sic_code,
+            lambda: build_industry_ranking(data, query.sic_code),
+            "ranking", timings,
+        )
+
+    def pref_comparison(self, query: Query, timings: StageTimings = NO_TIMINGS) -> PrefComparison:
+        """
+        全都道府県の比較表（query.pref_code は使わない）。（データセット, 産業, 人口下限）ごとにキャッシュし、
+        産業ごとの並びは run と共有する（都道府県を切り替えても絞り込み・産業の適用をやり直さない）。
+        """
+        ranking = self._ranking(query, timings)
+        comparison = _cached(
+            self.caches(query.dataset).compare,
+            (query.sic_code, query.population_min),
+            lambda: compare_prefs(ranking, self.options(query.dataset).pref_names, query.population_min),
+            "compare", timings,
+        )
+        self.registry.trim()
+        return comparison
+
+    def industry_matrix(self, dataset: str, timings: StageTimings = NO_TIMINGS) -> IndustryMatrix:
+        """
+        市区町村 × 産業の特化係数（データセットごとにキャッシュ）。LQ_DATASETS 以外は ValueError。
+        """
+        if dataset not in LQ_DATASETS:
+            raise ValueError(f"特化係数は {', '.join(LQ_DATASETS)} でのみ計算できます: {dataset}")
+
+        def compute():
+            options = self.options(dataset)
+            return build_industry_matrix(self.dataset(dataset), options.industries.leaves, options.sic_names)
+
+        matrix = _cached(self.caches(dataset).matrix, None, compute, "matrix", timings)
+        self.registry.trim()
+        return matrix
+
+    def panels_for(self, dataset: str) -> list[str]:
+        """
+        dataset を含む時系列パネル（PANELS のキー）。
+        """
+        return [key for key, members in PANELS.items() if dataset in members and set(members) <= set(self.datasets)]
+
+    def panel(self, key: str, timings: StageTimings = NO_TIMINGS) -> IndustryPanel:
+        """
+        地域 × 産業 × 年次のパネル（パネルごとにキャッシュ）。構成するデータセットをすべて読む。
+        """
+
+        def compute():
+            members = [(k, self.dataset(k), self.options(k)) for k in PANELS[key]]
+            return build_industry_panel(members)
+
+        return _cached(self.panel_cache, key, compute, "panel", timings)
+
+    def warmup(
+        self,
+        dataset: str,
+        pref_codes: list[str] | None = None,
+        sic_codes: list[str] | None = None,
+        population_min: int = DEFAULT_POPULATION_MIN,
+        max_workers: int = 2,
+    ) -> CacheWarmer:
+        """
+        （都道府県, 産業）の組み合わせをバックグラウンドで先に集計する（呼び出し側は待たない）。
+        None なら全国＋全都道府県 × 総計＋全産業。
+        """
+        options = self.options(dataset)
+        prefs = pref_codes if pref_codes is not None else options.pref_codes
+        sics = sic_codes if sic_codes is not None else options.sic_codes
+
+        # 全国 × 総計（いちばん重い）から順に
+        tasks = [
+            (lambda p=p, c=c: self.run(Query(dataset, p, c, population_min)))
+            for p in prefs
+            for c in sics
+        ]
+        if dataset in LQ_DATASETS:
+            tasks.append(lambda: self.industry_matrix(dataset))
+        tasks.extend((lambda key=key: self.panel(key)) for key in self.panels_for(dataset))
+        return CacheWarmer(tasks, max_workers=max_workers)
+
+    def cache_stats(self) -> dict[str, dict]:
+        """
+        段ごとのキャッシュの統計（データセットごとのキャッシュは全データセットの合計）。
+        """
+        per_dataset = [c.all() for c in list(self._dataset_caches.values())]
+        stats = {
+            stage: merge_cache_stats([c[stage].stats() for c in per_dataset])
+            for stage in ("ranking", "scope", "result", "matrix")
+        }
+        stats["options"] = self.options_cache.stats()
+        stats["compare"] = merge_cache_stats([c["compare"].stats() for c in per_dataset])
+        stats["panel"] = self.panel_cache.stats()
+        return stats
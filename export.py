@@ -0,0 +1,118 @@
+"""
+全都道府県 × 全産業のランキングを一括でファイルに書き出す。
+
+    python export.py                                  # 全データセット → exports/<dataset>/（parquet）
+    python export.py --datasets 2014_level2 --format csv --workers 4
+
+集計は engine.compute_all_tables で1回の groupby にまとめて行い（クエリごとの絞り込みはしない）、
+書き出しはスコープ（全国・都道府県）単位に分けて、--workers を付けるとプロセスプールで並列に行う。
+
+出力：
+    exports/<dataset>/averages.{parquet,csv}                      スコープ × 産業の人口合計と加重平均
+    exports/<dataset>/rankings/scope=XX/part-0.parquet           parquet：スコープごとに1ファイル
+    exports/<dataset>/rankings/scope=XX/sicCode=YYY.csv          csv：スコープ × 産業ごとに1ファイル
+"""
+import argparse
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from dataset import SIC_COL, build_area_hierarchy, read_base
+from engine import DATASET_PATHS, DEFAULT_POPULATION_MIN, SCOPE_COL, compute_all_tables
+
+OUTPUT_DIR = "exports"
+FORMAT_PARQUET = "parquet"
+FORMAT_CSV = "csv"
+# Excel でそのまま開けるように BOM つき
+CSV_ENCODING = "utf-8-sig"
+
+
+def write_scope(scope_dir: str, rows: pd.DataFrame, fmt: str) -> int:
+    """
+    1スコープ分の行を書き出し、書いたファイル数を返す（プロセスプールからも呼ぶ）。
+    """
+    os.makedirs(scope_dir, exist_ok=True)
+    rows = rows.drop(columns=SCOPE_COL)
+    if fmt == FORMAT_PARQUET:
+        rows.to_parquet(os.path.join(scope_dir, "part-0.parquet"), index=False)
+        return 1
+
+    n_files = 0
+    for sic_code, d in rows.groupby(SIC_COL, sort=False):
+        d.to_csv(os.path.join(scope_dir, f"{SIC_COL}={sic_code}.csv"), index=False, encoding=CSV_ENCODING)
+        n_files += 1
+    return n_files
+
+
+def export_dataset(
+    key: str,
+    out_dir: str = OUTPUT_DIR,
+    fmt: str = FORMAT_PARQUET,
+    population_min: int = DEFAULT_POPULATION_MIN,
+    workers: int = 1,
+) -> dict:
+    t0 = time.perf_counter()
+    base = read_base(DATASET_PATHS[key])
+    tables = compute_all_tables(base, build_area_hierarchy(base), population_min=population_min)
+    t_compute = time.perf_counter() - t0
+
+    root = os.path.join(out_dir, key)
+    # 前回の出力（なくなったスコープ・産業のファイル）を残さない
+    shutil.rmtree(root, ignore_errors=True)
+    os.makedirs(root)
+    averages_path = os.path.join(root, f"averages.{fmt}")
+    if fmt == FORMAT_PARQUET:
+        tables.averages.to_parquet(averages_path, index=False)
+    else:
+        tables.averages.to_csv(averages_path, index=False, encoding=CSV_ENCODING)
+
+    scopes = [
+        (os.path.join(root, "rankings", f"{SCOPE_COL}={scope}"), rows, fmt)
+        for scope, rows in tables.rows.groupby(SCOPE_COL, sort=True)
+    ]
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            n_files = sum(pool.map(write_scope, *zip(*scopes)))
+    else:
+        n_files = sum(write_scope(*args) for args in scopes)
+
+    return {
+        "dataset": key,
+        "root": root,
+        "rows": len(tables.rows),
+        "scopes": len(scopes),
+        "pairs": len(tables.averages),
+        "files": n_files + 1,
+        "compute_s": t_compute,
+        "total_s": time.perf_counter() - t0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="全都道府県 × 全産業のランキングを一括で書き出す")
+    parser.add_argument("--datasets", nargs="+", choices=list(DATASET_PATHS), help="既定は全データセット")
+    parser.add_argument("--out", default=OUTPUT_DIR, help=f"出力先（既定は {OUTPUT_DIR}/）")
+    parser.add_argument("--format", choices=[FORMAT_PARQUET, FORMAT_CSV], default=FORMAT_PARQUET)
+    parser.add_argument("--population-min", type=int, default=DEFAULT_POPULATION_MIN)
+    parser.add_argument("--workers", type=int, default=1, help="書き出しに使うプロセス数")
+    args = parser.parse_args()
+
+    for key in args.datasets or list(DATASET_PATHS):
+        r = export_dataset(
+            key,
+            out_dir=args.out,
+            fmt=args.format,
+            population_min=args.population_min,
+            workers=args.workers,
+        )
+        print(
+            f"{key} -> {r['root']}: {r['pairs']:,} (scope, sicCode) / {r['rows']:,} rows / "
+            f"{r['files']:,} files (compute {r['compute_s']:.2f}s, total {r['total_s']:.2f}s)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,524 @@
+"""
+e-Stat の経済センサス・国勢調査の CSV から、アプリがそのまま読めるベースデータ（parquet）を作る。
+
+    python ingest.py --census ec_2014_level2.csv --population pop_2020.csv \
+        --population-where cat01_code=0 --out data/base_2014_ec_2020_pop_level2.parquet
+    python ingest.py --census ec_2014_1.csv ec_2014_2.csv --population pop_2020.csv --encoding cp932 ...
+
+CSV は e-Stat API の統計データ CSV（getSimpleStatsData、列指向）の形を想定する。
+"xxx_code" 列のすぐ右の列がその名称（"cat01_code","産業分類","area_code","地域",...）で、値は value 列。
+経済センサスは表章項目（tab_code）の「事業所数」「従業者数」を列に、cat01_code を sicCode にする。
+"-"・"x"（秘匿）・"…" などの数値でない値は欠損にする。time_code 列が無い CSV は @time 列なしで書く（2009 と同じ）。
+
+経済センサスは --chunksize 行ずつ読み、3段で処理するので、全国の中分類（level 3）でもメモリは
+「1チャンク」か「1産業分（地域数 × 年次）＋ row group 1つ分」までしか使わない。
+    1. 読み込み：チャンクごとにコードを正規化し、sicCode ごとの一時ファイルに書き出す
+    2. 組み立て：sicCode の順に1産業ずつ読み、事業所数・従業者数を列に並べ、人口・密度・pref・leaf を付ける。
+       総計・3部門の行は読みながら合算し、最後に書く（read_base の rollup_industries と同じ値）
+    3. 仕上げ：全件の値の範囲から compact_frame と同じ省メモリ dtype を決め、
+       sicCode → pref → area 順・row group ごとに sicCode の範囲がまとまった parquet を書く（統計情報つき）
+
+出力には INGESTED_KEY の目印と形式の版（dataset.INGEST_FORMAT）が付き、read_base は版が一致すれば
+キーの正規化も合算も dtype 変換もせずにそのまま読む（版が違えば ValueError）。
+"""
+import argparse
+import json
+import os
+import resource
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from compact_dtypes import COUNT_COLS, DENSITY_COLS, KEY_COLS, count_dtype
+from dataset import (
+    AREA_COL,
+    INGEST_FORMAT,
+    INGESTED_KEY,
+    LEAF_COL,
+    PREF_COL,
+    SIC_COL,
+    TOTAL_CODE,
+    TOTAL_NAME,
+    INDUSTRY_LEVEL_SECTOR,
+    _sum_by_area,
+    build_area_hierarchy,
+    build_industry_tree,
+)
+
+TIME_COL = "@time"
+MEASURE_COL = "measure"
+VALUE_COL = "value"
+
+CHUNK_ROWS = 200_000
+# 1つの row group の目安の行数。産業（約 1,900 地域）の途中では切らない。
+# 全件読み（アプリ起動）では大きいほど速く、sicCode の条件では小さいほど読み飛ばせる
+ROW_GROUP_ROWS = 32_768
+
+# e-Stat の統計データ CSV の列
+ESTAT_AREA_COL = "area_code"
+ESTAT_TIME_COL = "time_code"
+ESTAT_VALUE_COL = "value"
+DEFAULT_INDUSTRY_COL = "cat01_code"
+DEFAULT_MEASURE_COL = "tab_code"
+# 表章項目の名称 → 列名
+MEASURE_LABELS = {"事業所数": "establishments", "従業者数": "employees"}
+MEASURES = list(MEASURE_LABELS.values())
+
+# 出力の列順（data/ の既存ファイルと同じ順に pref・leaf を足す）
+OUTPUT_COLUMNS = [
+    AREA_COL, SIC_COL, TIME_COL, "establishments", "employees", "sicName",
+    "population", "areaName", "est_density", "emp_density", PREF_COL, LEAF_COL,
+]
+SORT_COLUMNS = [SIC_COL, PREF_COL, AREA_COL, TIME_COL]
+
+# 組み立て段の一時ファイルのスキーマ（産業ごとに書くので型を固定する）
+_STAGE_SCHEMA = pa.schema([
+    (AREA_COL, pa.string()),
+    (SIC_COL, pa.string()),
+    (TIME_COL, pa.string()),
+    ("establishments", pa.float64()),
+    ("employees", pa.float64()),
+    ("sicName", pa.string()),
+    ("population", pa.float64()),
+    ("areaName", pa.string()),
+    ("est_density", pa.float64()),
+    ("emp_density", pa.float64()),
+    (PREF_COL, pa.string()),
+    (LEAF_COL, pa.bool_()),
+])
+_SPILL_SCHEMA = pa.schema([
+    (AREA_COL, pa.string()),
+    (TIME_COL, pa.string()),
+    (MEASURE_COL, pa.string()),
+    (VALUE_COL, pa.float64()),
+])
+
+
+def _label_col(columns: list[str], code_col: str) -> str:
+    # e-Stat の CSV は "xxx_code" の右隣がその名称
+    if code_col not in columns or columns.index(code_col) + 1 >= len(columns):
+        raise ValueError(f"列 {code_col} とその名称の列が見つからない（列：{columns}）")
+    return columns[columns.index(code_col) + 1]
+
+
+def _parse_where(items: list[str] | None) -> dict[str, str]:
+    out = {}
+    for item in items or []:
+        col, sep, value = item.partition("=")
+        if not sep:
+            raise ValueError(f"COL=VALUE の形で指定する：{item}")
+        out[col.strip()] = value.strip()
+    return out
+
+
+def _read_chunks(path: str, columns: list[str], where: dict[str, str], encoding: str, chunksize: int):
+    """
+    CSV を文字列のまま chunksize 行ずつ読み、where（列 = 値）で絞ったチャンクを返す。
+    """
+    usecols = list(dict.fromkeys(columns + list(where)))
+    for chunk in pd.read_csv(
+        path, usecols=usecols, dtype=str, keep_default_na=False, encoding=encoding, chunksize=chunksize
+    ):
+        for col, value in where.items():
+            chunk = chunk[chunk[col].str.strip() == value]
+        yield chunk
+
+
+def _normalize_area(s: pd.Series) -> pd.Series:
+    return s.str.strip().str.zfill(5)
+
+
+def _to_number(s: pd.Series) -> pd.Series:
+    return pd.to_numeric(s.str.strip().str.replace(",", "", regex=False), errors="coerce")
+
+
+# ======================
+# 人口（国勢調査）
+# ======================
+def read_population(
+    path: str, where: dict[str, str], encoding: str = "utf-8", chunksize: int = CHUNK_ROWS
+) -> pd.Series:
+    """
+    地域コード → 人口。国勢調査の表は地域数 × 男女などの行なので、where で地域ごとに1行に絞る。
+    """
+    columns = list(pd.read_csv(path, nrows=0, encoding=encoding).columns)
+    _label_col(columns, ESTAT_AREA_COL)
+    parts = [
+        pd.Series(_to_number(c[ESTAT_VALUE_COL]).to_numpy(), index=_normalize_area(c[ESTAT_AREA_COL]))
+        for c in _read_chunks(path, [ESTAT_AREA_COL, ESTAT_VALUE_COL], where, encoding, chunksize)
+    ]
+    population = pd.concat(parts) if parts else pd.Series(dtype=float)
+    duplicated = population.index[population.index.duplicated()].unique()
+    if len(duplicated):
+        raise ValueError(
+            f"{path}: 地域ごとに1行になっていない（{', '.join(duplicated[:5])} など）。"
+            "--population-where で男女・年齢などの総数に絞る"
+        )
+    return population
+
+
+# ======================
+# 1. 読み込み：sicCode ごとの一時ファイルへ
+# ======================
+class _Spill:
+    """
+    経済センサスを読みながら、縦持ち（地域・年次・項目・値）の行を sicCode ごとのディレクトリに書き出す。
+    あわせて産業名・地域名を集める（どちらも数千件までなのでメモリに持つ）。
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.n_chunks = 0
+        self.rows = 0
+        self.sic_names: dict[str, str] = {}
+        self.area_names: dict[str, str] = {}
+
+    def add(self, chunk: pd.DataFrame, industry_col: str, industry_label: str, measure_label: str, area_label: str):
+        measure = chunk[measure_label].str.strip().map(MEASURE_LABELS)
+        keep = measure.notna()
+        chunk, measure = chunk[keep], measure[keep]
+        if chunk.empty:
+            return
+        sic = chunk[industry_col].str.strip()
+        area = _normalize_area(chunk[ESTAT_AREA_COL])
+        first = ~sic.duplicated()
+        self.sic_names.update(zip(sic[first].tolist(), chunk[industry_label][first].str.strip().tolist()))
+        first = ~area.duplicated()
+        self.area_names.update(zip(area[first].tolist(), chunk[area_label][first].str.strip().tolist()))
+
+        long = pd.DataFrame({
+            AREA_COL: area.to_numpy(),
+            # 年次の無い CSV は "" の1年次として扱い、書き出すときに列ごと落とす
+            TIME_COL: chunk[ESTAT_TIME_COL].str.strip().to_numpy() if ESTAT_TIME_COL in chunk.columns else "",
+            MEASURE_COL: measure.to_numpy(),
+            VALUE_COL: _to_number(chunk[ESTAT_VALUE_COL]).to_numpy(),
+        })
+        # 同じ sicCode の行を続けてから切り分ける（チャンクごとに sicCode ごと1ファイル）
+        codes = sic.to_numpy()
+        order = np.argsort(codes, kind="stable")
+        codes = codes[order]
+        table = pa.Table.from_pandas(long.iloc[order], schema=_SPILL_SCHEMA, preserve_index=False)
+        starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+        stops = np.r_[starts[1:], len(codes)]
+        for start, stop in zip(starts.tolist(), stops.tolist()):
+            part_dir = os.path.join(self.root, f"{SIC_COL}={codes[start]}")
+            os.makedirs(part_dir, exist_ok=True)
+            pq.write_table(table.slice(start, stop - start), os.path.join(part_dir, f"chunk-{self.n_chunks}.parquet"))
+        self.n_chunks += 1
+        self.rows += len(long)
+
+    def read(self, sic_code: str) -> pd.DataFrame:
+        return pq.read_table(os.path.join(self.root, f"{SIC_COL}={sic_code}"), schema=_SPILL_SCHEMA).to_pandas()
+
+
+# ======================
+# 2. 組み立て：1産業ずつ横持ちにする
+# ======================
+def _assemble(
+    long: pd.DataFrame, sic_code: str, sic_name: str, area_names: dict, population: pd.Series, leaf_set: set
+) -> pd.DataFrame:
+    try:
+        wide = long.pivot(index=[AREA_COL, TIME_COL], columns=MEASURE_COL, values=VALUE_COL)
+    except ValueError as e:
+        raise ValueError(
+            f"{SIC_COL}={sic_code}: 地域 × 年次 × 項目が1行になっていない。--census-where で絞る"
+        ) from e
+    out = wide.reindex(columns=MEASURES).reset_index()
+    out.columns.name = None
+    out[SIC_COL] = sic_code
+    out["sicName"] = sic_name
+    out["areaName"] = out[AREA_COL].map(area_names)
+    # 人口の表に無い地域は欠損（validate.py の突合で警告になる）
+    out["population"] = out[AREA_COL].map(population).astype(float)
+    return _finish_rows(out, leaf_set)
+
+
+def _finish_rows(d: pd.DataFrame, leaf_set: set) -> pd.DataFrame:
+    d["est_density"] = d["establishments"] / d["population"] * 10000
+    d["emp_density"] = d["employees"] / d["population"] * 10000
+    d[PREF_COL] = d[AREA_COL].str[:2]
+    d[LEAF_COL] = d[AREA_COL].isin(leaf_set).to_numpy() & (d["population"] > 0).to_numpy()
+    return d.sort_values([PREF_COL, AREA_COL, TIME_COL], kind="stable", ignore_index=True)[OUTPUT_COLUMNS]
+
+
+class _Rollups:
+    """
+    総計・3部門を、産業を1つずつ読みながら合算する（rollup_industries と同じ規則）。
+    持つのは地域数 × 年次 × 上位の産業数の行だけ。
+    """
+
+    KEYS = [AREA_COL, "areaName", TIME_COL, SIC_COL]
+
+    def __init__(self, tree):
+        self.tree = tree
+        self.sector_of = {
+            code: tree.parent[code]
+            for code in tree.leaves
+            if tree.level[tree.parent[code]] == INDUSTRY_LEVEL_SECTOR
+        }
+        self.total_from = {tree.total_alias} if tree.total_alias is not None else set(tree.leaves)
+        self.running: pd.DataFrame | None = None
+
+    def add(self, rows: pd.DataFrame, sic_code: str):
+        parts = []
+        if sic_code in self.total_from:
+            parts.append(rows.assign(**{SIC_COL: TOTAL_CODE}))
+        if sic_code in self.sector_of:
+            parts.append(rows.assign(**{SIC_COL: self.sector_of[sic_code]}))
+        if not parts:
+            return
+        cols = self.KEYS + ["establishments", "employees", "population"]
+        if self.running is not None:
+            parts.append(self.running)
+        self.running = _sum_by_area(pd.concat([p[cols] for p in parts], ignore_index=True), self.KEYS)
+
+    def rows(self, sic_code: str, leaf_set: set) -> pd.DataFrame:
+        d = self.running[self.running[SIC_COL] == sic_code].copy()
+        d["sicName"] = TOTAL_NAME if sic_code == TOTAL_CODE else self.tree.names[sic_code]
+        return _finish_rows(d, leaf_set)
+
+    def codes(self) -> list[str]:
+        if self.running is None:
+            return []
+        return sorted(self.running[SIC_COL].unique())
+
+
+class _Stats:
+    """
+    仕上げの dtype を決めるための、列ごとの値の範囲・欠損の有無と、キー列のカテゴリ。
+    """
+
+    def __init__(self):
+        self.lo = {c: np.inf for c in COUNT_COLS}
+        self.hi = {c: -np.inf for c in COUNT_COLS}
+        self.has_nan = {c: False for c in COUNT_COLS}
+        self.integral = {c: True for c in COUNT_COLS}
+        self.categories: dict[str, set] = {c: set() for c in KEY_COLS}
+
+    def add(self, d: pd.DataFrame):
+        for c in COUNT_COLS:
+            values = d[c].dropna()
+            self.has_nan[c] |= len(values) < len(d)
+            if len(values):
+                self.lo[c] = min(self.lo[c], values.min())
+                self.hi[c] = max(self.hi[c], values.max())
+                self.integral[c] &= bool((values % 1 == 0).all())
+        for c in KEY_COLS:
+            self.categories[c].update(d[c].dropna().unique().tolist())
+
+    def dtypes(self) -> dict[str, np.dtype | None]:
+        out = {}
+        for c in COUNT_COLS:
+            lo, hi = (self.lo[c], self.hi[c]) if self.lo[c] <= self.hi[c] else (np.nan, np.nan)
+            out[c] = count_dtype(lo, hi, self.has_nan[c], self.integral[c])
+        return out
+
+
+# ======================
+# 3. 仕上げ：省メモリ dtype・row group の大きさを揃えて書く
+# ======================
+def _compact_batch(d: pd.DataFrame, stats: _Stats, dtypes: dict) -> pd.DataFrame:
+    # compact_frame と同じ dtype。カテゴリは全件で揃える（row group ごとに変わらない）
+    for c in KEY_COLS:
+        d[c] = pd.Categorical(d[c], categories=sorted(stats.categories[c]))
+    for c in COUNT_COLS:
+        if dtypes[c] is not None:
+            d[c] = d[c].astype(dtypes[c])
+    for c in DENSITY_COLS:
+        d[c] = d[c].astype(np.float32)
+    return d
+
+
+def _write_final(
+    stage_path: str, out_path: str, stats: _Stats, metadata: dict, row_group_rows: int, has_time: bool
+) -> int:
+    """
+    組み立て段の一時ファイル（1産業 = 1 row group）を読み、row_group_rows 行を目安にまとめて書く。
+    """
+    sort_columns = [c for c in SORT_COLUMNS if has_time or c != TIME_COL]
+    dtypes = stats.dtypes()
+    stage = pq.ParquetFile(stage_path)
+    writer = None
+    pending: list[pd.DataFrame] = []
+    n_pending = 0
+    n_groups = 0
+
+    def flush():
+        nonlocal writer, pending, n_pending, n_groups
+        batch = _compact_batch(pd.concat(pending, ignore_index=True), stats, dtypes)
+        if not has_time:
+            batch = batch.drop(columns=TIME_COL)
+        table = pa.Table.from_pandas(batch, preserve_index=False)
+        if writer is None:
+            schema = table.schema.with_metadata({
+                **(table.schema.metadata or {}),
+                INGESTED_KEY: json.dumps(metadata, ensure_ascii=False).encode(),
+            })
+            writer = pq.ParquetWriter(
+                out_path,
+                schema,
+                write_statistics=True,
+                sorting_columns=[pq.SortingColumn(schema.get_field_index(c)) for c in sort_columns],
+            )
+        writer.write_table(table.replace_schema_metadata(writer.schema.metadata), row_group_size=len(table))
+        pending, n_pending = [], 0
+        n_groups += 1
+
+    for i in range(stage.num_row_groups):
+        d = stage.read_row_group(i).to_pandas()
+        if n_pending and n_pending + len(d) > row_group_rows:
+            flush()
+        pending.append(d)
+        n_pending += len(d)
+    if pending:
+        flush()
+    if writer is not None:
+        writer.close()
+    return n_groups
+
+
+# ======================
+# 取り込み全体
+# ======================
+def ingest(
+    census_paths: list[str],
+    population_path: str,
+    out_path: str,
+    census_where: dict[str, str] | None = None,
+    population_where: dict[str, str] | None = None,
+    industry_col: str = DEFAULT_INDUSTRY_COL,
+    measure_col: str = DEFAULT_MEASURE_COL,
+    encoding: str = "utf-8",
+    chunksize: int = CHUNK_ROWS,
+    row_group_rows: int = ROW_GROUP_ROWS,
+) -> dict:
+    t0 = time.perf_counter()
+    census_where = census_where or {}
+    population = read_population(population_path, population_where or {}, encoding, chunksize)
+
+    out_dir = os.path.dirname(os.path.abspath(out_path))
+    os.makedirs(out_dir, exist_ok=True)
+    work = tempfile.mkdtemp(prefix=".ingest-", dir=out_dir)
+    try:
+        spill = _Spill(os.path.join(work, "spill"))
+        has_time = False
+        for path in census_paths:
+            columns = list(pd.read_csv(path, nrows=0, encoding=encoding).columns)
+            labels = {c: _label_col(columns, c) for c in (industry_col, measure_col, ESTAT_AREA_COL)}
+            usecols = [industry_col, measure_col, ESTAT_AREA_COL, ESTAT_VALUE_COL, *labels.values()]
+            if ESTAT_TIME_COL in columns:
+                usecols.append(ESTAT_TIME_COL)
+                has_time = True
+            for chunk in _read_chunks(path, usecols, census_where, encoding, chunksize):
+                spill.add(chunk, industry_col, labels[industry_col], labels[measure_col], labels[ESTAT_AREA_COL])
+        if not spill.sic_names:
+            raise ValueError(f"事業所数・従業者数の行が無い（表章項目 {list(MEASURE_LABELS)}）")
+        t_spill = time.perf_counter() - t0
+
+        # 地域・産業の階層は名前とコードだけで決まる（数千行の表で1回だけ作る）
+        areas = pd.DataFrame({AREA_COL: sorted(spill.area_names)})
+        areas["areaName"] = areas[AREA_COL].map(spill.area_names)
+        areas["population"] = areas[AREA_COL].map(population).astype(float)
+        areas[PREF_COL] = areas[AREA_COL].str[:2]
+        hierarchy = build_area_hierarchy(areas)
+        leaf_set = set(areas[AREA_COL].iloc[hierarchy.leaf_rows])
+        tree = build_industry_tree(
+            pd.DataFrame({SIC_COL: list(spill.sic_names), "sicName": list(spill.sic_names.values())})
+        )
+
+        rollups = _Rollups(tree)
+        stats = _Stats()
+        stage_path = os.path.join(work, "stage.parquet")
+        n_rows = 0
+        with pq.ParquetWriter(stage_path, _STAGE_SCHEMA) as stage:
+
+            def put(d: pd.DataFrame):
+                nonlocal n_rows
+                stats.add(d)
+                stage.write_table(pa.Table.from_pandas(d, schema=_STAGE_SCHEMA, preserve_index=False))
+                n_rows += len(d)
+
+            for sic_code in sorted(spill.sic_names):
+                rows = _assemble(
+                    spill.read(sic_code), sic_code, spill.sic_names[sic_code], spill.area_names, population, leaf_set
+                )
+                rollups.add(rows, sic_code)
+                put(rows)
+            # 上位の産業は "__" で始まるので、sicCode 順でも最後に来る
+            for sic_code in rollups.codes():
+                put(rollups.rows(sic_code, leaf_set))
+        t_assemble = time.perf_counter() - t0 - t_spill
+
+        metadata = {
+            "format": INGEST_FORMAT,
+            "census": [os.path.basename(p) for p in census_paths],
+            "population": os.path.basename(population_path),
+            "census_where": census_where,
+            "population_where": population_where or {},
+            "sort": [c for c in SORT_COLUMNS if has_time or c != TIME_COL],
+        }
+        # 書き終えてから置き換える（読み込み中のアプリに書きかけのファイルを見せない）
+        tmp_out = os.path.join(work, "out.parquet")
+        n_groups = _write_final(stage_path, tmp_out, stats, metadata, row_group_rows, has_time)
+        os.replace(tmp_out, out_path)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+    return {
+        "out": out_path,
+        "input_rows": spill.rows,
+        "rows": n_rows,
+        "sic_codes": len(spill.sic_names),
+        "areas": len(spill.area_names),
+        "row_groups": n_groups,
+        "spill_s": t_spill,
+        "assemble_s": t_assemble,
+        "total_s": time.perf_counter() - t0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="e-Stat の経済センサス・国勢調査の CSV から正規化済みのベースデータ（parquet）を作る"
+    )
+    parser.add_argument("--census", nargs="+", required=True, help="経済センサスの CSV（複数可）")
+    parser.add_argument("--population", required=True, help="国勢調査（人口）の CSV")
+    parser.add_argument("--out", required=True, help="出力する parquet（例：data/base_2014_ec_2020_pop_level2.parquet）")
+    parser.add_argument("--census-where", nargs="*", metavar="COL=VALUE", help="経済センサスの行の絞り込み")
+    parser.add_argument("--population-where", nargs="*", metavar="COL=VALUE", help="人口の行の絞り込み（男女の総数など）")
+    parser.add_argument("--industry-col", default=DEFAULT_INDUSTRY_COL, help="産業分類のコード列")
+    parser.add_argument("--measure-col", default=DEFAULT_MEASURE_COL, help="事業所数・従業者数を分けるコード列")
+    parser.add_argument("--encoding", default="utf-8", help="CSV の文字コード（e-Stat の画面からの CSV は cp932）")
+    parser.add_argument("--chunksize", type=int, default=CHUNK_ROWS, help="1回に読む CSV の行数")
+    parser.add_argument("--row-group-rows", type=int, default=ROW_GROUP_ROWS, help="row group の目安の行数")
+    args = parser.parse_args()
+
+    r = ingest(
+        args.census,
+        args.population,
+        args.out,
+        census_where=_parse_where(args.census_where),
+        population_where=_parse_where(args.population_where),
+        industry_col=args.industry_col,
+        measure_col=args.measure_col,
+        encoding=args.encoding,
+        chunksize=args.chunksize,
+        row_group_rows=args.row_group_rows,
+    )
+    # ru_maxrss は Linux では KB
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(
+        f"{r['out']}: {r['input_rows']:,} input rows -> {r['rows']:,} rows "
+        f"({r['sic_codes']:,} sicCode x {r['areas']:,} areas, {r['row_groups']} row groups) "
+        f"spill {r['spill_s']:.2f}s / assemble {r['assemble_s']:.2f}s / total {r['total_s']:.2f}s, "
+        f"max RSS {max_rss:,.0f} MB"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,481 @@
+"""
+app.py を N セッションで同時に操作する負荷試験。Streamlit の AppTest でヘッドレスに動かし、ローカルだけで完結する。
+
+    python loadtest.py                                   # 1 / 2 / 4 / 8 セッション × 各 30 秒
+    python loadtest.py --sessions 1 4 16 --duration 60 --think 0.5
+    python loadtest.py --compare benchmarks/loadtest-<old>.json --max-slowdown 1.3
+
+各セッションは別スレッドで、都道府県・産業（内訳まで）・人口下限スライダー・指標・タブをランダムに変えては
+再実行し、1回の再実行の所要時間を記録する（--think 秒を平均に間を空ける。0 なら間を空けずに回し続ける）。
+実サーバーと同じく、全セッションが1プロセスの cache_resource（DensityEngine）と GIL を共有する。
+所要時間には AppTest 側の要素ツリーの組み立ても含むので、ブラウザから見た時間の目安（上限寄り）として使う。
+
+同時数ごとにセッションを作り直し、各セッションの最初の実行（計測外）のあとで計測を始める。
+最初の同時数の前に、ウォームアップ（app.py の WARMUP_ENABLED）が終わるのを待つ。--cold を付けると
+同時数ごとに cache_resource を消し、どの同時数も「集計キャッシュが空、ウォームアップ実行中」から測る。
+結果は同時数ごとのスループット（再実行/秒）・所要時間の p50/p90/p95/p99/max・CPU 使用率・RSS で、
+benchmarks/loadtest-<commit>.json に書き出す。--compare で過去の結果と比べ、p95 が --max-slowdown 倍を
+超えて悪化した同時数があれば終了コード 1（デプロイ前の確認用）。
+
+リポジトリ直下で実行する（DATASET_PATHS が相対パス）。
+"""
+import argparse
+import datetime
+import importlib
+import json
+import os
+import platform
+import random
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+from streamlit.logger import set_log_level
+from streamlit.runtime import Runtime
+from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+from streamlit.testing.v1 import AppTest
+from streamlit.testing.v1.util import patch_config_options
+
+from bench_pipeline import git_commit
+from dataset import SIC_COL, build_industry_tree
+from engine import DATASET_PATHS, NATIONAL_PREF
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+OUTPUT_DIR = "benchmarks"
+SESSION_LEVELS = [1, 2, 4, 8]
+DURATION_S = 30.0
+RUN_TIMEOUT_S = 300.0
+SETTLE_TIMEOUT_S = 600.0
+RSS_SAMPLE_S = 0.2
+PERCENTILES = [50, 90, 95, 99]
+
+# app.py の選択欄の見出し・キー
+PREF_LABEL = "都道府県"
+DATASET_LABEL = "データセット"
+METRIC_LABEL = "指標"
+POPULATION_LABEL = "人口下限（ノイズ抑制）"
+TAB_KEY = "view_tab"
+WARMUP_DONE_PREFIX = "集計準備済み"
+
+# 操作の種類と重み（都道府県・産業を変えることが多く、タブはときどき）
+ACTIONS = {
+    "pref": 4,
+    "industry": 4,
+    "population_min": 2,
+    "metric": 1,
+    "tab": 1,
+}
+PREF_CODES = [NATIONAL_PREF] + [f"{i:02d}" for i in range(1, 48)]
+
+
+# ======================
+# AppTest を複数スレッドで回す
+# ======================
+# shared_runtime が差し替える Streamlit 内部の属性（requirements.txt で固定した版で確認済み）
+PATCHED_CLASS_ATTRS = {Runtime: ("_instance", "instance", "exists")}
+PATCHED_MODULE_ATTRS = {
+    "streamlit.testing.v1.app_test": ("ScriptCache",),
+    "streamlit.testing.v1.local_script_runner": ("ScriptCache",),
+}
+
+
+def _check_streamlit_internals():
+    """
+    差し替える内部の属性が無い版の Streamlit なら、動かし始める前に何が無いかを示して止める
+    （無いまま差し替えると、セッションの途中で Runtime が消えて原因のわかりにくい失敗になる）。
+    """
+    missing = [
+        f"{cls.__module__}.{cls.__name__}.{attr}"
+        for cls, attrs in PATCHED_CLASS_ATTRS.items()
+        for attr in attrs
+        if attr not in cls.__dict__
+    ]
+    for module_name, attrs in PATCHED_MODULE_ATTRS.items():
+        module = importlib.import_module(module_name)
+        missing += [f"{module_name}.{attr}" for attr in attrs if not hasattr(module, attr)]
+    if missing:
+        raise RuntimeError(
+            f"Streamlit {st.__version__} には負荷試験が差し替える内部の属性が無い：{', '.join(missing)}。"
+            "requirements.txt で固定した版の Streamlit を入れる"
+        )
+
+
+@contextmanager
+def shared_runtime():
+    """
+    AppTest は1プロセス1セッションの前提で、run() のたびにプロセス全体の Runtime._instance を
+    モックに差し替え、終わると None に戻す。別スレッドで同時に回すと、他のセッションの run() が
+    終わった瞬間に実行中のスクリプトから Runtime が消える。負荷試験のあいだだけ、
+    None のときは最後に見た Runtime（どれかのセッションのモック）を返す。
+
+    また AppTest は run() のたびに ScriptCache を作り直して app.py をコンパイルし直す（3.11 では
+    同時の ast.parse が壊れることもある）。実サーバーと同じく、1つの ScriptCache を全セッションで共有する。
+
+    どちらも Streamlit の非公開の内部を差し替えるので、属性が無ければ始める前に RuntimeError にする。
+    """
+    _check_streamlit_internals()
+    original = Runtime.__dict__["instance"], Runtime.__dict__["exists"]
+    last: list = []
+
+    def instance(cls):
+        if cls._instance is not None:
+            last[:] = [cls._instance]
+            return cls._instance
+        if last:
+            return last[0]
+        raise RuntimeError("Runtime hasn't been created!")
+
+    def exists(cls):
+        return cls._instance is not None or bool(last)
+
+    script_cache = ScriptCache()
+    Runtime.instance = classmethod(instance)
+    Runtime.exists = classmethod(exists)
+    try:
+        # run() ごとの設定の差し替えも入れ子になるので、外側で立てたままにする。
+        # 再実行ごとの非推奨の警告などで出力が埋まらないよう、ログはエラーだけにする
+        with (
+            mock.patch("streamlit.testing.v1.app_test.ScriptCache", return_value=script_cache),
+            mock.patch("streamlit.testing.v1.local_script_runner.ScriptCache", return_value=script_cache),
+            patch_config_options({"global.appTest": True, "logger.level": "error"}),
+        ):
+            set_log_level("error")
+            yield
+    finally:
+        Runtime.instance, Runtime.exists = original
+
+
+def _raw_options(widget, domain) -> list:
+    """
+    format_func で表示名にした選択肢を元の値に戻す（AppTest の select_index は表示名をそのまま値にするため）。
+    """
+    fmt = widget.format_func
+    by_label = {str(fmt(v)): v for v in domain}
+    return [by_label[o] for o in widget.options if o in by_label]
+
+
+def _industry_codes(dataset_key: str) -> list[str]:
+    # 産業の選択欄の値の候補（sicCode・sicName の2列だけ読んで、アプリと同じ IndustryTree を作る）
+    d = pd.read_parquet(DATASET_PATHS[dataset_key], columns=[SIC_COL, "sicName"])
+    d[SIC_COL] = d[SIC_COL].astype(str).str.strip()
+    return build_industry_tree(d).codes()
+
+
+@dataclass(frozen=True)
+class Sample:
+    session: int
+    action: str
+    started: float
+    ms: float
+    error: str | None = None
+
+
+class Session:
+    """
+    1ユーザー分の AppTest。step() でランダムに1つ操作して再実行し、所要時間を返す。
+    """
+
+    def __init__(self, index: int, dataset_key: str, industry_codes: list[str], seed: int, timeout: float):
+        self.index = index
+        self.dataset_key = dataset_key
+        self.industry_codes = industry_codes
+        self.rng = random.Random(seed)
+        self.timeout = timeout
+        self.at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+        self.tabs: list[str] = []
+        self.tab: str | None = None
+
+    def _widget(self, kind: str, label: str):
+        w = next((w for w in getattr(self.at, kind) if w.label == label), None)
+        if w is None:
+            raise LookupError(f"{label} が画面に無い（直前の再実行が途中で止まった）")
+        return w
+
+    def _run(self):
+        if self.tab is not None:
+            # タブの選択は AppTest では保たれないので、再実行のたびに入れ直す
+            self.at.session_state[TAB_KEY] = self.tab
+        self.at.run(timeout=self.timeout)
+
+    def open(self) -> float:
+        t0 = time.perf_counter()
+        self._run()
+        dataset = self._widget("selectbox", DATASET_LABEL)
+        if dataset.value != self.dataset_key:
+            dataset.set_value(self.dataset_key)
+            self._run()
+        self.tabs = [t.label for t in self.at.tabs]
+        return (time.perf_counter() - t0) * 1000
+
+    def warmup_done(self) -> bool:
+        return any(c.value.startswith(WARMUP_DONE_PREFIX) for c in self.at.sidebar.caption)
+
+    def _act(self, action: str):
+        rng = self.rng
+        if action == "pref":
+            w = self._widget("selectbox", PREF_LABEL)
+            w.set_value(rng.choice(_raw_options(w, PREF_CODES)))
+        elif action == "industry":
+            # 総計の選択欄か、いま出ている内訳の選択欄のどれか（深い欄を選ぶとドリルダウン）
+            prefix = f"sic_{self.dataset_key}_"
+            boxes = [w for w in self.at.selectbox if (w.key or "").startswith(prefix)]
+            w = rng.choice(boxes)
+            w.set_value(rng.choice(_raw_options(w, self.industry_codes)))
+        elif action == "population_min":
+            w = self._widget("slider", POPULATION_LABEL)
+            w.set_value(rng.randrange(int(w.min), int(w.max) + 1, int(w.step)))
+        elif action == "metric":
+            w = self._widget("radio", METRIC_LABEL)
+            w.set_value(rng.choice(w.options))
+        elif action == "tab":
+            self.tab = rng.choice(self.tabs)
+
+    def step(self) -> Sample:
+        action = self.rng.choices(list(ACTIONS), weights=list(ACTIONS.values()))[0]
+        started = time.perf_counter()
+        error = None
+        try:
+            self._act(action)
+            self._run()
+            if self.at.exception:
+                error = self.at.exception[0].message
+        except Exception as e:  # タイムアウトなども1件のエラーとして数え、続ける
+            error = f"{type(e).__name__}: {e}"
+        return Sample(self.index, action, started, (time.perf_counter() - started) * 1000, error)
+
+
+# ======================
+# 計測
+# ======================
+def _rss_bytes() -> int:
+    # 現在の RSS（Linux）。/proc が無ければピーク値（ru_maxrss）で代用する
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class RssSampler:
+    """
+    計測中の RSS を一定間隔で読み、開始時・ピーク・終了時を残す。
+    """
+
+    def __init__(self, interval: float = RSS_SAMPLE_S):
+        self.interval = interval
+        self.start = self.peak = self.end = _rss_bytes()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, _rss_bytes())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.end = _rss_bytes()
+        self.peak = max(self.peak, self.end)
+        return False
+
+    def summary(self) -> dict:
+        return {k: round(v / 1e6, 1) for k, v in (("start", self.start), ("peak", self.peak), ("end", self.end))}
+
+
+def _latency(ms: list[float]) -> dict:
+    if not ms:
+        return {"n": 0}
+    a = np.asarray(ms)
+    out = {"n": int(len(a)), "mean": round(float(a.mean()), 1)}
+    out.update({f"p{p}": round(float(np.percentile(a, p)), 1) for p in PERCENTILES})
+    out["max"] = round(float(a.max()), 1)
+    return out
+
+
+def _settle(session: Session, timeout: float):
+    # ウォームアップの進捗はサイドバーに出る。終わるまで同じセッションで再実行する
+    deadline = time.perf_counter() + timeout
+    while not session.warmup_done():
+        if time.perf_counter() > deadline:
+            print(f"  warmup did not finish within {timeout:.0f}s; measuring anyway", file=sys.stderr)
+            return
+        time.sleep(1.0)
+        session._run()
+
+
+def run_level(
+    n_sessions: int,
+    dataset_key: str,
+    industry_codes: list[str],
+    duration: float,
+    think: float,
+    seed: int,
+    timeout: float,
+    cold: bool,
+    settle_timeout: float | None,
+) -> dict:
+    if cold:
+        st.cache_resource.clear()
+
+    # セッションの作成と最初の実行は順に（計測外）
+    sessions = [Session(i, dataset_key, industry_codes, seed * 1000 + i, timeout) for i in range(n_sessions)]
+    open_ms = [s.open() for s in sessions]
+    if settle_timeout:
+        _settle(sessions[0], settle_timeout)
+
+    samples: list[list[Sample]] = [[] for _ in sessions]
+    start = time.perf_counter()
+    deadline = start + duration
+
+    def drive(session: Session, out: list[Sample]):
+        while time.perf_counter() < deadline:
+            out.append(session.step())
+            if think > 0:
+                time.sleep(session.rng.expovariate(1 / think))
+
+    threads = [
+        threading.Thread(target=drive, args=(s, out), name=f"loadtest-{s.index}")
+        for s, out in zip(sessions, samples)
+    ]
+    cpu0 = time.process_time()
+    with RssSampler() as rss:
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpu0
+
+    flat = [x for out in samples for x in out]
+    ok = [x for x in flat if x.error is None]
+    errors = [x for x in flat if x.error is not None]
+    return {
+        "sessions": n_sessions,
+        "reruns": len(flat),
+        "errors": len(errors),
+        "error_examples": sorted({x.error for x in errors})[:5],
+        "elapsed_s": round(elapsed, 2),
+        "throughput_rps": round(len(ok) / elapsed, 2),
+        "latency_ms": _latency([x.ms for x in ok]),
+        "by_action": {a: _latency([x.ms for x in ok if x.action == a]) for a in ACTIONS},
+        "per_session_reruns": [len(out) for out in samples],
+        "open_ms": _latency(open_ms),
+        # プロセス全体（全スレッド）の CPU 時間 / 経過時間。1コア使い切りで 100%
+        "cpu_percent": round(cpu / elapsed * 100, 1),
+        "rss_mb": rss.summary(),
+    }
+
+
+def print_level(r: dict):
+    lat = r["latency_ms"]
+    pct = "  ".join(f"p{p} {lat.get(f'p{p}', float('nan')):>8.1f}" for p in PERCENTILES)
+    print(
+        f"  {r['sessions']:>3} sessions  {r['reruns']:>6,} reruns ({r['errors']} errors)  "
+        f"{r['throughput_rps']:>7.2f} rerun/s  {pct}  max {lat.get('max', float('nan')):>8.1f} ms  "
+        f"CPU {r['cpu_percent']:>5.1f}%  RSS peak {r['rss_mb']['peak']:,.0f} MB"
+    )
+
+
+def compare(old_path: str, new: dict, max_slowdown: float | None) -> bool:
+    """
+    同じ同時数どうしでスループットと p95 を比べる（new / old）。p95 が max_slowdown 倍を超えたら False。
+    """
+    with open(old_path, encoding="utf-8") as f:
+        old = json.load(f)
+    old_levels = {r["sessions"]: r for r in old["levels"]}
+    print(f"\ncompare: {old['meta'].get('commit')} -> {new['meta'].get('commit')}")
+    differ = [k for k in ("dataset", "duration_s", "think_s", "cold", "cpu_count") if old["meta"].get(k) != new["meta"].get(k)]
+    if differ:
+        print(f"  (条件が違う：{', '.join(differ)})")
+    ok = True
+    for r in new["levels"]:
+        o = old_levels.get(r["sessions"])
+        if not o or not o["latency_ms"].get("p95") or not o["throughput_rps"]:
+            continue
+        r95 = r["latency_ms"].get("p95", float("nan")) / o["latency_ms"]["p95"]
+        rtp = r["throughput_rps"] / o["throughput_rps"]
+        flag = ""
+        if max_slowdown is not None and not r95 <= max_slowdown:
+            flag = f"  <- p95 slower than x{max_slowdown}"
+            ok = False
+        print(f"  {r['sessions']:>3} sessions  throughput x{rtp:5.2f}  p95 x{r95:5.2f}{flag}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="app.py を N セッションで同時に操作する負荷試験（AppTest）")
+    parser.add_argument("--sessions", nargs="+", type=int, default=SESSION_LEVELS, help="同時セッション数（複数可）")
+    parser.add_argument("--duration", type=float, default=DURATION_S, help="同時数ごとの計測時間（秒）")
+    parser.add_argument("--think", type=float, default=0.0, help="操作の間隔の平均（秒、指数分布）。0 なら間を空けない")
+    parser.add_argument("--dataset", choices=list(DATASET_PATHS), default=next(iter(DATASET_PATHS)))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=RUN_TIMEOUT_S, help="1回の再実行のタイムアウト（秒）")
+    parser.add_argument("--cold", action="store_true", help="同時数ごとに cache_resource を消して測る")
+    parser.add_argument("--no-settle", action="store_true", help="ウォームアップの終了を待たない")
+    parser.add_argument("--output", help=f"既定は {OUTPUT_DIR}/loadtest-<commit>.json")
+    parser.add_argument("--compare", help="比較する過去の結果 JSON")
+    parser.add_argument("--max-slowdown", type=float, help="--compare で p95 がこの倍率を超えたら終了コード 1")
+    args = parser.parse_args()
+
+    commit = git_commit()
+    result = {
+        "meta": {
+            "commit": commit,
+            "created_at": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "streamlit": st.__version__,
+            "pandas": pd.__version__,
+            "cpu_count": os.cpu_count(),
+            "dataset": args.dataset,
+            "duration_s": args.duration,
+            "think_s": args.think,
+            "seed": args.seed,
+            "cold": args.cold,
+            "actions": ACTIONS,
+        },
+        "levels": [],
+    }
+
+    industry_codes = _industry_codes(args.dataset)
+    print(f"{args.dataset}: sessions {args.sessions}, {args.duration:.0f}s each, think {args.think}s")
+    with shared_runtime():
+        for i, n in enumerate(args.sessions):
+            # 温めた状態で測るときは最初の同時数の前に1回だけ待つ（--cold なら毎回消すので待たない）
+            settle = None if args.no_settle or args.cold or i > 0 else SETTLE_TIMEOUT_S
+            r = run_level(
+                n,
+                args.dataset,
+                industry_codes,
+                duration=args.duration,
+                think=args.think,
+                seed=args.seed + i,
+                timeout=args.timeout,
+                cold=args.cold,
+                settle_timeout=settle,
+            )
+            result["levels"].append(r)
+            print_level(r)
+
+    output = args.output or os.path.join(OUTPUT_DIR, f"loadtest-{commit or 'local'}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"\n-> {output}")
+
+    if args.compare and not compare(args.compare, result, args.max_slowdown):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+import argparse
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+from logging.handlers import RotatingFileHandler
+
+# 構造化ログ（1再実行 = JSON 1行）のロガー名と、ファイルに書くときのローテーション設定
+PERF_LOGGER = "industrial_density.perf"
+PERF_LOG_MAX_BYTES = 5 * 1024 * 1024
+PERF_LOG_BACKUPS = 3
+
+
+class StageTimings:
+    """
+    1回の再実行の段ごとの所要時間（ms）とキャッシュのヒット・ミスを記録する。
+
+        timings = StageTimings()
+        with timings.stage("load"):
+            ...
+        timings.cache("ranking", hit=True)
+
+    同じ段を複数回通ったときは合計する。無効（enabled=False）のときは何もしない。
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.stages: dict[str, float] = {}
+        self.cache_hits: dict[str, bool] = {}
+        self.context: dict[str, object] = {}
+        self.started_at = time.perf_counter()
+
+    @contextmanager
+    def _timed(self, name: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + (time.perf_counter() - t0) * 1000
+
+    def stage(self, name: str):
+        if not self.enabled:
+            return _NO_OP
+        return self._timed(name)
+
+    def cache(self, name: str, hit: bool) -> None:
+        if self.enabled:
+            self.cache_hits[name] = hit
+
+    @property
+    def total_ms(self) -> float:
+        return (time.perf_counter() - self.started_at) * 1000
+
+    def record(self) -> dict:
+        """
+        ログ1行分（stages の合計と、再実行全体の経過時間）。
+        """
+        return {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            **self.context,
+            "stages": {k: round(v, 3) for k, v in self.stages.items()},
+            "cache": dict(self.cache_hits),
+            "total_ms": round(self.total_ms, 3),
+        }
+
+
+class _NoOp:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_OP = _NoOp()
+# 計測しないときに渡す共有インスタンス（stage() は同じ空のコンテキストを返すだけ）
+NO_TIMINGS = StageTimings(enabled=False)
+
+
+def perf_logger(path: str | None = None) -> logging.Logger:
+    """
+    構造化ログのロガー。path を渡すとそのファイルにローテーションしながら追記する（多重登録はしない）。
+    """
+    logger = logging.getLogger(PERF_LOGGER)
+    logger.setLevel(logging.INFO)
+    if path and not any(getattr(h, "baseFilename", None) == os.path.abspath(path) for h in logger.handlers):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        handler = RotatingFileHandler(
+            path, maxBytes=PERF_LOG_MAX_BYTES, backupCount=PERF_LOG_BACKUPS, encoding="utf-8"
+        )
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+    return logger
+
+
+def log_timings(timings: StageTimings, logger: logging.Logger) -> None:
+    if timings.enabled:
+        logger.info(json.dumps(timings.record(), ensure_ascii=False))
+
+
+def summarize_log(path: str) -> dict[str, dict]:
+    """
+    構造化ログ（JSON 行）を段ごとの件数・p50・p95・max（ms）にまとめる。
+    """
+    samples: dict[str, list[float]] = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            for name, ms in {**record.get("stages", {}), "total": record.get("total_ms")}.items():
+                if ms is not None:
+                    samples.setdefault(name, []).append(ms)
+
+    out = {}
+    for name, values in samples.items():
+        values.sort()
+        n = len(values)
+        out[name] = {
+            "n": n,
+            "p50_ms": values[(n - 1) // 2],
+            "p95_ms": values[min(n - 1, int(n * 0.95))],
+            "max_ms": values[-1],
+        }
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description="構造化ログ（logs/perf.jsonl など）を段ごとに集計する")
+    parser.add_argument("path")
+    args = parser.parse_args()
+    for name, s in summarize_log(args.path).items():
+        print(f"{name:<16} n={s['n']:>6,}  p50={s['p50_ms']:>9.2f}  p95={s['p95_ms']:>9.2f}  max={s['max_ms']:>9.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
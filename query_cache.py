@@ -0,0 +1,157 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Hashable
+
+
+class QueryCache:
+    """
+    件数（maxsize）と有効期限（ttl 秒）で上限を切ったLRUキャッシュ。ヒット・ミス数を数える。
+    sizeof（値 → バイト数）を渡すと、入っている値のバイト数の合計を nbytes に持つ。
+
+    値は全セッションで共有するので、呼び出し側は読み取り専用として扱うこと。
+    計算はロックの外で行うため、同じキーが同時に来たときは二重に計算することがある（結果は同じ）。
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 256,
+        ttl: float | None = 3600.0,
+        sizeof: Callable[[object], int] | None = None,
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.sizeof = sizeof
+        self.nbytes = 0
+        self._items: OrderedDict[Hashable, tuple[float, object]] = OrderedDict()
+        self._sizes: dict[Hashable, int] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable):
+        """
+        有効な値があれば返す（なければ None）。
+        """
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None:
+                stored_at, value = item
+                if self.ttl is None or time.monotonic() - stored_at < self.ttl:
+                    self._items.move_to_end(key)
+                    self.hits += 1
+                    return value
+                self._remove(key)
+                self.evictions += 1
+            self.misses += 1
+            return None
+
+    def put(self, key: Hashable, value) -> None:
+        size = self.sizeof(value) if self.sizeof is not None else 0
+        with self._lock:
+            if key in self._items:
+                self._remove(key)
+            self._items[key] = (time.monotonic(), value)
+            self._sizes[key] = size
+            self.nbytes += size
+            while len(self._items) > self.maxsize:
+                self._remove(next(iter(self._items)))
+                self.evictions += 1
+
+    def _remove(self, key: Hashable) -> None:
+        # ロックを持って呼ぶ
+        del self._items[key]
+        self.nbytes -= self._sizes.pop(key)
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], object]):
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            item = self._items.get(key)
+            return item is not None and (
+                self.ttl is None or time.monotonic() - item[0] < self.ttl
+            )
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def discard(self, key: Hashable) -> None:
+        with self._lock:
+            if key in self._items:
+                self._remove(key)
+
+    def keys(self) -> list[Hashable]:
+        with self._lock:
+            return list(self._items)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+            self._sizes.clear()
+            self.nbytes = 0
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._items),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "nbytes": self.nbytes,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+class CacheWarmer:
+    """
+    tasks（引数なしの関数）をバックグラウンドのスレッドプールで順に実行する。
+    各 task が QueryCache を埋める想定で、生成した時点で開始し、呼び出し側は待たない。
+    """
+
+    def __init__(self, tasks: list[Callable[[], object]], max_workers: int = 2):
+        self.total = len(tasks)
+        self.done = 0
+        self.errors = 0
+        self.started_at = time.monotonic()
+        self.finished_at: float | None = None if tasks else self.started_at
+        self._lock = threading.Lock()
+
+        executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="cache-warmup")
+        for task in tasks:
+            executor.submit(task).add_done_callback(self._on_done)
+        # 投入済みの task は実行し続ける（ここではスレッドの終了を待たない）
+        executor.shutdown(wait=False)
+
+    def _on_done(self, future: Future) -> None:
+        with self._lock:
+            self.done += 1
+            if future.exception() is not None:
+                self.errors += 1
+            if self.done == self.total:
+                self.finished_at = time.monotonic()
+
+    @property
+    def running(self) -> bool:
+        return self.finished_at is None
+
+    @property
+    def elapsed(self) -> float:
+        end = self.finished_at if self.finished_at is not None else time.monotonic()
+        return end - self.started_at
+
+    def stats(self) -> dict:
+        return {
+            "done": self.done,
+            "total": self.total,
+            "errors": self.errors,
+            "running": self.running,
+            "elapsed": self.elapsed,
+        }
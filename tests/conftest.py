@@ -0,0 +1,14 @@
+import os
+import sys
+
+import pytest
+
+# リポジトリ直下のモジュール（dataset.py など）を import し、data/ を相対パスで読めるようにする
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture(autouse=True)
+def _repo_cwd(monkeypatch):
+    # DATASET_PATHS は data/xxx.parquet の相対パス
+    monkeypatch.chdir(ROOT)
@@ -0,0 +1,65 @@
+"""
+AreaHierarchy の市区町村の判定。区が10以上ある市では区のコードも末尾が0になる（13110 目黒区 など）。
+これを市全体とみなすと、その区がすべての順位・平均から抜ける。
+"""
+import functools
+
+import numpy as np
+import pytest
+
+from dataset import AREA_COL, AREA_LEVEL_CITY, AREA_LEVEL_WARD, build_area_hierarchy, read_base
+from engine import DATASET_PATHS
+
+# 末尾が0の区 → 市全体（特別区部・政令指定都市）
+WARDS_ENDING_IN_ZERO = {
+    "13110": ("目黒区", "13100"),
+    "13120": ("練馬区", "13100"),
+    "14110": ("横浜市戸塚区", "14100"),
+    "23110": ("名古屋市中川区", "23100"),
+    "26110": ("京都市山科区", "26100"),
+    "27120": ("大阪市住吉区", "27100"),
+    "28110": ("神戸市中央区", "28100"),
+}
+
+
+@functools.cache
+def _load(key: str):
+    base = read_base(DATASET_PATHS[key])
+    return base, build_area_hierarchy(base)
+
+
+@pytest.mark.parametrize("key", list(DATASET_PATHS))
+@pytest.mark.parametrize("code", list(WARDS_ENDING_IN_ZERO))
+def test_ward_ending_in_zero_is_leaf(key, code):
+    base, hierarchy = _load(key)
+    name, city = WARDS_ENDING_IN_ZERO[code]
+
+    assert hierarchy.names[code] == name
+    assert hierarchy.level[code] == AREA_LEVEL_WARD
+    assert hierarchy.parent[code] == city
+    assert hierarchy.level[city] == AREA_LEVEL_CITY
+
+    leaf_areas = set(base[AREA_COL].to_numpy()[hierarchy.leaf_rows])
+    assert code in leaf_areas
+    assert city not in leaf_areas
+    pref_areas = set(base[AREA_COL].to_numpy()[hierarchy.leaf_positions(code[:2])])
+    assert code in pref_areas
+
+
+@pytest.mark.parametrize("key", list(DATASET_PATHS))
+def test_ward_after_zero_ward_keeps_city_parent(key):
+    # 13111（目黒区の次の区）の親は 13110 ではなく 13100
+    _, hierarchy = _load(key)
+    for ward in ("13111", "14111"):
+        assert hierarchy.level[ward] == AREA_LEVEL_WARD
+        assert hierarchy.parent[ward] == ward[:3] + "00"
+
+
+@pytest.mark.parametrize("key", ["2014", "2014_level2"])
+def test_tokyo_wards_reconcile(key):
+    # 特別区部の人口は、その区の人口の合計と一致する（13199 は人口が無く合計に入らない）
+    base, hierarchy = _load(key)
+    wards = [c for c, p in hierarchy.parent.items() if p == "13100"]
+    population = base.drop_duplicates(AREA_COL).set_index(AREA_COL)["population"]
+    assert {f"131{i:02d}" for i in range(1, 24)} <= set(wards)
+    assert np.isclose(population[wards].sum(), population["13100"])
@@ -0,0 +1,88 @@
+"""
+compute_all_tables（export.py の一括集計）が DensityEngine.run と同じ表を返すか。
+スコープ・産業をいくつか選び、並び順・スコープ内順位・全国順位・県平均との差・加重平均を比べる。
+
+密度はエンジン（分割データ）と同じく compact で読む（float32 の同値の並びは地域コード順でそろう）。
+"""
+import functools
+
+import numpy as np
+import pytest
+
+from dataset import AREA_COL, SIC_COL, build_area_hierarchy, read_base
+from engine import (
+    DATASET_PATHS,
+    NATIONAL_PREF,
+    NATIONAL_RANK_COLS,
+    RANK_COL,
+    SCOPE_COL,
+    SCOPE_RANK_COLS,
+    DensityEngine,
+    Query,
+    compute_all_tables,
+)
+
+SCOPES = [NATIONAL_PREF, "01", "13", "27", "47"]
+DEV_COLS = {"est_density": "est_dev", "emp_density": "emp_dev"}
+
+
+@functools.cache
+def _tables(key: str):
+    base = read_base(DATASET_PATHS[key], compact=True)
+    return compute_all_tables(base, build_area_hierarchy(base))
+
+
+@functools.cache
+def _engine() -> DensityEngine:
+    return DensityEngine()
+
+
+def _sic_codes(key: str) -> list[str]:
+    # 総計・最初の部門（または大分類）・最後の大分類
+    codes = _engine().options(key).sic_codes
+    return [codes[0], codes[1], codes[-1]]
+
+
+@pytest.mark.parametrize("key", list(DATASET_PATHS))
+def test_bulk_rows_match_engine(key):
+    tables = _tables(key)
+    for scope in SCOPES:
+        for sic_code in _sic_codes(key):
+            result = _engine().run(Query(key, scope, sic_code, tables.population_min))
+            rows = tables.rows[(tables.rows[SCOPE_COL] == scope) & (tables.rows[SIC_COL] == sic_code)]
+            assert len(rows) == len(result.d) > 0
+
+            for metric_col, rank_col in SCOPE_RANK_COLS.items():
+                expected = rows.sort_values(rank_col).reset_index(drop=True)
+                actual = result.table(metric_col)
+                assert list(actual[AREA_COL].astype(str)) == list(expected[AREA_COL])
+                assert list(actual[RANK_COL]) == list(expected[rank_col])
+                national_rank_col = NATIONAL_RANK_COLS[metric_col]
+                assert list(actual[national_rank_col]) == list(expected[national_rank_col])
+                # エンジンの差は float32（密度の型）、一括集計は float64
+                np.testing.assert_allclose(
+                    actual[DEV_COLS[metric_col]].to_numpy(np.float64),
+                    expected[DEV_COLS[metric_col]].to_numpy(np.float64),
+                    rtol=1e-6,
+                    atol=1e-2,
+                )
+
+
+@pytest.mark.parametrize("key", list(DATASET_PATHS))
+def test_bulk_averages_match_engine(key):
+    averages = _tables(key).averages.set_index([SCOPE_COL, SIC_COL])
+    for scope in SCOPES:
+        for sic_code in _sic_codes(key):
+            avg = _engine().run(Query(key, scope, sic_code)).avg
+            expected = averages.loc[(scope, sic_code)]
+            assert avg.pop_sum == expected["pop_sum"]
+            assert avg.est_avg == pytest.approx(expected["est_avg"], rel=1e-12)
+            assert avg.emp_avg == pytest.approx(expected["emp_avg"], rel=1e-12, nan_ok=True)
+
+
+def test_scope_ranks_restart_per_pref():
+    # 都道府県スコープの順位は 1 から（全国順位はその県の行の全国での位置のまま）
+    rows = _tables("2014_level2").rows
+    tokyo = rows[(rows[SCOPE_COL] == "13") & (rows[SIC_COL] == rows[SIC_COL].iloc[0])]
+    assert sorted(tokyo[SCOPE_RANK_COLS["est_density"]]) == list(range(1, len(tokyo) + 1))
+    assert tokyo[NATIONAL_RANK_COLS["est_density"]].is_unique
@@ -0,0 +1,52 @@
+"""
+DensityEngine の集計キャッシュ。データセットごとに持ち、ウォームアップした組み合わせは
+別のデータセットのウォームアップに追い出されない。キャッシュはメモリ上限に数え、
+レジストリがデータセットを手放すときにそのデータセットのキャッシュも捨てる。
+"""
+import time
+
+from engine import NATIONAL_PREF, DensityEngine, Query
+
+
+def _warm(engine: DensityEngine, dataset: str) -> None:
+    warmer = engine.warmup(dataset, max_workers=1)
+    while warmer.running:
+        time.sleep(0.05)
+    assert warmer.errors == 0
+
+
+def test_warmup_of_other_datasets_keeps_first_warm():
+    # 件数上限を小さくしても、ウォームアップの全組み合わせが入る大きさに広がる
+    engine = DensityEngine(cache_size=16)
+    first, *others = engine.datasets
+    for dataset in [first, *others]:
+        _warm(engine, dataset)
+
+    options = engine.options(first)
+    caches = engine.caches(first)
+    for pref_code in options.pref_codes:
+        for sic_code in options.sic_codes:
+            assert Query(first, pref_code, sic_code) in caches.result
+            assert (pref_code, sic_code) in caches.scope
+    assert engine.cache_stats()["result"]["evictions"] == 0
+
+
+def test_memory_usage_stays_under_budget():
+    # 全産業 × 全国・東京で1データセット 2〜10 MB。12 MB では3つ目までに手放すものが出る
+    engine = DensityEngine(memory_budget_mb=12)
+    budget = engine.registry.memory_budget
+    for dataset in engine.datasets:
+        for sic_code in engine.options(dataset).sic_codes:
+            for pref_code in (NATIONAL_PREF, "13"):
+                engine.run(Query(dataset, pref_code, sic_code))
+                resident = engine.registry.resident()
+                assert resident[-1] == dataset
+                # 上限を超えてよいのは、いま使っているデータセットだけが残っているときだけ
+                assert engine.memory_usage <= budget or resident == [dataset]
+
+        # 手放したデータセットのキャッシュは残っていない（キャッシュの合計 = 残っているデータセットの分）
+        cached = sum(s["nbytes"] for s in engine.cache_stats().values())
+        assert cached == sum(engine.caches(k).nbytes for k in engine.registry.resident())
+
+    assert engine.registry.evictions > 0
+    assert engine.memory_usage <= budget
@@ -0,0 +1,83 @@
+"""
+filter_scope_base（AreaHierarchy の行位置で切り出す）が、元の実装（コードごとに startswith で子を探すループ）と
+同じ行を返すか。全国＋47都道府県 × 3データセットで比べる。
+
+想定どおりの違いは1つだけ：区が10以上ある市の、末尾が0の区（13110 目黒区 など7区）。
+元の実装はこれを市全体とみなして除いていた（test_area_hierarchy.py）。いまの実装ではその区の行が残る。
+"""
+import functools
+
+import pandas as pd
+import pytest
+
+from dataset import AREA_COL, build_area_hierarchy, read_base
+from engine import DATASET_PATHS, NATIONAL_PREF, filter_scope_base
+
+SCOPES = [NATIONAL_PREF] + [f"{i:02d}" for i in range(1, 48)]
+# 元の実装が市全体として除いていた区
+WARDS_ENDING_IN_ZERO = {"13110", "13120", "14110", "23110", "26110", "27120", "28110"}
+
+
+def reference_filter_scope_base(df: pd.DataFrame, pref_code: str) -> pd.DataFrame:
+    """
+    ベクトル化する前の filter_scope_base（区の判定の修正の前）。
+    """
+    d = df.copy()
+
+    # 全国(00000)除外
+    d = d[d[AREA_COL] != "00000"]
+    # 人口ゼロ除外
+    d = d[d["population"] > 0]
+    # 県集計(XX000)を除外
+    d = d[~d[AREA_COL].str.endswith("000")]
+
+    if pref_code != "00":
+        d = d[d[AREA_COL].str.startswith(pref_code)].copy()
+
+    # 「末尾が0」かつ「政令指定都市のパターン（3桁目が1）」かつ「自分を除いた前方一致（4桁）するコードが存在する」なら除外
+    all_codes = set(d[AREA_COL].unique())
+    remove_codes = set()
+    for code in all_codes:
+        if code.endswith("0") and not code.endswith("000"):
+            is_designated = len(code) == 5 and code[2] == "1"
+            if is_designated:
+                prefix = code[:-1]
+                has_children = d[(d[AREA_COL].str.startswith(prefix)) & (d[AREA_COL] != code)].shape[0] > 0
+                if has_children:
+                    remove_codes.add(code)
+
+    if remove_codes:
+        d = d[~d[AREA_COL].isin(remove_codes)]
+    return d
+
+
+@functools.cache
+def _load(key: str):
+    base = read_base(DATASET_PATHS[key])
+    return base, build_area_hierarchy(base)
+
+
+@pytest.mark.parametrize("key", list(DATASET_PATHS))
+@pytest.mark.parametrize("pref_code", SCOPES)
+def test_filter_scope_matches_reference(key, pref_code):
+    base, hierarchy = _load(key)
+    expected = reference_filter_scope_base(base, pref_code)
+
+    # 想定どおりの違い：末尾が0の区の行（人口があり、スコープに入るもの）が加わる
+    restored = base[AREA_COL].isin(WARDS_ENDING_IN_ZERO) & (base["population"] > 0)
+    if pref_code != NATIONAL_PREF:
+        restored &= base[AREA_COL].str.startswith(pref_code)
+    expected = base[base.index.isin(expected.index) | restored]
+
+    actual = filter_scope_base(base, pref_code, hierarchy)
+    pd.testing.assert_frame_equal(actual, expected)
+
+
+@pytest.mark.parametrize("key", list(DATASET_PATHS))
+def test_restored_wards_are_the_only_difference(key):
+    base, hierarchy = _load(key)
+    reference = reference_filter_scope_base(base, NATIONAL_PREF)
+    actual = filter_scope_base(base, NATIONAL_PREF, hierarchy)
+    added = set(actual[AREA_COL]) - set(reference[AREA_COL])
+    assert added == WARDS_ENDING_IN_ZERO
+    assert set(reference[AREA_COL]) <= set(actual[AREA_COL])
@@ -0,0 +1,126 @@
+"""
+ingest.py の出力（leaf 列・上位の産業の行・取り込みの目印）が、元の parquet を read_base
+（rollup_industries で合算）で読んだものと一致するか。
+
+data/ の各データセットから、東京（特別区部・末尾が0の区 13110）と北海道（札幌市）の一部の地域を抜き出し、
+e-Stat の統計データ CSV の形に書き出して取り込む。
+"""
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+
+from dataset import (
+    AREA_COL,
+    INGEST_FORMAT,
+    INGESTED_KEY,
+    LEAF_COL,
+    SIC_COL,
+    build_area_hierarchy,
+    ingest_metadata,
+    is_rollup_code,
+    read_base,
+)
+from engine import DATASET_PATHS
+from ingest import ingest
+
+AREAS = [
+    "00000",
+    "01000", "01100", "01101", "01102", "01202",
+    "13000", "13100", "13101", "13109", "13110", "13111", "13201",
+]
+TEXT_COLS = [AREA_COL, SIC_COL, "sicName", "areaName", "pref"]
+NUMBER_COLS = ["establishments", "employees", "population", "est_density", "emp_density"]
+
+
+def _estat_number(s: pd.Series) -> pd.Series:
+    # 欠損は e-Stat の "-"
+    return s.map(lambda v: "-" if pd.isna(v) else str(int(v)))
+
+
+def write_estat_csvs(raw: pd.DataFrame, census_path, population_path) -> None:
+    """
+    ベースデータの行を e-Stat の統計データ CSV（列指向。"xxx_code" の右隣が名称）にする。
+    """
+    census = pd.concat([
+        pd.DataFrame({
+            "tab_code": tab,
+            "表章項目": label,
+            "cat01_code": raw[SIC_COL],
+            "産業分類": raw["sicName"],
+            "area_code": raw[AREA_COL],
+            "地域": raw["areaName"],
+            **({"time_code": raw["@time"], "時間軸": "年"} if "@time" in raw else {}),
+            "value": _estat_number(raw[col]),
+        })
+        for tab, label, col in [("110", "事業所数", "establishments"), ("120", "従業者数", "employees")]
+    ])
+    census.to_csv(census_path, index=False)
+
+    areas = raw.drop_duplicates(AREA_COL)
+    pd.DataFrame({
+        "area_code": areas[AREA_COL],
+        "地域": areas["areaName"],
+        "value": _estat_number(areas["population"]),
+    }).to_csv(population_path, index=False)
+
+
+def _sorted(df: pd.DataFrame) -> pd.DataFrame:
+    keys = [c for c in (SIC_COL, AREA_COL, "@time") if c in df.columns]
+    df = df.astype({c: str for c in TEXT_COLS + keys})
+    return df.sort_values(keys, ignore_index=True)
+
+
+@pytest.fixture(params=list(DATASET_PATHS))
+def paths(request, tmp_path):
+    raw = pd.read_parquet(DATASET_PATHS[request.param])
+    raw = raw[raw[AREA_COL].isin(AREAS)].reset_index(drop=True)
+    raw_path = tmp_path / "raw.parquet"
+    raw.to_parquet(raw_path)
+
+    census_path, population_path = tmp_path / "census.csv", tmp_path / "population.csv"
+    write_estat_csvs(raw, census_path, population_path)
+    out_path = tmp_path / "ingested.parquet"
+    ingest([str(census_path)], str(population_path), str(out_path))
+    return str(raw_path), str(out_path)
+
+
+def test_ingested_matches_read_base(paths):
+    raw_path, out_path = paths
+    expected = _sorted(read_base(raw_path, compact=True))
+    actual = _sorted(read_base(out_path))
+
+    assert len(actual) == len(expected)
+    # 上位の産業（総計・3部門）の行も同じ地域・産業に同じ値で入っている
+    assert actual[SIC_COL].map(is_rollup_code).any()
+    for col in TEXT_COLS + [c for c in ("@time",) if c in expected.columns]:
+        assert list(actual[col]) == list(expected[col]), col
+    for col in NUMBER_COLS:
+        np.testing.assert_allclose(
+            actual[col].to_numpy(np.float64), expected[col].to_numpy(np.float64), rtol=1e-6, err_msg=col
+        )
+
+
+def test_ingested_leaf_flags_match_hierarchy(paths):
+    raw_path, out_path = paths
+    base = read_base(raw_path, compact=True)
+    leaf = np.zeros(len(base), dtype=bool)
+    leaf[build_area_hierarchy(base).leaf_rows] = True
+    expected = _sorted(base.assign(**{LEAF_COL: leaf}))
+    actual = _sorted(read_base(out_path))
+
+    assert list(actual[LEAF_COL]) == list(expected[LEAF_COL])
+    # 末尾が0の区は市区町村、特別区部・札幌市（市全体）・都道府県・全国は含まない
+    leaf_areas = set(actual.loc[actual[LEAF_COL], AREA_COL])
+    assert {"13101", "13110", "13111", "01101"} <= leaf_areas
+    assert leaf_areas.isdisjoint({"00000", "01000", "13000", "01100", "13100"})
+
+
+def test_ingested_metadata(paths):
+    raw_path, out_path = paths
+    assert ingest_metadata(raw_path) is None
+    assert INGESTED_KEY in pq.read_schema(out_path).metadata
+    meta = ingest_metadata(out_path)
+    assert meta["format"] == INGEST_FORMAT
+    assert meta["census"] == ["census.csv"]
+    assert meta["population"] == "population.csv"
@@ -0,0 +1,62 @@
+"""
+sicCode 分割データ（python dataset.py）の読み込み。使えない分割データは警告して元のファイルを全件読む。
+"""
+import json
+import os
+import shutil
+import warnings
+
+import pyarrow.parquet as pq
+import pytest
+
+from dataset import (
+    PARTITION_KEY,
+    TOTAL_CODE,
+    load_dataset,
+    partition_root,
+    read_base,
+    write_partitioned,
+)
+from engine import DATASET_PATHS
+
+
+@pytest.fixture
+def partitioned(tmp_path):
+    path = str(tmp_path / os.path.basename(DATASET_PATHS["2014"]))
+    shutil.copy(DATASET_PATHS["2014"], path)
+    write_partitioned(read_base(path, compact=True), partition_root(path), path)
+    return path
+
+
+def test_fresh_partitions_are_used(partitioned):
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        data = load_dataset(partitioned, compact=True)
+    assert data.partitioned is not None
+    # カタログは総計の行だけ（地域ごとに1行）
+    assert not data.base["area"].duplicated().any()
+    assert data.industries.codes()[0] == TOTAL_CODE
+
+
+def test_changed_source_falls_back_to_full_read(partitioned):
+    # データの差し替え（同じ大きさでも更新時刻が変わる）
+    os.utime(partitioned, ns=(0, 0))
+
+    with pytest.warns(UserWarning, match="変わっている"):
+        data = load_dataset(partitioned, compact=True)
+    assert data.partitioned is None
+    assert len(data.base) == len(read_base(partitioned))
+
+
+def test_format_mismatch_falls_back_to_full_read(partitioned):
+    path = os.path.join(partition_root(partitioned), f"sicCode={TOTAL_CODE}", "part-0.parquet")
+    table = pq.read_table(path)
+    metadata = dict(table.schema.metadata)
+    meta = json.loads(metadata[PARTITION_KEY])
+    meta["format"] -= 1
+    metadata[PARTITION_KEY] = json.dumps(meta).encode()
+    pq.write_table(table.replace_schema_metadata(metadata), path)
+
+    with pytest.warns(UserWarning, match="形式"):
+        data = load_dataset(partitioned, compact=True)
+    assert data.partitioned is None
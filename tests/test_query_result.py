@@ -0,0 +1,77 @@
+"""
+query_result の順位（全国の降順の並びを人口下限・都道府県で絞り込み、np.cumsum(selected) - 1 で d の行位置に直す）が、
+素直な pandas の絞り込み → rank と同じになるか。同値は地域コード順（rank の method="first"）。
+"""
+import functools
+
+import pandas as pd
+import pytest
+
+from dataset import AREA_COL, SIC_COL, build_area_hierarchy, read_base
+from engine import (
+    DATASET_PATHS,
+    NATIONAL_PREF,
+    NATIONAL_RANK_COL,
+    NATIONAL_RANK_COLS,
+    RANK_COL,
+    DensityEngine,
+    Query,
+    filter_scope_base,
+)
+
+PREFS = ["01", "13", "27", "47"]
+POPULATION_MINS = [0, 5000, 50_000]
+
+
+@functools.cache
+def _leaf_rows(key: str) -> pd.DataFrame:
+    # エンジン（分割データ）と同じく compact で読む（密度は float32）
+    base = read_base(DATASET_PATHS[key], compact=True)
+    rows = filter_scope_base(base, NATIONAL_PREF, build_area_hierarchy(base))
+    rows = rows.assign(**{AREA_COL: rows[AREA_COL].astype(str), SIC_COL: rows[SIC_COL].astype(str)})
+    return rows.sort_values(AREA_COL, kind="stable")
+
+
+@functools.cache
+def _engine() -> DensityEngine:
+    return DensityEngine()
+
+
+def reference_ranks(key: str, pref_code: str, sic_code: str, population_min: int, metric_col: str) -> pd.DataFrame:
+    """
+    人口下限 → 全国順位 → 都道府県で絞り込み → 県内順位。県内順位の順に並べて返す。
+    """
+    rows = _leaf_rows(key)
+    d = rows[(rows[SIC_COL] == sic_code) & (rows["population"] >= population_min)].copy()
+    d["national_rank"] = d[metric_col].rank(method="first", ascending=False, na_option="bottom").astype(int)
+    d = d[d[AREA_COL].str[:2] == pref_code].copy()
+    d["rank"] = d[metric_col].rank(method="first", ascending=False, na_option="bottom").astype(int)
+    return d.sort_values("rank")
+
+
+@pytest.mark.parametrize("key", list(DATASET_PATHS))
+@pytest.mark.parametrize("population_min", POPULATION_MINS)
+def test_pref_and_national_ranks_match_pandas(key, population_min):
+    sic_codes = _engine().options(key).sic_codes
+    for pref_code in PREFS:
+        for sic_code in (sic_codes[0], sic_codes[-1]):
+            result = _engine().run(Query(key, pref_code, sic_code, population_min))
+            for metric_col, national_rank_col in NATIONAL_RANK_COLS.items():
+                expected = reference_ranks(key, pref_code, sic_code, population_min, metric_col)
+                actual = result.table(metric_col)
+
+                assert list(actual[AREA_COL].astype(str)) == list(expected[AREA_COL])
+                assert list(actual[RANK_COL]) == list(expected["rank"])
+                assert list(actual[NATIONAL_RANK_COL]) == list(expected["national_rank"])
+                assert list(actual[national_rank_col]) == list(expected["national_rank"])
+
+
+def test_national_rank_skips_rows_below_population_min():
+    # 人口下限で落ちた地域は全国順位の番号を使わない（県の順位とは別に、全国の残りの中での位置）
+    key, sic_code = "2014_level2", _engine().options("2014_level2").sic_codes[0]
+    low = _engine().run(Query(key, "13", sic_code, 0)).table("est_density")
+    high = _engine().run(Query(key, "13", sic_code, 50_000)).table("est_density")
+    ranks_low = low.set_index(low[AREA_COL].astype(str))[NATIONAL_RANK_COL]
+    ranks_high = high.set_index(high[AREA_COL].astype(str))[NATIONAL_RANK_COL]
+    assert (ranks_high <= ranks_low[ranks_high.index]).all()
+    assert (ranks_high < ranks_low[ranks_high.index]).any()
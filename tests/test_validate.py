@@ -0,0 +1,33 @@
+"""
+validate.py のチェックの重さ。既知の癖だけのファイルは ok、集計に入る欠陥はエラーのまま。
+"""
+import pytest
+
+from engine import DATASET_PATHS
+from validate import SEVERITY_ERROR, SEVERITY_OK, validate_path
+
+
+@pytest.mark.parametrize("key", ["2014", "2014_level2"])
+def test_known_quirks_only_pass_strict(key):
+    results = validate_path(DATASET_PATHS[key])
+    assert {r.check: r.severity for r in results} == {
+        "population": SEVERITY_OK,
+        "duplicate_keys": SEVERITY_OK,
+        "population_consistency": SEVERITY_OK,
+        "sic_codes": SEVERITY_OK,
+    }
+
+
+def test_former_municipalities_double_count_is_an_error():
+    # 2009 の旧市町村（「（旧：…）」）の行は合併後の市町村と二重に数えられ、順位・平均に入る
+    population = validate_path(DATASET_PATHS["2009"])[0]
+    assert population.severity == SEVERITY_ERROR
+    national = population.details.set_index("scope").loc["00"]
+    assert national["diff"] == 538_707
+
+
+def test_population_tolerance_only_widens_the_match():
+    # 許容差を広げても、既知の差の無いスコープの 2009 の差（最大 +538,707 人）は残る
+    population = validate_path(DATASET_PATHS["2009"], population_tolerance=10_000)[0]
+    assert population.severity == SEVERITY_ERROR
+    assert (population.details["diff"].abs() > 10_000).all()
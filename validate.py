@@ -0,0 +1,278 @@
+"""
+ベースデータの整合性チェック。data/ のファイルを差し替えたら実行する。
+
+    python validate.py                    # data/*.parquet をすべて
+    python validate.py data/base_2014_ec_2020_pop_level2.parquet --details 20
+
+チェックはすべて groupby / 集合演算で行い、1ファイル 0.1〜0.2 秒ほど（読み込みを含む）。
+エラー（集計が壊れるもの）があれば終了コード 1、--strict なら警告（データの欠け・桁の混在）でも 1。
+KNOWN_QUIRKS に載せたファイルごとの既知の癖（集計に影響しない、理由のわかっている差）は ok として数だけ示す。
+既知の値から変わればエラー・警告に戻る。2009 の旧市町村の二重計上は集計に入る欠陥なので、エラーのまま。
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+
+from dataset import (
+    AREA_COL,
+    AREA_LEVEL_CITY,
+    NATIONAL_CODE,
+    SIC_COL,
+    AreaHierarchy,
+    build_area_hierarchy,
+    read_raw,
+)
+
+DATA_GLOB = "data/*.parquet"
+TIME_COL = "@time"
+
+SEVERITY_OK = "ok"
+SEVERITY_WARNING = "warning"
+SEVERITY_ERROR = "error"
+
+# 人口の突合で「一致」とみなす差（人）。これを超える差はエラー（--population-tolerance で変えられる）
+POPULATION_TOLERANCE = 0
+
+
+@dataclass(frozen=True)
+class CheckResult:
+    check: str
+    severity: str
+    message: str
+    details: pd.DataFrame | None = None
+
+
+@dataclass(frozen=True)
+class KnownQuirks:
+    """
+    ファイルごとの既知の癖。該当するものはエラー・警告にしない。
+
+    population_diffs はスコープ（全国 00・県 XX・区のある市 XXXXX）ごとの既知の人口の差（市区町村の合計 − 集計行）。
+    missing_population は人口が欠損している既知の地域、mixed_sic_lengths は sicCode の桁の混在が仕様のファイル。
+    """
+
+    population_diffs: dict[str, float] = field(default_factory=dict)
+    missing_population: frozenset[str] = frozenset()
+    mixed_sic_lengths: bool = False
+
+
+NO_QUIRKS = KnownQuirks()
+# 13199：地域名も人口も無い東京都の行（集計では除外される）
+_MISSING_13199 = frozenset({"13199"})
+# 福島県：2014 の経済センサスに無い避難指示区域の3町村（大熊町・双葉町・葛尾村）の 2020 年人口
+_FUKUSHIMA_2014 = {"07": -1_267, "00": -1_267}
+KNOWN_QUIRKS = {
+    "base_2014_ec_2020_pop.parquet": KnownQuirks(
+        population_diffs=_FUKUSHIMA_2014,
+        missing_population=_MISSING_13199,
+    ),
+    "base_2014_ec_2020_pop_level2.parquet": KnownQuirks(
+        population_diffs=_FUKUSHIMA_2014,
+        missing_population=_MISSING_13199,
+        mixed_sic_lengths=True,
+    ),
+    # 2009 は合併前の旧市町村（「（旧：…）」）の行が、合併後の市町村の行と並んで残り、2020 年人口で二重に数える
+    # （全国で +538,707 人）。順位・平均・パネルに入る実際の欠陥なので既知の癖にはしない（人口の突合はエラーのまま）。
+    # 旧市町村の行をすべて葉から外すと、2009 に後継のコードが無い行（相模原市 14209・熊本市 43201・白岡町 11445 など、
+    # 市制施行や政令市への移行でコードだけが変わったもの）まで落ちるので、判定には合併の対応表が要る
+    "base_2009_ec_2020_pop.parquet": KnownQuirks(missing_population=_MISSING_13199),
+}
+
+
+# ======================
+# チェック
+# ======================
+def check_population_reconciliation(
+    df: pd.DataFrame,
+    hierarchy: AreaHierarchy,
+    tolerance: float = POPULATION_TOLERANCE,
+    quirks: KnownQuirks = NO_QUIRKS,
+) -> CheckResult:
+    """
+    集計の重複がない市区町村行（AreaHierarchy.leaf_rows）の人口合計が、県（XX000）・全国（00000）の行と一致するか。
+    区がある市の人口が区の合計と一致するかもあわせて見る（区の取りこぼし・市全体との二重計上）。
+    tolerance を超える差はエラー（密度の平均・全国の人口が変わる）。quirks.population_diffs と
+    tolerance の範囲で同じ差は既知として ok にする。
+    """
+    area_pop = df.groupby(AREA_COL, sort=True)["population"].max()
+    leaf = area_pop.reindex(pd.unique(df[AREA_COL].to_numpy()[hierarchy.leaf_rows]))
+    leaf_sum = leaf.groupby(leaf.index.str[:2]).sum()
+
+    pref_codes = [f"{p}000" for p in leaf_sum.index]
+    expected = area_pop.reindex(pref_codes).set_axis(leaf_sum.index)
+    if NATIONAL_CODE in area_pop.index:
+        leaf_sum.loc["00"] = leaf.sum()
+        expected.loc["00"] = area_pop[NATIONAL_CODE]
+    scopes = pd.DataFrame({"expected": expected, "leaf_sum": leaf_sum})
+
+    # 区がある市：市全体の人口と、区の人口の合計
+    wards = pd.Series(
+        {code: p for code, p in hierarchy.parent.items() if p is not None and hierarchy.level.get(p) == AREA_LEVEL_CITY}
+    )
+    if len(wards):
+        ward_sum = area_pop.reindex(wards.index).groupby(wards.to_numpy()).sum()
+        cities = pd.DataFrame({"expected": area_pop.reindex(ward_sum.index), "leaf_sum": ward_sum})
+        scopes = pd.concat([scopes, cities])
+
+    scopes["diff"] = scopes["leaf_sum"] - scopes["expected"]
+    known_diff = pd.Series(quirks.population_diffs, dtype=np.float64).reindex(scopes.index)
+    mismatched = scopes["diff"].abs() > tolerance
+    known = mismatched & ((scopes["diff"] - known_diff).abs() <= tolerance)
+    bad = scopes[mismatched & ~known].copy()
+    if bad.empty:
+        note = f"（既知の差 {int(known.sum())} 件）" if known.any() else ""
+        return CheckResult("population", SEVERITY_OK, f"{len(scopes)} 件（全国・県・区のある市）の人口が一致{note}")
+
+    bad.insert(0, "name", [hierarchy.names.get(c if len(c) == 5 else f"{c}000", "") for c in bad.index])
+    bad["known_diff"] = known_diff.reindex(bad.index)
+    bad = bad.rename_axis("scope").reset_index().sort_values("diff", key=np.abs, ascending=False, ignore_index=True)
+    note = f"。既知の差 {int(known.sum())} 件は除く" if known.any() else ""
+    return CheckResult(
+        "population",
+        SEVERITY_ERROR,
+        f"{len(bad)} / {len(scopes)} 件で市区町村の人口合計が {tolerance:,.0f} 人を超えてずれる"
+        f"（最大 {bad['diff'].iloc[0]:+,.0f} 人{note}）",
+        bad,
+    )
+
+
+def check_duplicate_keys(df: pd.DataFrame) -> CheckResult:
+    """
+    (area, sicCode[, @time]) が一意か。重複があると合算・順位で二重に数える。
+    """
+    keys = [AREA_COL, SIC_COL] + ([TIME_COL] if TIME_COL in df.columns else [])
+    dup = df.duplicated(keys, keep=False)
+    if not dup.any():
+        return CheckResult("duplicate_keys", SEVERITY_OK, f"({', '.join(keys)}) は一意")
+    details = df.loc[dup, keys + ["areaName", "sicName", "population", "establishments"]].sort_values(keys)
+    return CheckResult(
+        "duplicate_keys",
+        SEVERITY_ERROR,
+        f"({', '.join(keys)}) の重複 {int(dup.sum()):,} 行",
+        details.reset_index(drop=True),
+    )
+
+
+def check_population_consistency(df: pd.DataFrame, quirks: KnownQuirks = NO_QUIRKS) -> CheckResult:
+    """
+    同じ地域の人口が産業によらず同じか（合算では max を代表値にしている）。
+    人口の欠損は警告（quirks.missing_population の地域だけなら ok）。
+    """
+    g = df.groupby(AREA_COL, sort=True)["population"]
+    stats = pd.DataFrame({"min": g.min(), "max": g.max(), "values": g.nunique()})
+    inconsistent = stats[stats["values"] > 1]
+    if not inconsistent.empty:
+        names = df.drop_duplicates(AREA_COL).set_index(AREA_COL)["areaName"]
+        inconsistent.insert(0, "areaName", names.reindex(inconsistent.index))
+        return CheckResult(
+            "population_consistency",
+            SEVERITY_ERROR,
+            f"{len(inconsistent):,} 地域で産業によって人口が違う",
+            inconsistent.rename_axis(AREA_COL).reset_index(),
+        )
+
+    missing = df[df["population"].isna()]
+    n_known = missing[AREA_COL].isin(quirks.missing_population).sum()
+    missing = missing[~missing[AREA_COL].isin(quirks.missing_population)]
+    if not missing.empty:
+        details = missing.groupby(AREA_COL, sort=True).agg(
+            areaName=("areaName", "first"), rows=(SIC_COL, "size")
+        ).reset_index()
+        return CheckResult(
+            "population_consistency",
+            SEVERITY_WARNING,
+            f"地域ごとの人口は一致。人口が欠損している地域 {len(details):,}（{len(missing):,} 行。集計では除外される）",
+            details,
+        )
+    note = f"（既知の人口の欠損 {len(quirks.missing_population)} 地域・{n_known:,} 行）" if n_known else ""
+    return CheckResult("population_consistency", SEVERITY_OK, f"{stats.shape[0]:,} 地域で人口が一致{note}")
+
+
+def check_sic_codes(df: pd.DataFrame, quirks: KnownQuirks = NO_QUIRKS) -> CheckResult:
+    """
+    sicCode の桁数。level2 は 030 / 2700 のように桁が混在するので警告にとどめ（quirks.mixed_sic_lengths なら ok）、
+    先頭の 0 を除くと同じになるコード（"30" と "030" など）が別の産業名で入っていればエラー。
+    """
+    codes = df.drop_duplicates(SIC_COL)[[SIC_COL, "sicName"]].reset_index(drop=True)
+    codes["length"] = codes[SIC_COL].str.len()
+    codes["normalized"] = codes[SIC_COL].str.lstrip("0")
+    collisions = codes[codes.duplicated("normalized", keep=False)]
+    if not collisions.empty:
+        return CheckResult(
+            "sic_codes",
+            SEVERITY_ERROR,
+            f"先頭の 0 の有無だけが違う sicCode が {collisions['normalized'].nunique()} 組ある",
+            collisions.drop(columns="normalized").reset_index(drop=True),
+        )
+
+    lengths = codes["length"].value_counts().sort_index()
+    summary = "、".join(f"{n}桁 {c}件" for n, c in lengths.items())
+    if len(lengths) > 1 and quirks.mixed_sic_lengths:
+        return CheckResult("sic_codes", SEVERITY_OK, f"sicCode の桁数が混在（{summary}。既知）")
+    if len(lengths) > 1:
+        return CheckResult(
+            "sic_codes",
+            SEVERITY_WARNING,
+            f"sicCode の桁数が混在（{summary}）。並びと階層は IndustryTree（産業名の大分類の文字）で決める",
+            codes.drop(columns="normalized").sort_values(["length", SIC_COL], ignore_index=True),
+        )
+    return CheckResult("sic_codes", SEVERITY_OK, f"sicCode は {summary}")
+
+
+# ======================
+# 実行
+# ======================
+def validate(
+    df: pd.DataFrame,
+    quirks: KnownQuirks = NO_QUIRKS,
+    population_tolerance: float = POPULATION_TOLERANCE,
+) -> list[CheckResult]:
+    hierarchy = build_area_hierarchy(df)
+    return [
+        check_population_reconciliation(df, hierarchy, population_tolerance, quirks),
+        check_duplicate_keys(df),
+        check_population_consistency(df, quirks),
+        check_sic_codes(df, quirks),
+    ]
+
+
+def validate_path(path: str, population_tolerance: float = POPULATION_TOLERANCE) -> list[CheckResult]:
+    # 既知の癖はファイル名で引く（差し替えたファイルが同じ名前なら、癖が変わっていないかも確かめることになる）
+    quirks = KNOWN_QUIRKS.get(os.path.basename(path), NO_QUIRKS)
+    return validate(read_raw(path), quirks, population_tolerance)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ベースデータの整合性チェック")
+    parser.add_argument("paths", nargs="*", help=f"既定は {DATA_GLOB}")
+    parser.add_argument("--details", type=int, default=5, help="問題のある行を何件まで表示するか")
+    parser.add_argument("--strict", action="store_true", help="警告でも終了コード 1")
+    parser.add_argument(
+        "--population-tolerance", type=float, default=POPULATION_TOLERANCE,
+        help="人口の突合で許す差（人）。超えればエラー",
+    )
+    args = parser.parse_args()
+
+    failed = False
+    t_all = time.perf_counter()
+    for path in args.paths or sorted(glob.glob(DATA_GLOB)):
+        t0 = time.perf_counter()
+        results = validate_path(path, args.population_tolerance)
+        print(f"{path} ({(time.perf_counter() - t0) * 1000:.0f} ms)")
+        for r in results:
+            print(f"  [{r.severity:<7}] {r.check:<22} {r.message}")
+            if r.details is not None and r.severity != SEVERITY_OK and args.details > 0:
+                print("    " + r.details.head(args.details).to_string().replace("\n", "\n    "))
+            failed |= r.severity == SEVERITY_ERROR or (args.strict and r.severity == SEVERITY_WARNING)
+    print(f"total {(time.perf_counter() - t_all) * 1000:.0f} ms")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
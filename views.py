@@ -0,0 +1,503 @@
+import streamlit as st
+import numpy as np
+import pandas as pd
+import altair as alt
+
+from engine import AREA_COL, COMPARE_PREFIX, NATIONAL_RANK_COL, PANEL_DENSITY, RANK_COL
+
+DISPLAY_COLS = [
+    "areaName",
+    "establishments",
+    "employees",
+    "population",
+    "est_density",
+    "emp_density",
+]
+
+JP_RENAME = {
+    "areaName": "地域名",
+    "establishments": "事業所数",
+    "employees": "従業者数",
+    "population": "人口",
+    "est_density": "事業所密度（人口1万人あたり）",
+    "emp_density": "雇用密度（人口1万人あたり）",
+}
+
+
+# ======================
+# ランキング表
+# ======================
+TABLE_RENDER_STYLER = "styler"  # 従来：pandas Styler でサーバー側が全セルを文字列化
+TABLE_RENDER_COLUMN_CONFIG = "column_config"  # 数値のまま送り、ブラウザ側で書式化
+
+RANK_COLS = [RANK_COL, NATIONAL_RANK_COL]
+
+# 見出しを短縮（2行で収まりよく）
+TABLE_LABELS = {
+    "事業所数": "事業所",
+    "従業者数": "従業者",
+    "事業所密度（人口1万人あたり）": "事業所\n密度",
+    "雇用密度（人口1万人あたり）": "雇用\n密度",
+    "est_dev": "事業所\n(県差)",
+    "emp_dev": "雇用\n(県差)",
+}
+
+STYLER_FORMATS = {
+    "事業所": "{:,.0f}",
+    "従業者": "{:,.0f}",
+    "人口": "{:,.0f}",
+    "事業所\n密度": "{:,.0f}",
+    "雇用\n密度": "{:,.0f}",
+    "事業所\n(県差)": "{:+,.0f}",
+    "雇用\n(県差)": "{:+,.0f}",
+}
+
+# STYLER_FORMATS と同じ表示を printf 形式で（st.column_config.NumberColumn 用）
+COLUMN_FORMATS = {
+    "事業所": "%,.0f",
+    "従業者": "%,.0f",
+    "人口": "%,.0f",
+    "事業所\n密度": "%,.0f",
+    "雇用\n密度": "%,.0f",
+    "事業所\n(県差)": "%+,.0f",
+    "雇用\n(県差)": "%+,.0f",
+}
+
+# 小数を含む列。表示は整数丸めなので column_config のときは float32 で送る
+FLOAT_TABLE_COLS = ["事業所\n密度", "雇用\n密度", "事業所\n(県差)", "雇用\n(県差)"]
+
+
+def table_view(df: pd.DataFrame) -> pd.DataFrame:
+    rank_cols = [c for c in RANK_COLS if c in df.columns]
+    view = df.loc[:, rank_cols + DISPLAY_COLS + ["est_dev", "emp_dev"]].rename(columns=JP_RENAME)
+    view = view.rename(columns=TABLE_LABELS)
+
+    # 念のため数値化
+    for c in ["事業所", "従業者", "人口"]:
+        if c in view.columns:
+            view[c] = pd.to_numeric(view[c], errors="coerce")
+    return view
+
+
+def format_table(df: pd.DataFrame):
+    return table_view(df).style.format(STYLER_FORMATS, na_rep="—")
+
+
+def table_column_config(with_formats: bool = True) -> dict:
+    config = {
+        "地域名": st.column_config.TextColumn(width="medium"),
+        "事業所": st.column_config.NumberColumn(width="small"),
+        "従業者": st.column_config.NumberColumn(width="small"),
+        "人口": st.column_config.NumberColumn(width="small"),
+        # 密度の列も一応small指定でコンパクトに
+    }
+    if with_formats:
+        for col, fmt in COLUMN_FORMATS.items():
+            width = "small" if col in config else None
+            config[col] = st.column_config.NumberColumn(width=width, format=fmt)
+    return config
+
+
+def table_payload(df: pd.DataFrame, mode: str = TABLE_RENDER_COLUMN_CONFIG):
+    """
+    st.dataframe に渡す (data, column_config)。column_config モードは数値のまま送ってブラウザ側で
+    書式化するので、Styler のような全セルの文字列化がなく、件数が多くても送信量・処理時間が小さい。
+    """
+    if mode == TABLE_RENDER_STYLER:
+        return format_table(df), table_column_config(with_formats=False)
+
+    data = table_view(df)
+    data = data.astype({c: np.float32 for c in FLOAT_TABLE_COLS if c in data.columns})
+    return data, table_column_config()
+
+
+def render_table(df: pd.DataFrame, mode: str = TABLE_RENDER_COLUMN_CONFIG):
+    data, column_config = table_payload(df, mode)
+    st.dataframe(
+        data,
+        width="stretch",
+        hide_index=True,
+        height=600,  # Fixed height for single page view
+        column_config=column_config,
+    )
+
+
+# ======================
+# 散布図
+# ======================
+SCATTER_MODE_AUTO = "auto"  # 点数が SCATTER_BIN_THRESHOLD を超えたら集計表示
+SCATTER_MODE_POINTS = "points"  # 常に全点
+SCATTER_MODE_BINNED = "binned"  # 常に集計（ヒートマップ）
+
+SCATTER_BIN_THRESHOLD = 1000
+SCATTER_BINS = 40
+# 集計の範囲はこの分位点まで。外れ値（都心部など）は点のまま重ねる
+SCATTER_BIN_QUANTILE = 0.99
+
+# チャートに送る列（エンコードとツールチップで使うものだけ）
+SCATTER_COLS = ["areaName", "population", "est_density", "emp_density", "est_dev", "emp_dev"]
+SCATTER_FLOAT_COLS = ["est_density", "emp_density", "est_dev", "emp_dev"]
+
+X_TITLE = "事業所密度（人口1万人あたり）"
+Y_TITLE = "雇用密度（人口1万人あたり）"
+
+
+def scatter_mode(n_points: int, mode: str = SCATTER_MODE_AUTO) -> str:
+    if mode == SCATTER_MODE_AUTO:
+        return SCATTER_MODE_BINNED if n_points > SCATTER_BIN_THRESHOLD else SCATTER_MODE_POINTS
+    return mode
+
+
+def scatter_frame(d: pd.DataFrame) -> pd.DataFrame:
+    """
+    散布図に埋め込む最小限のフレーム。密度は小数1桁に丸めて float32（表示は整数）。
+    """
+    out = d[[c for c in SCATTER_COLS if c in d.columns]]
+    out = out.astype({"areaName": str})
+    floats = [c for c in SCATTER_FLOAT_COLS if c in out.columns]
+    out[floats] = out[floats].round(1).astype(np.float32)
+    return out.reset_index(drop=True)
+
+
+def _bin_edges(v: np.ndarray, bins: int) -> np.ndarray:
+    lo, hi = v.min(), np.quantile(v, SCATTER_BIN_QUANTILE)
+    if hi <= lo:
+        hi = lo + 1.0
+    return np.linspace(lo, hi, bins + 1)
+
+
+def bin_scatter(d: pd.DataFrame, bins: int = SCATTER_BINS) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    密度の2次元ビンごとに地域数・人口を集計する。
+    戻り値は (ビン集計, 集計範囲の外の行)。
+    """
+    x = d["est_density"].to_numpy(np.float64)
+    y = d["emp_density"].to_numpy(np.float64)
+    x_edges, y_edges = _bin_edges(x, bins), _bin_edges(y, bins)
+
+    inside = (x <= x_edges[-1]) & (y <= y_edges[-1])
+    ix = np.clip(np.searchsorted(x_edges, x[inside], side="right") - 1, 0, bins - 1)
+    iy = np.clip(np.searchsorted(y_edges, y[inside], side="right") - 1, 0, bins - 1)
+
+    pop = d["population"].to_numpy(np.float64)[inside]
+    cell = pd.DataFrame({"ix": ix, "iy": iy, "population": pop})
+    cell = cell.groupby(["ix", "iy"], sort=False).agg(
+        count=("population", "size"), population=("population", "sum")
+    ).reset_index()
+
+    ix, iy = cell["ix"].to_numpy(), cell["iy"].to_numpy()
+    binned = pd.DataFrame({
+        "x0": x_edges[ix].astype(np.float32),
+        "x1": x_edges[ix + 1].astype(np.float32),
+        "y0": y_edges[iy].astype(np.float32),
+        "y1": y_edges[iy + 1].astype(np.float32),
+        "count": cell["count"].to_numpy(np.int32),
+        "population": cell["population"].to_numpy(np.int64),
+    })
+    return binned, d[~inside]
+
+
+def _points_layer(d: pd.DataFrame):
+    return alt.Chart(d).mark_circle(size=80, opacity=0.7).encode(
+        x=alt.X("est_density:Q", title=X_TITLE),
+        y=alt.Y("emp_density:Q", title=Y_TITLE),
+        size=alt.Size("population:Q", title="人口"),
+        color=alt.value("#3182ce"),  # Modern Blue
+        stroke=alt.value("white"),
+        strokeWidth=alt.value(1),
+        tooltip=[
+            alt.Tooltip("areaName:N", title="地域名"),
+            alt.Tooltip("population:Q", title="人口", format=",.0f"),
+            alt.Tooltip("est_density:Q", title="事業所密度", format=",.0f"),
+            alt.Tooltip("emp_density:Q", title="雇用密度", format=",.0f"),
+            alt.Tooltip("est_dev:Q", title="事業所密度(県差)", format="+,.0f"),
+            alt.Tooltip("emp_dev:Q", title="雇用密度(県差)", format="+,.0f"),
+        ],
+    )
+
+
+def _binned_layer(binned: pd.DataFrame):
+    return alt.Chart(binned).mark_rect().encode(
+        x=alt.X("x0:Q", title=X_TITLE),
+        x2="x1:Q",
+        y=alt.Y("y0:Q", title=Y_TITLE),
+        y2="y1:Q",
+        color=alt.Color("count:Q", title="地域数", scale=alt.Scale(scheme="blues")),
+        tooltip=[
+            alt.Tooltip("count:Q", title="地域数", format=",.0f"),
+            alt.Tooltip("population:Q", title="人口（合計）", format=",.0f"),
+            alt.Tooltip("x0:Q", title="事業所密度（下限）", format=",.0f"),
+            alt.Tooltip("x1:Q", title="事業所密度（上限）", format=",.0f"),
+            alt.Tooltip("y0:Q", title="雇用密度（下限）", format=",.0f"),
+            alt.Tooltip("y1:Q", title="雇用密度（上限）", format=",.0f"),
+        ],
+    )
+
+
+def make_scatter(
+    d: pd.DataFrame,
+    est_avg: float | None,
+    emp_avg: float | None,
+    mode: str = SCATTER_MODE_AUTO,
+):
+    """
+    事業所密度 × 雇用密度の散布図。点数が多いときはサーバー側でビン集計したヒートマップにし、
+    集計範囲の外の地域だけ点で重ねる（送るデータと描画するマーク数を抑える）。
+    """
+    d = scatter_frame(d)
+
+    if scatter_mode(len(d), mode) == SCATTER_MODE_BINNED:
+        binned, outliers = bin_scatter(d)
+        layers = [_binned_layer(binned)]
+        if len(outliers):
+            layers.append(_points_layer(outliers))
+    else:
+        layers = [_points_layer(d)]
+
+    # 県平均ライン（ある場合のみ）。データ行を持たない1本のルール
+    if est_avg is not None:
+        vline = alt.Chart(alt.Data(values=[{}])).mark_rule(
+            strokeDash=[4, 4], 
+            color="#e53e3e",  # Red for average
+            strokeWidth=2
+        ).encode(x=alt.datum(round(float(est_avg), 1)))
+        layers.append(vline)
+
+    if emp_avg is not None:
+        hline = alt.Chart(alt.Data(values=[{}])).mark_rule(
+            strokeDash=[4, 4], 
+            color="#e53e3e",
+            strokeWidth=2
+        ).encode(y=alt.datum(round(float(emp_avg), 1)))
+        layers.append(hline)
+
+    chart = alt.layer(*layers).properties(height=550).configure_view(
+        strokeWidth=0
+    ).configure_axis(
+        titleFontWeight="bold"
+    ).interactive()
+    return chart
+
+
+# ======================
+# 産業特化（特化係数）
+# ======================
+LQ_MEASURE_LABELS = {"employees": "従業者", "establishments": "事業所"}
+
+
+def make_lq_bars(profile: pd.DataFrame, measure: str):
+    """
+    1市区町村の産業別特化係数の横棒グラフ（1.0 の基準線つき、特化係数の降順）。
+    """
+    d = profile[["sicName", measure, "share", "lq"]].astype({"sicName": str})
+    d["lq"] = d["lq"].round(3).astype(np.float32)
+    d["share"] = d["share"].round(4).astype(np.float32)
+    label = LQ_MEASURE_LABELS.get(measure, measure)
+
+    bars = alt.Chart(d).mark_bar().encode(
+        x=alt.X("lq:Q", title="特化係数"),
+        y=alt.Y("sicName:N", title=None, sort=None),
+        color=alt.condition(alt.datum.lq >= 1, alt.value("#3182ce"), alt.value("#a0aec0")),
+        tooltip=[
+            alt.Tooltip("sicName:N", title="産業"),
+            alt.Tooltip(f"{measure}:Q", title=label, format=",.0f"),
+            alt.Tooltip("share:Q", title="構成比", format=".1%"),
+            alt.Tooltip("lq:Q", title="特化係数", format=".2f"),
+        ],
+    )
+    base_line = alt.Chart(alt.Data(values=[{}])).mark_rule(
+        strokeDash=[4, 4], color="#e53e3e", strokeWidth=2
+    ).encode(x=alt.datum(1.0))
+    return alt.layer(bars, base_line).properties(height=28 * len(d)).configure_axis(
+        titleFontWeight="bold"
+    )
+
+
+def render_lq_matrix(frame: pd.DataFrame, sic_names: list[str]):
+    """
+    地域 × 産業の特化係数の表（IndustryMatrix.lq_frame）。特化度の降順で送る。
+    """
+    view = frame.drop(columns="area").rename(columns={"areaName": "地域名", "specialization": "特化度"})
+    view = view.sort_values("特化度", ascending=False, ignore_index=True)
+    view = view.astype({c: np.float32 for c in ["特化度", *sic_names]})
+    column_config = {
+        "地域名": st.column_config.TextColumn(width="medium", pinned=True),
+        "特化度": st.column_config.NumberColumn(width="small", format="%.3f"),
+        **{c: st.column_config.NumberColumn(format="%.2f") for c in sic_names},
+    }
+    st.dataframe(
+        view,
+        width="stretch",
+        hide_index=True,
+        height=600,
+        column_config=column_config,
+    )
+
+
+# ======================
+# 都道府県比較
+# ======================
+def make_pref_chart(
+    table: pd.DataFrame,
+    metric_col: str,
+    label: str,
+    national_avg: float | None,
+    selected: str | None = None,
+):
+    """
+    都道府県ごとの加重平均（棒、降順）と、市区町村の密度の四分位範囲（線）・中央値（点）。
+    破線は全国の加重平均。選択中の都道府県は色を変える。
+    """
+    m = COMPARE_PREFIX[metric_col]
+    cols = [f"{m}_avg", f"{m}_p25", f"{m}_median", f"{m}_p75"]
+    d = table[["pref", "prefName", "n_areas", *cols]].astype({"prefName": str})
+    d[cols] = d[cols].round(1).astype(np.float32)
+    order = d.sort_values(f"{m}_avg", ascending=False)["prefName"].tolist()
+    x = alt.X("prefName:N", title=None, sort=order, axis=alt.Axis(labelAngle=-60))
+    tooltip = [
+        alt.Tooltip("prefName:N", title="都道府県"),
+        alt.Tooltip(f"{m}_avg:Q", title=f"{label}（加重平均）", format=",.1f"),
+        alt.Tooltip(f"{m}_median:Q", title="市区町村の中央値", format=",.1f"),
+        alt.Tooltip(f"{m}_p25:Q", title="25%点", format=",.1f"),
+        alt.Tooltip(f"{m}_p75:Q", title="75%点", format=",.1f"),
+        alt.Tooltip("n_areas:Q", title="地域数", format=","),
+    ]
+
+    base = alt.Chart(d).encode(x=x, tooltip=tooltip)
+    bars = base.mark_bar(opacity=0.8).encode(
+        y=alt.Y(f"{m}_avg:Q", title=f"{label}（人口1万人あたり）"),
+        color=alt.condition(alt.datum.pref == selected, alt.value("#dd6b20"), alt.value("#3182ce")),
+    )
+    spread = base.mark_rule(color="#2d3748").encode(y=f"{m}_p25:Q", y2=f"{m}_p75:Q")
+    median = base.mark_point(color="#2d3748", filled=True, size=20).encode(y=f"{m}_median:Q")
+    layers = [bars, spread, median]
+
+    if national_avg is not None:
+        layers.append(
+            alt.Chart(alt.Data(values=[{}])).mark_rule(
+                strokeDash=[4, 4], color="#e53e3e", strokeWidth=2
+            ).encode(y=alt.datum(round(float(national_avg), 1)))
+        )
+    return alt.layer(*layers).properties(height=420).configure_axis(titleFontWeight="bold")
+
+
+def render_pref_table(table: pd.DataFrame, metric_col: str, label: str):
+    """
+    都道府県比較の表（PrefComparison.table）。metric_col の加重平均の降順。
+    """
+    m = COMPARE_PREFIX[metric_col]
+    labels = {
+        "prefName": "都道府県",
+        "pop_sum": "人口",
+        f"{m}_avg": f"{label}\n(加重平均)",
+        "n_areas": "地域数",
+        f"{m}_median": "中央値",
+        f"{m}_p25": "25%点",
+        f"{m}_p75": "75%点",
+        f"{m}_std": "標準偏差",
+        f"{m}_cv": "変動係数",
+    }
+    view = table.sort_values(f"{m}_avg", ascending=False, ignore_index=True)[list(labels)].rename(columns=labels)
+    view.insert(0, RANK_COL, view.index + 1)
+    view = view.astype({c: np.float32 for c in list(labels.values())[2:] if c != "地域数"})
+    column_config = {
+        "都道府県": st.column_config.TextColumn(pinned=True),
+        "人口": st.column_config.NumberColumn(format="%,.0f"),
+        **{c: st.column_config.NumberColumn(format="%,.1f") for c in list(labels.values())[2:] if c not in ("地域数", "変動係数")},
+        "変動係数": st.column_config.NumberColumn(format="%.2f"),
+    }
+    st.dataframe(
+        view,
+        width="stretch",
+        hide_index=True,
+        height=600,
+        column_config=column_config,
+    )
+
+
+# ======================
+# 時系列（増減）
+# ======================
+GROWTH_KIND_LABELS = {
+    "rel": "対全国比",
+    "pct": "増減率",
+    "diff": "増減数",
+    "density": "密度の増減",
+}
+GROWTH_BARS = 20
+
+
+def growth_column(measure: str, kind: str) -> str:
+    """
+    IndustryPanel.changes の列のうち、並べ替えに使う列。
+    """
+    if kind == "density":
+        return f"{PANEL_DENSITY[measure]}_diff"
+    return f"{measure}_{kind}"
+
+
+def growth_ranking(changes: pd.DataFrame, sort_col: str) -> pd.DataFrame:
+    # 増減を計算できない地域（どちらかの年次にない・0 件）は末尾
+    return changes.sort_values(sort_col, ascending=False, na_position="last", kind="stable", ignore_index=True)
+
+
+def make_growth_bars(ranking: pd.DataFrame, sort_col: str, title: str):
+    """
+    増減の上位・下位 GROWTH_BARS 件の横棒グラフ（0 の基準線つき）。
+    """
+    d = ranking.dropna(subset=[sort_col])
+    d = pd.concat([d.head(GROWTH_BARS), d.tail(GROWTH_BARS)]).drop_duplicates(AREA_COL)
+    d = d[["areaName", sort_col]].astype({"areaName": str, sort_col: np.float32})
+    is_rate = sort_col.endswith(("_pct", "_rel"))
+
+    bars = alt.Chart(d).mark_bar().encode(
+        x=alt.X(f"{sort_col}:Q", title=title, axis=alt.Axis(format="+.0%" if is_rate else "+,.0f")),
+        y=alt.Y("areaName:N", title=None, sort=None),
+        color=alt.condition(alt.datum[sort_col] >= 0, alt.value("#3182ce"), alt.value("#e53e3e")),
+        tooltip=[
+            alt.Tooltip("areaName:N", title="地域"),
+            alt.Tooltip(f"{sort_col}:Q", title=title, format="+.1%" if is_rate else "+,.1f"),
+        ],
+    )
+    zero = alt.Chart(alt.Data(values=[{}])).mark_rule(color="#2d3748").encode(x=alt.datum(0))
+    return alt.layer(bars, zero).properties(height=18 * len(d)).configure_axis(titleFontWeight="bold")
+
+
+def render_growth_table(ranking: pd.DataFrame, measure: str, label: str, start: str, end: str):
+    """
+    増減ランキングの表（growth_ranking の順）。
+    """
+    density = PANEL_DENSITY[measure]
+    labels = {
+        "areaName": "地域名",
+        "population": "人口",
+        f"{measure}_start": f"{label}\n{start}",
+        f"{measure}_end": f"{label}\n{end}",
+        f"{measure}_diff": "増減数",
+        f"{measure}_pct": "増減率",
+        f"{measure}_rel": "対全国比",
+        f"{density}_start": f"密度\n{start}",
+        f"{density}_end": f"密度\n{end}",
+        f"{density}_diff": "密度の\n増減",
+    }
+    view = ranking[list(labels)].rename(columns=labels)
+    view.insert(0, RANK_COL, view.index + 1)
+    view = view.astype({c: np.float32 for c in list(labels.values())[2:]})
+    # 率は % 表示のため 100 倍して送る
+    view[["増減率", "対全国比"]] *= 100
+    column_config = {
+        "地域名": st.column_config.TextColumn(pinned=True),
+        **{c: st.column_config.NumberColumn(format="%,.0f") for c in list(labels.values())[1:4]},
+        "増減数": st.column_config.NumberColumn(format="%+,.0f"),
+        "増減率": st.column_config.NumberColumn(format="%+.1f%%"),
+        "対全国比": st.column_config.NumberColumn(format="%+.1f%%"),
+        "密度の\n増減": st.column_config.NumberColumn(format="%+,.1f"),
+        **{c: st.column_config.NumberColumn(format="%,.1f") for c in list(labels.values())[7:9]},
+    }
+    st.dataframe(
+        view,
+        width="stretch",
+        hide_index=True,
+        height=600,
+        column_config=column_config,
+    )